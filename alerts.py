@@ -0,0 +1,140 @@
+import os
+import time
+
+import metrics
+
+ALERT_DIGEST = float(os.getenv('ALERT_DIGEST', 1800))
+
+ALERTS = metrics.Counter(
+    'bot_alerts_total', 'Сообщения о сбоях опроса по видам')
+SUPPRESSED = metrics.Counter(
+    'bot_alerts_suppressed_total', 'Ошибки опроса без отдельного сообщения')
+
+
+def fingerprint(error):
+    """Вид ошибки: класс исключения, текст может меняться от раза к разу."""
+    return type(error).__name__
+
+
+def describe(error):
+    """Текст ошибки: txt исключений бота, для остальных — str()."""
+    return getattr(error, 'txt', None) or str(error)
+
+
+def duration(seconds):
+    """Длительность сбоя для сообщения."""
+    if seconds < 60:
+        return f'{int(seconds)} с'
+    return f'{round(seconds / 60)} мин'
+
+
+class Outage:
+    """Сбой опроса в чате: начало, последнее сообщение и счетчики."""
+
+    __slots__ = ('since', 'alerted', 'failures', 'kinds', 'failing', 'text')
+
+    def __init__(self, since):
+        """Сбой, начавшийся в since."""
+        self.since = since
+        self.alerted = since
+        self.failures = 0
+        self.kinds = {}
+        self.failing = set()
+        self.text = ''
+
+
+class Alerts:
+    """Сообщения о сбоях опроса без лавины одинаковых уведомлений.
+
+    Ошибки различаются по классу исключения. О первой ошибке каждого
+    вида за время сбоя чат узнает сразу, повторы копятся и уходят
+    сводкой не чаще раза в interval секунд. Когда все подписки чата
+    снова опрашиваются успешно, приходит одно сообщение о
+    восстановлении. Последняя ошибка подписки хранится в состоянии,
+    поэтому после перезапуска идущий сбой не объявляется заново.
+    """
+
+    def __init__(self, state, interval=ALERT_DIGEST, clock=time.monotonic):
+        """Хранилище состояния, период сводок и часы."""
+        self.state = state
+        self.interval = interval
+        self.clock = clock
+        self.outages = {}
+
+    def open(self, subscription, kind):
+        """Сбой в чате подписки; новый или уже идущий."""
+        chat = str(subscription.chat_id)
+        outage = self.outages.get(chat)
+        if outage is None:
+            outage = self.outages[chat] = Outage(self.clock())
+            if self.state.messages.get(subscription.uid):
+                outage.kinds[kind] = 0
+        return outage
+
+    def failure(self, subscription, error):
+        """Сообщение о неудачном опросе или None, если оно подавлено."""
+        kind = fingerprint(error)
+        outage = self.open(subscription, kind)
+        outage.failing.add(subscription.uid)
+        outage.failures += 1
+        new = kind not in outage.kinds
+        outage.kinds[kind] = outage.kinds.get(kind, 0) + 1
+        text = outage.text = describe(error)
+        self.state.set_message(subscription.uid, text)
+        now = self.clock()
+        if new:
+            message = text
+        elif now - outage.alerted >= self.interval:
+            message = self.digest(outage, now)
+            kind = 'digest'
+        else:
+            SUPPRESSED.inc()
+            return None
+        outage.alerted = now
+        ALERTS.inc(kind=kind)
+        return message
+
+    def digest(self, outage, now):
+        """Сводка по идущему сбою."""
+        kinds = ', '.join(
+            f'{kind}: {count}' for kind, count in outage.kinds.items()
+            if count)
+        return (
+            f'Сбой опроса API продолжается {duration(now - outage.since)}, '
+            f'неудачных опросов: {outage.failures} ({kinds}). '
+            f'Последняя ошибка: {outage.text}'
+        )
+
+    def recovered(self, subscription):
+        """Сообщение о восстановлении, если подписка завершила сбой чата."""
+        uid = subscription.uid
+        failed = bool(self.state.messages.get(uid))
+        self.state.set_message(uid, '')
+        chat = str(subscription.chat_id)
+        outage = self.outages.get(chat)
+        if outage is None:
+            if not failed:
+                return None
+            message = 'Опрос API восстановлен'
+        else:
+            outage.failing.discard(uid)
+            if outage.failing:
+                return None
+            del self.outages[chat]
+            message = (
+                'Опрос API восстановлен: сбой длился '
+                f'{duration(self.clock() - outage.since)}, '
+                f'неудачных опросов: {outage.failures}'
+            )
+        ALERTS.inc(kind='recovery')
+        return message
+
+    def forget(self, subscription):
+        """Подписка удалена: сбой чата держится только на остальных."""
+        chat = str(subscription.chat_id)
+        outage = self.outages.get(chat)
+        if outage is None:
+            return
+        outage.failing.discard(subscription.uid)
+        if not outage.failing:
+            del self.outages[chat]
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+import engine
+import homework
+import logs
+import metrics
+import stand
+import threaded
+import transport
+from ratelimit import KeyedLimiter, TokenBucket
+from scheduler import IntervalPolicy, PollScheduler
+from state import MemoryState
+from subscriptions import Subscription, SubscriptionRegistry
+
+RESULTS_DIR = 'bench-results'
+COMPARED = (
+    'polls_per_sec', 'notifications_per_sec', 'latency_p50', 'latency_p99',
+    'cpu_percent', 'max_rss_mb'
+)
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу; None для пустого списка."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def version():
+    """Короткий хеш коммита, если это git-репозиторий."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def stage_stats():
+    """Среднее время и количество вызовов по стадиям из metrics."""
+    stages = {}
+    for key, (_, total, count) in metrics.STAGE_SECONDS.values.items():
+        stage = dict(key)['stage']
+        stages[stage] = {'count': count, 'mean': total / count}
+    return stages
+
+
+def make_engine(args):
+    """Движок с подписками стенда и параметрами замера."""
+    interval = args.interval
+    poller = engine.PollEngine(
+        'bench',
+        reload_interval=args.duration + 60,
+        state=MemoryState(),
+        policy=IntervalPolicy(interval, interval, interval, args.jitter),
+        scheduler=PollScheduler(budget=args.budget),
+        commands=False,
+    )
+    poller.api_limiter = TokenBucket(args.api_rate)
+    poller.outbox.limiter = TokenBucket(args.telegram_rate)
+    poller.outbox.chat_limiter = KeyedLimiter(args.chat_rate, capacity=3)
+    poller.outbox.window = args.window
+    return poller
+
+
+def make_poller(args, url):
+    """Многопоточный опрос с подписками стенда и параметрами замера."""
+    interval = args.interval
+    bot = transport.telegram_bot('123:bench', args.threads, f'{url}/bot')
+    poller = threaded.ThreadedPoller(
+        bot,
+        workers=args.threads,
+        reload_interval=args.duration + 60,
+        policy=IntervalPolicy(interval, interval, interval, args.jitter),
+        scheduler=PollScheduler(budget=args.budget),
+    )
+    poller.limiter = TokenBucket(args.telegram_rate)
+    poller.chat_limiter = KeyedLimiter(args.chat_rate, capacity=3)
+    return poller
+
+
+def make_registry(args):
+    """Реестр из args.subscriptions подписок стенда."""
+    registry = SubscriptionRegistry(
+        os.path.join(tempfile.gettempdir(), 'bench-missing.jsonl'))
+    for number in range(args.subscriptions):
+        registry.add(Subscription(f'bench-{number}', number))
+    return registry
+
+
+def summarize(args, elapsed, cpu, stats):
+    """Результат замера по счетчикам стенда."""
+    counters = stats['counters']
+    latencies = stats['latencies']
+    return {
+        'version': version(),
+        'timestamp': int(time.time()),
+        'params': vars(args),
+        'duration': elapsed,
+        'counters': counters,
+        'polls_per_sec': counters.get('polls', 0) / elapsed,
+        'notifications_per_sec': counters.get('notifications', 0) / elapsed,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies, default=None),
+        'latency_count': len(latencies),
+        'cpu_seconds': cpu,
+        'cpu_percent': 100 * cpu / elapsed,
+        'max_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': stage_stats(),
+    }
+
+
+async def drive(args, url):
+    """Гоняем движок против стенда url и собираем результаты."""
+    homework.ENDPOINT = f'{url}{stand.API_PATH}'
+    engine.TELEGRAM_API = url
+    registry = make_registry(args)
+    poller = make_engine(args)
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    task = asyncio.ensure_future(poller.run(registry))
+    await asyncio.sleep(args.duration)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'{url}/_stats') as response:
+            stats = await response.json()
+    return summarize(args, elapsed, cpu, stats)
+
+
+def drive_threads(args, url):
+    """Гоняем многопоточный опрос против стенда url."""
+    homework.ENDPOINT = f'{url}{stand.API_PATH}'
+    transport.close_session()
+    transport.open_session(args.threads)
+    poller = make_poller(args, url)
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    thread = threading.Thread(target=poller.run, args=(make_registry(args),))
+    thread.start()
+    time.sleep(args.duration)
+    poller.stop_polling()
+    thread.join()
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    try:
+        stats = transport.get(url=f'{url}/_stats').json()
+    finally:
+        transport.close_session()
+    return summarize(args, elapsed, cpu, stats)
+
+
+def benchmark(args):
+    """Запускаем стенд в отдельном процессе и замеряем бота.
+
+    Стенд работает в своем процессе, поэтому CPU и память в результатах
+    относятся только к боту.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=stand.run, args=(stand.stand_options(args),),
+        kwargs={'ready': sender}, daemon=True)
+    process.start()
+    try:
+        url = receiver.recv()
+        if args.threads:
+            return drive_threads(args, url)
+        return asyncio.run(drive(args, url))
+    finally:
+        process.terminate()
+        process.join()
+
+
+def save(result, path=None):
+    """Сохраняем результат в JSON, возвращаем путь."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(
+            RESULTS_DIR, f'{result["timestamp"]}-{result["version"]}.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(old, new):
+    """Строки сравнения двух результатов по основным показателям."""
+    lines = []
+    for name in COMPARED:
+        before, after = old.get(name), new.get(name)
+        if before is None or after is None:
+            lines.append(f'{name}: {before} -> {after}')
+            continue
+        change = (after - before) / before * 100 if before else 0
+        lines.append(f'{name}: {before:.4g} -> {after:.4g} ({change:+.1f}%)')
+    return lines
+
+
+def parse_args(argv=None):
+    """Параметры замера."""
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный замер бота против локального стенда')
+    parser.add_argument('-n', '--subscriptions', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--interval', type=float, default=1,
+                        help='интервал опроса подписки, секунды')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--budget', type=float, default=0)
+    parser.add_argument('--api-rate', type=float, default=0)
+    parser.add_argument('--telegram-rate', type=float, default=0)
+    parser.add_argument('--chat-rate', type=float, default=0)
+    parser.add_argument('--window', type=float, default=0)
+    parser.add_argument('--threads', type=int, default=0,
+                        help='размер пула потоков синхронного режима '
+                             '(0 — асинхронный движок)')
+    parser.add_argument('--output', help='файл результата JSON')
+    parser.add_argument('--compare', help='прошлый результат для сравнения')
+    parser.add_argument('--log-level', default='CRITICAL')
+    stand.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Замер, сохранение и сравнение с прошлым результатом."""
+    args = parse_args(argv)
+    logs.setup_logging(level=args.log_level)
+    result = benchmark(args)
+    path = save(result, args.output)
+    print(json.dumps(
+        {name: result[name] for name in COMPARED}, indent=2))
+    print(f'Результат сохранен в {path}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = json.load(file)
+        print('\n'.join(compare(previous, result)))
+
+
+if __name__ == '__main__':
+    main()
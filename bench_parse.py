@@ -0,0 +1,158 @@
+import argparse
+import json
+import logging
+import random
+import timeit
+
+import exceptions
+import homework
+import metrics
+from status_index import StatusIndex
+
+STATUSES = ('reviewing', 'rejected', 'approved')
+
+
+def make_homeworks(count, payload=0):
+    """Ответ API с count работами."""
+    return [
+        {
+            'id': number,
+            'homework_name': f'hw{number}',
+            'status': random.choice(STATUSES),
+            'lesson_name': 'Замер',
+            'reviewer_comment': 'x' * payload,
+            'date_updated': '2022-01-01T00:00:00Z',
+        }
+        for number in range(count)
+    ]
+
+
+def homework_key(item):
+    """Ключ работы-словаря: id, а при его отсутствии название."""
+    return item.get('id', item.get('homework_name'))
+
+
+def make_index(uid, homeworks, changed):
+    """Индекс, в котором известны статусы доли 1 - changed работ."""
+    index = StatusIndex(finished_limit=len(homeworks))
+    for item in homeworks:
+        if random.random() >= changed:
+            index.set((uid, homework_key(item)), item['status'])
+    return index
+
+
+def changed_items(index, uid, homeworks):
+    """Работы-словари, чей статус отличается от известного.
+
+    Некорректные записи тоже возвращаются: их отбракует parse_status.
+    """
+    changed = []
+    for item in homeworks:
+        if isinstance(item, dict):
+            known = index.status((uid, homework_key(item)))
+            if known is not None and known == item.get('status'):
+                continue
+        changed.append(item)
+    return changed
+
+
+@metrics.timed('check_response')
+def legacy_check_response(response):
+    """Прежняя проверка ответа API, оставленная для сравнения."""
+    logging.debug('Проверяем ответ от API')
+    if not isinstance(response, dict):
+        raise TypeError(
+            f'Ответ пришел не в виде словаря. Type: {type(response)}'
+        )
+    if 'homeworks' not in response:
+        raise exceptions.MyResponseError(
+            f'Нет ключа homeworks: {response.keys()}'
+        )
+    response_list = response['homeworks']
+    if not isinstance(response_list, list):
+        raise exceptions.MyResponseError(
+            f'По ключу homeworks возвращается не список. '
+            f'Type: {type(response_list)}'
+        )
+    return response_list
+
+
+@metrics.timed('parse_status')
+def legacy_parse_status(item):
+    """Прежний разбор работы-словаря, оставленный для сравнения."""
+    logging.debug('Пробуем получить ответ по ключу для отправки сообщения')
+    if not isinstance(item, dict):
+        raise TypeError(
+            f'Ответ пришел не в виде словаря. Type: {type(item)}'
+        )
+    if 'homework_name' not in item:
+        raise KeyError(
+            f'Ключ homework_name не найден: {item}'
+        )
+    if 'status' not in item:
+        raise KeyError(
+            f'Ключ status не найден: {item}'
+        )
+    homework_name = item.get('homework_name')
+    homework_status = item.get('status')
+    if homework_status not in homework.HOMEWORK_STATUSES:
+        raise exceptions.StatusError(
+            f'Нет документированного статуса: {homework_status}. '
+            f'{homework.HOMEWORK_STATUSES.keys()}'
+        )
+    verdict = homework.HOMEWORK_STATUSES[homework_status]
+    return f'Изменился статус проверки работы "{homework_name}". {verdict}'
+
+
+def per_item(response, index, uid):
+    """Прежний путь: поиск изменений по словарям и parse_status."""
+    homeworks = legacy_check_response(response)
+    return [
+        legacy_parse_status(item)
+        for item in changed_items(index, uid, homeworks)
+    ]
+
+
+def single_pass(response, index, uid):
+    """Текущий путь: один проход проверки и записи Homework."""
+    records = homework.parse_homeworks(homework.check_response(response))
+    return [
+        homework.status_message(record)
+        for record in index.changed_records(uid, records)
+    ]
+
+
+def measure(func, response, index, uid, number):
+    """Среднее время на одну работу в наносекундах."""
+    seconds = min(timeit.repeat(
+        lambda: func(response, index, uid), number=number, repeat=5))
+    return seconds / number / len(response['homeworks']) * 1e9
+
+
+def main(argv=None):
+    """Сравниваем стоимость разбора одной работы."""
+    parser = argparse.ArgumentParser(
+        description='Микрозамер проверки ответа и разбора работ')
+    parser.add_argument('--homeworks', type=int, default=1000)
+    parser.add_argument('--changed', type=float, default=0.1,
+                        help='доля работ с новым статусом')
+    parser.add_argument('--payload', type=int, default=100)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    uid = 'bench'
+    response = {'homeworks': make_homeworks(args.homeworks, args.payload)}
+    index = make_index(uid, response['homeworks'], args.changed)
+    assert per_item(response, index, uid) == single_pass(
+        response, index, uid)
+    result = {
+        name: round(measure(func, response, index, uid, args.number), 1)
+        for name, func in (('per_item', per_item),
+                           ('single_pass', single_pass))
+    }
+    print(json.dumps({'ns_per_homework': result, 'params': vars(args)}))
+
+
+if __name__ == '__main__':
+    main()
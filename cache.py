@@ -0,0 +1,120 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 100000))
+CURRENT_DATE_RE = re.compile(rb'"current_date"\s*:\s*(\d+)')
+
+CacheEntry = namedtuple('CacheEntry', ('etag', 'last_modified', 'digest'))
+
+
+def body_digest(body):
+    """Хеш тела без current_date и само значение current_date.
+
+    current_date меняется в каждом ответе, поэтому в хеш не входит:
+    одинаковые списки работ дают одинаковый хеш.
+    """
+    match = CURRENT_DATE_RE.search(body)
+    current_date = int(match.group(1)) if match else None
+    stripped = CURRENT_DATE_RE.sub(b'', body)
+    return hashlib.blake2b(stripped, digest_size=16).digest(), current_date
+
+
+class ResponseCache:
+    """Кеш последних ответов API по подпискам.
+
+    Для каждой подписки хранятся ETag, Last-Modified и хеш тела
+    последнего ответа, который был успешно обработан. Новый ответ
+    сначала запоминается как ожидающий и становится известным только
+    после confirm(): ответ, обработка которого упала, не будет
+    пропущен при следующем опросе. Кешем можно пользоваться из
+    нескольких потоков.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        """Кеш на size подписок с LRU-вытеснением."""
+        self.size = size
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Количество подписок в кеше."""
+        return len(self.entries)
+
+    def headers(self, key):
+        """Заголовки условного запроса для подписки."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def not_modified(self, key):
+        """Ответ 304: работы не изменились; None, если ответа нет в кеше."""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.pending.pop(key, None)
+            self.entries.move_to_end(key)
+        return {'homeworks': []}
+
+    def check(self, key, headers, body):
+        """Сравниваем тело с последним обработанным ответом.
+
+        Если работы те же, возвращаем ответ без работ — их статусы уже
+        учтены; иначе запоминаем ответ как ожидающий и возвращаем None.
+        """
+        if key is None or not self.size:
+            return None
+        digest, current_date = body_digest(body)
+        with self.lock:
+            entry = self.entries.get(key)
+            hit = entry is not None and entry.digest == digest
+            if hit:
+                self.pending.pop(key, None)
+                self.entries.move_to_end(key)
+        if hit:
+            response = {'homeworks': []}
+            if current_date is not None:
+                response['current_date'] = current_date
+            return response
+        self.remember(key, headers, digest)
+        return None
+
+    def remember(self, key, headers, digest=None):
+        """Запоминаем ответ как ожидающий подтверждения.
+
+        Без хеша тела (ответ разбирался по частям) сохраняются только
+        ETag и Last-Modified.
+        """
+        if key is None or not self.size:
+            return
+        entry = CacheEntry(
+            headers.get('ETag'), headers.get('Last-Modified'), digest)
+        with self.lock:
+            self.pending[key] = entry
+
+    def confirm(self, key):
+        """Ответ подписки обработан успешно: запоминаем его."""
+        with self.lock:
+            entry = self.pending.pop(key, None)
+            if entry is None:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def forget(self, key):
+        """Удаляем подписку из кеша."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.pending.pop(key, None)
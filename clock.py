@@ -0,0 +1,53 @@
+import time
+
+
+class SystemClock:
+    """Настоящие часы: время эпохи, монотонное время и сон."""
+
+    def time(self):
+        """Время эпохи в секундах."""
+        return time.time()
+
+    def monotonic(self):
+        """Монотонное время в секундах."""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Сон с блокировкой потока."""
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """Виртуальные часы для тестов и симуляции.
+
+    sleep() и advance() сдвигают время мгновенно. time() и monotonic()
+    возвращают одно и то же значение, поэтому компоненты с параметром
+    clock= (планировщик, размыкатель, корзины токенов) видят одно время.
+    """
+
+    def __init__(self, start=0.0):
+        """Начальный момент в секундах."""
+        self.now = start
+
+    def time(self):
+        """Текущее виртуальное время."""
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        """Сон без ожидания: часы просто уходят вперед."""
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        """Сдвигаем часы на seconds секунд."""
+        if seconds > 0:
+            self.now += seconds
+
+    def advance_to(self, moment):
+        """Сдвигаем часы к моменту, если он еще не наступил."""
+        if moment > self.now:
+            self.now = moment
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import sqlite3
+
+import exceptions
+import homework
+from ratelimit import Backoff
+from subscriptions import Subscription
+
+COMMANDS_ENABLED = os.getenv('TELEGRAM_COMMANDS', '1') == '1'
+UPDATES_TIMEOUT = int(os.getenv('TELEGRAM_UPDATES_TIMEOUT', 30))
+UPDATES_CURSOR = 'telegram_updates'
+HELP = (
+    'Команды:\n'
+    '/status — статусы работ на проверке\n'
+    '/subscribe <токен Практикума> — следить за работами в этом чате\n'
+    '/unsubscribe — перестать следить'
+)
+
+
+def status_reply(engine, chat_id):
+    """Статусы незавершенных работ подписок чата в движке или None."""
+    subscriptions = engine.chat_subscriptions(chat_id)
+    if not subscriptions:
+        return None
+    state = engine.state
+    lines = []
+    for subscription in subscriptions:
+        uid = subscription.uid
+        names = state.names.get(uid, {})
+        for key, status in state.index.active.get(uid, {}).items():
+            name = names.get(key, key)
+            lines.append(f'{name}: {homework.HOMEWORK_STATUSES[status]}')
+    if lines:
+        return 'Работы на проверке:\n' + '\n'.join(sorted(lines))
+    return 'Работ на проверке нет.'
+
+
+def parse_command(text):
+    """Команда и аргументы из текста сообщения или None."""
+    if not text or not text.startswith('/'):
+        return None
+    command, _, args = text.partition(' ')
+    return command.split('@', 1)[0].lower(), args.strip()
+
+
+class Commands:
+    """Команды пользователей из getUpdates, работающие рядом с опросом.
+
+    Ответы строятся только из состояния движка, без запросов к API, и
+    уходят через очередь исходящих: пачка одинаковых команд одного чата
+    склеивается в одно сообщение и не нарушает лимиты Telegram.
+    """
+
+    def __init__(self, engine, registry, fetch_updates,
+                 timeout=UPDATES_TIMEOUT):
+        """Движок, реестр подписок и функция получения обновлений."""
+        self.engine = engine
+        self.registry = registry
+        self.fetch_updates = fetch_updates
+        self.timeout = timeout
+        self.backoff = Backoff(base=1, maximum=60)
+        self.handlers = {
+            '/start': self.help,
+            '/help': self.help,
+            '/status': self.status,
+            '/subscribe': self.subscribe,
+            '/unsubscribe': self.unsubscribe,
+        }
+
+    def help(self, chat_id, args):
+        """Список команд."""
+        return HELP
+
+    def status(self, chat_id, args):
+        """Статусы незавершенных работ всех подписок чата.
+
+        О подписках, которые опрашивают другие воркеры пула, отвечают
+        их владельцы отдельным сообщением.
+        """
+        forwarded = self.registry.forward_status(chat_id)
+        reply = status_reply(self.engine, chat_id)
+        if reply is not None:
+            return reply
+        if forwarded:
+            return 'Статусы работ придут отдельным сообщением.'
+        return 'Чат не подписан. ' + HELP
+
+    def subscribe(self, chat_id, args):
+        """Подписываем чат на работы по токену."""
+        if not args:
+            return 'Укажите токен: /subscribe <токен Практикума>'
+        subscription = Subscription(args, chat_id)
+        if not self.registry.subscribe(subscription):
+            return 'Подписка уже есть.'
+        if self.registry.claim(subscription):
+            self.engine.start(subscription)
+        logging.info('Новая подписка из Telegram: %r', subscription)
+        return ('Подписка оформлена. Удалите сообщение с токеном из '
+                'истории чата.')
+
+    def unsubscribe(self, chat_id, args):
+        """Отписываем чат."""
+        removed = self.registry.unsubscribe(chat_id)
+        for subscription in removed:
+            self.engine.stop(subscription)
+        if not removed:
+            return 'Чат не подписан.'
+        return 'Подписка отменена.'
+
+    def handle(self, message):
+        """Ответ на одно сообщение или None."""
+        command = parse_command(message.get('text'))
+        if command is None:
+            return None
+        handler = self.handlers.get(command[0])
+        if handler is None:
+            return 'Неизвестная команда. ' + HELP
+        return handler(message['chat']['id'], command[1])
+
+    def reply(self, message):
+        """Ставим в очередь ответ на одно сообщение."""
+        if not isinstance(message, dict):
+            return
+        chat = message.get('chat')
+        if not isinstance(chat, dict) or 'id' not in chat:
+            return
+        try:
+            reply = self.handle(message)
+        except (OSError, sqlite3.Error) as error:
+            logging.error('Не удалось сохранить подписки: %s', error)
+            reply = 'Не удалось сохранить подписку, попробуйте позже.'
+        if reply:
+            self.engine.state.enqueue(chat['id'], reply)
+            self.engine.outbox.submit(chat['id'], 0)
+
+    def process(self, updates):
+        """Обрабатываем пачку обновлений, возвращаем следующий offset.
+
+        Сбой на одном обновлении не мешает ответить на остальные.
+        """
+        offset = None
+        for update in updates:
+            try:
+                offset = update['update_id'] + 1
+                self.reply(update.get('message'))
+            except Exception:
+                logging.exception('Не удалось обработать обновление Telegram')
+        if offset is not None:
+            self.engine.state.set_cursor(UPDATES_CURSOR, offset)
+        return offset
+
+    async def run(self, session):
+        """Долгий опрос getUpdates; ошибки не останавливают движок."""
+        failures = 0
+        while True:
+            offset = self.engine.state.cursors.get(UPDATES_CURSOR)
+            try:
+                self.process(await self.fetch_updates(
+                    session, self.engine.bot_token, offset, self.timeout))
+            except exceptions.UpdatesError as error:
+                logging.error(error.txt)
+                retry_after = error.retry_after
+            except Exception:
+                logging.exception('Сбой обработки команд из Telegram')
+                retry_after = None
+            else:
+                failures = 0
+                continue
+            failures += 1
+            await asyncio.sleep(self.backoff.delay(failures, retry_after))
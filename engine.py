@@ -0,0 +1,454 @@
+import asyncio
+import logging
+import os
+from http import HTTPStatus
+
+import aiohttp
+
+import exceptions
+import homework
+import logs
+import metrics
+import sharding
+import traffic
+import transport
+from alerts import Alerts
+from clock import SYSTEM_CLOCK
+from commands import COMMANDS_ENABLED, Commands, status_reply
+from health import HEALTH, POLL_TIMEOUT, STUCK_POLLS, WATCHDOG_INTERVAL
+from history import HISTORY
+from outbox import Outbox
+from ratelimit import API_RATE, Backoff, CircuitBreaker, TokenBucket
+from scheduler import POLL_BUDGET, IntervalPolicy, PollScheduler
+from singleflight import SingleFlight, TokenGroups, TokenRequest
+from state import MemoryState, load_state
+
+TELEGRAM_API = 'https://api.telegram.org'
+RELOAD_INTERVAL = int(os.getenv('RELOAD_INTERVAL', 30))
+
+
+def poll_budget(budget=POLL_BUDGET, api_rate=API_RATE):
+    """Опросов в секунду не больше лимита запросов к API; 0 — без лимита."""
+    return min((rate for rate in (budget, api_rate) if rate), default=0)
+
+
+@metrics.timed('get_api_answer')
+async def fetch_api_answer(session, subscription, current_timestamp):
+    """Неблокирующий запрос к API для одной подписки."""
+    key = subscription.key
+    request = homework.build_api_request(
+        current_timestamp, subscription.headers, key)
+    try:
+        async with session.get(**request) as response:
+            cached = homework.not_modified(response.status, key)
+            if cached is not None:
+                return cached
+            homework.check_api_status(response.status, response)
+            if not homework.should_stream(response.content_length):
+                return homework.decode_body(
+                    key, response.headers, await response.read())
+            homework.RESPONSE_CACHE.remember(key, response.headers)
+            stream = homework.ResponseStream()
+            async for chunk in response.content.iter_chunked(
+                    homework.STREAM_CHUNK):
+                stream.feed(chunk)
+            return stream.result()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        raise exceptions.ApiNoAnswerError(
+            f'Ошибка ответа API. Возможно проблема с {homework.ENDPOINT}'
+        )
+
+
+def telegram_retry_after(data):
+    """Пауза retry_after из ответа Telegram или None, если ее нет."""
+    parameters = data.get('parameters') if isinstance(data, dict) else None
+    if not isinstance(parameters, dict):
+        return None
+    value = parameters.get('retry_after')
+    return value if isinstance(value, (int, float)) else None
+
+
+@metrics.timed('send_message')
+async def send_telegram(session, bot_token, chat_id, message):
+    """Неблокирующая отправка сообщения через Bot API."""
+    url = f'{TELEGRAM_API}/bot{bot_token}/sendMessage'
+    try:
+        async with session.post(
+            url, json={'chat_id': chat_id, 'text': message}
+        ) as response:
+            if response.status == HTTPStatus.TOO_MANY_REQUESTS:
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = None
+                raise exceptions.SendRateLimitError(
+                    'Превышен лимит отправки в Telegram',
+                    telegram_retry_after(data)
+                    or homework.retry_after(response))
+            if response.status != HTTPStatus.OK:
+                raise exceptions.SendMessageError(
+                    f'Ошибка отправки сообщения в Telegram. '
+                    f'Код ответа {response.status}'
+                )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        raise exceptions.SendMessageError(
+            f'Ошибка отправки сообщения в Telegram. {error}')
+
+
+async def get_updates(session, bot_token, offset, timeout):
+    """Долгий опрос getUpdates: новые сообщения боту."""
+    url = f'{TELEGRAM_API}/bot{bot_token}/getUpdates'
+    payload = {
+        'offset': offset, 'timeout': timeout, 'allowed_updates': ['message']
+    }
+    try:
+        async with session.post(
+            url, json=payload,
+            timeout=aiohttp.ClientTimeout(sock_read=timeout + 10)
+        ) as response:
+            data = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+        raise exceptions.UpdatesError(
+            f'Ошибка получения обновлений из Telegram. {error}')
+    ok = isinstance(data, dict) and data.get('ok')
+    if response.status != HTTPStatus.OK or not ok:
+        raise exceptions.UpdatesError(
+            f'Ошибка получения обновлений из Telegram. '
+            f'Код ответа {response.status}',
+            telegram_retry_after(data))
+    result = data.get('result')
+    if not isinstance(result, list):
+        raise exceptions.UpdatesError(
+            f'Обновления из Telegram пришли не списком: {type(result)}')
+    return result
+
+
+class PollEngine:
+    """Опрос API для множества подписок в одном event loop."""
+
+    def __init__(self, bot_token, fetch=fetch_api_answer, send=send_telegram,
+                 reload_interval=RELOAD_INTERVAL, state=None, policy=None,
+                 scheduler=None, updates=get_updates,
+                 commands=COMMANDS_ENABLED, health=None,
+                 poll_timeout=POLL_TIMEOUT,
+                 watchdog_interval=WATCHDOG_INTERVAL, clock=SYSTEM_CLOCK):
+        """Настройки движка, стадии ввода-вывода и часы."""
+        self.clock = clock
+        self.bot_token = bot_token
+        self.fetch = fetch
+        self.send = send
+        self.reload_interval = reload_interval
+        self.state = state if state is not None else MemoryState()
+        self.policy = (
+            policy if policy is not None
+            else IntervalPolicy(default=homework.RETRY_TIME))
+        self.scheduler = (
+            scheduler if scheduler is not None
+            else PollScheduler(poll_budget(), clock=clock.monotonic))
+        self.api_limiter = TokenBucket(API_RATE, clock=clock.monotonic)
+        self.breaker = CircuitBreaker(clock=clock.monotonic)
+        self.backoff = Backoff()
+        self.failures = {}
+        self.outbox = Outbox(self.state, send, bot_token)
+        self.alerts = Alerts(self.state, clock=clock.monotonic)
+        self.updates = updates
+        self.commands = commands
+        self.subscriptions = {}
+        self.chats = {}
+        self.tasks = {}
+        self.tokens = TokenGroups()
+        self.flights = SingleFlight()
+        self.wakeup = asyncio.Event()
+        self.health = health if health is not None else HEALTH
+        self.poll_timeout = poll_timeout
+        self.watchdog_interval = watchdog_interval
+        self.register_metrics()
+
+    def register_metrics(self):
+        """Размеры очередей движка вычисляются при выгрузке метрик."""
+        depth = metrics.QUEUE_DEPTH
+        depth.set_function(lambda: len(self.scheduler), queue='scheduled')
+        depth.set_function(lambda: len(self.tasks), queue='polling')
+        depth.set_function(lambda: len(self.flights), queue='flights')
+        depth.set_function(self.outbox.queue.qsize, queue='outbox_chats')
+        depth.set_function(
+            lambda: len(self.state.outbox), queue='outbox_messages')
+
+    def notify(self, chat_id, message):
+        """Ставим в очередь сообщение о сбое или восстановлении опроса."""
+        if not message:
+            return
+        self.state.enqueue(chat_id, message)
+        self.outbox.submit(chat_id)
+
+    def notify_error(self, subscription, error):
+        """Сообщаем об ошибке, если о ней еще не сообщали."""
+        logging.error(error)
+        self.notify(
+            subscription.chat_id, self.alerts.failure(subscription, error))
+
+    async def poll_once(self, session, subscription):
+        """Один проход конвейера: запрос, проверка, разбор, отправка.
+
+        Отметка from_date сдвигается на current_date ответа только после
+        успешной обработки, поэтому изменения между опросами не теряются.
+        Новые статусы фиксируются в состоянии вместе с уведомлениями,
+        а отправляет их очередь исходящих, не задерживая опрос.
+        Возвращает ошибку опроса или None.
+        """
+        uid = subscription.uid
+        try:
+            response, homeworks = await self.request(session, subscription)
+            changed = homework.commit_changes(
+                self.state, uid, subscription.chat_id, homeworks,
+                response.get('current_date'))
+        except homework.POLL_ERRORS as error:
+            self.breaker.failure(error)
+            self.notify_error(subscription, error)
+            return error
+        self.breaker.success()
+        subscription.cursor = homework.next_cursor(
+            response, subscription.cursor)
+        self.state.set_cursor(uid, subscription.cursor)
+        self.notify(subscription.chat_id, self.alerts.recovered(subscription))
+        homework.RESPONSE_CACHE.confirm(subscription.key)
+        if changed:
+            self.outbox.submit(subscription.chat_id)
+        return None
+
+    async def fetch_checked(self, session, subscription, cursor):
+        """Запрос к API и проверка ответа."""
+        response = await self.fetch(session, subscription, cursor)
+        return response, homework.check_response(response)
+
+    async def request(self, session, subscription):
+        """Проверенный ответ API для подписки.
+
+        Подписки с общим токеном и одинаковой отметкой получают ответ
+        одного запроса: пока он идет, новые опросы ждут его результата.
+        Опрос, которому нужен свой запрос, сначала ждет токен лимита
+        API; время опроса для сторожа отсчитывается после этого.
+        """
+        cursor = subscription.cursor
+        shared = self.tokens.shared(subscription)
+        flight = (subscription.token, cursor)
+        if not shared or flight not in self.flights:
+            await self.api_limiter.acquire(asyncio.sleep)
+        self.health.poll_started(subscription.uid)
+        if not shared:
+            return await self.fetch_checked(session, subscription, cursor)
+        return await self.flights.do(
+            flight, self.fetch_checked, session,
+            TokenRequest(subscription.token), cursor)
+
+    def next_delay(self, subscription, error):
+        """Пауза до следующего опроса: по статусам или с отступом."""
+        statuses = (
+            self.state.index.active_statuses(subscription.uid)
+            if error is None else ())
+        return self.delay_after(subscription.key, statuses, error)
+
+    def delay_after(self, key, statuses, error):
+        """Пауза после опроса по статусам незавершенных работ или ошибке."""
+        if error is None:
+            self.failures.pop(key, None)
+            return self.policy.interval(statuses)
+        attempt = self.failures.get(key, 0) + 1
+        self.failures[key] = attempt
+        return self.backoff.delay(
+            attempt, getattr(error, 'retry_after', None))
+
+    def blocked_delay(self):
+        """Пауза подписки, пока размыкатель не пропускает запросы."""
+        return self.backoff.delay(1, self.breaker.remaining())
+
+    async def poll_and_reschedule(self, session, subscription):
+        """Опрашиваем подписку и планируем следующий опрос.
+
+        Пока размыкатель разомкнут, API не опрашивается: подписка
+        откладывается до пробного запроса.
+        """
+        key = subscription.key
+        delay = None
+        success = False
+        try:
+            if self.breaker.allow():
+                error = await self.poll_once(session, subscription)
+                success = error is None
+                delay = self.next_delay(subscription, error)
+            else:
+                delay = self.blocked_delay()
+        finally:
+            self.health.poll_finished(subscription.uid, success)
+            self.tasks.pop(key, None)
+            if key in self.subscriptions:
+                if delay is None:
+                    delay = self.backoff.delay(1)
+                self.scheduler.schedule(key, delay)
+                self.wakeup.set()
+
+    async def dispatch(self, session):
+        """Запускаем опросы, время которых наступило."""
+        while True:
+            lags = []
+            for key in self.scheduler.pop_due(lags):
+                self.tasks[key] = asyncio.ensure_future(
+                    self.poll_and_reschedule(
+                        session, self.subscriptions[key]))
+            for lag in lags:
+                metrics.POLL_LAG.observe(lag)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self.wakeup.wait(), self.scheduler.wait_time())
+            except asyncio.TimeoutError:
+                pass
+
+    async def watchdog(self):
+        """Сторож: отмечает живость цикла и перезапускает зависшие опросы.
+
+        Опрос дольше poll_timeout отменяется и планируется заново с
+        отступом, как после ошибки.
+        """
+        while True:
+            self.health.beat(self.watchdog_interval)
+            stuck = set(self.health.stuck(self.poll_timeout))
+            for key, task in list(self.tasks.items()):
+                subscription = self.subscriptions.get(key)
+                if subscription is None or subscription.uid not in stuck:
+                    continue
+                logging.warning(
+                    'Опрос %r идет дольше %s с, перезапускаем',
+                    subscription, self.poll_timeout)
+                STUCK_POLLS.inc()
+                task.cancel()
+            await asyncio.sleep(self.watchdog_interval)
+
+    def restore(self, subscription):
+        """Восстанавливаем отметку подписки из состояния."""
+        if subscription.cursor is None:
+            subscription.cursor = (
+                self.state.cursors.get(subscription.uid)
+                or int(self.clock.time()))
+
+    def chat_subscriptions(self, chat_id):
+        """Подписки чата."""
+        return [
+            self.subscriptions[key]
+            for key in self.chats.get(str(chat_id), ())
+        ]
+
+    def start(self, subscription):
+        """Ставим подписку в расписание с сохраненной отметки."""
+        self.restore(subscription)
+        self.subscriptions[subscription.key] = subscription
+        self.tokens.add(subscription)
+        self.chats.setdefault(
+            str(subscription.chat_id), set()).add(subscription.key)
+        self.scheduler.schedule(subscription.key, 0)
+        self.wakeup.set()
+
+    def stop(self, subscription):
+        """Снимаем удаленную подписку с расписания."""
+        key = subscription.key
+        self.subscriptions.pop(key, None)
+        self.tokens.discard(subscription)
+        chat = str(subscription.chat_id)
+        keys = self.chats.get(chat, set())
+        keys.discard(key)
+        if not keys:
+            self.chats.pop(chat, None)
+        self.scheduler.remove(key)
+        self.alerts.forget(subscription)
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        self.state.forget(subscription.uid)
+        self.health.forget(subscription.uid)
+        homework.RESPONSE_CACHE.forget(key)
+
+    def answer_status_requests(self, registry):
+        """Отвечаем на /status, заданный воркеру с командами пула."""
+        for chat_id in registry.status_requests():
+            self.notify(chat_id, status_reply(self, chat_id))
+
+    async def run(self, registry, session=None):
+        """Опрашиваем все подписки и следим за изменениями реестра."""
+        if session is None:
+            async with transport.async_session() as session:
+                transport.export_async_pool_stats(session)
+                return await self.run(registry, session)
+        for subscription in registry:
+            self.start(subscription)
+        sender = asyncio.ensure_future(self.outbox.run(session))
+        dispatcher = asyncio.ensure_future(self.dispatch(session))
+        watchdog = asyncio.ensure_future(self.watchdog())
+        workers = [sender, dispatcher, watchdog]
+        self.health.set_ready()
+        if self.commands:
+            commands = Commands(self, registry, self.updates)
+            workers.append(asyncio.ensure_future(commands.run(session)))
+        try:
+            while True:
+                await asyncio.sleep(self.reload_interval)
+                self.state.flush()
+                HISTORY.flush()
+                metrics.dump()
+                logging.debug(
+                    'Пул соединений: %s, в расписании %s, опросов %s, '
+                    'чатов в очереди %s',
+                    transport.async_pool_stats(session),
+                    len(self.scheduler), len(self.tasks),
+                    self.outbox.queue.qsize())
+                added, removed = registry.reload()
+                for subscription in removed:
+                    self.stop(subscription)
+                for subscription in added:
+                    self.start(subscription)
+                self.answer_status_requests(registry)
+        finally:
+            self.health.set_ready(False)
+            for worker in workers:
+                worker.cancel()
+            for task in self.tasks.values():
+                task.cancel()
+            self.tasks.clear()
+            self.state.flush()
+
+
+def serve(registry, state, commands=COMMANDS_ENABLED,
+          capture=traffic.TRAFFIC_CAPTURE):
+    """Запускаем движок до остановки и закрываем состояние и реестр.
+
+    С путем capture ответы API и отправки записываются в трассу.
+    """
+    stages = {}
+    recorder = traffic.Recorder(capture) if capture else None
+    if recorder is not None:
+        stages['fetch'] = recorder.async_fetch(fetch_api_answer)
+        stages['send'] = recorder.async_send(send_telegram)
+    engine = PollEngine(
+        homework.TELEGRAM_TOKEN, state=state, commands=commands, **stages)
+    try:
+        asyncio.run(engine.run(registry))
+    finally:
+        state.close()
+        HISTORY.close()
+        registry.close()
+        if recorder is not None:
+            recorder.close()
+
+
+def main():
+    """Асинхронный режим работы бота."""
+    logs.setup_logging()
+    registry = homework.load_subscriptions()
+    if sharding.SHARD_DB:
+        registry = sharding.shard(registry)
+    if metrics.METRICS_PORT:
+        metrics.serve()
+    serve(registry, load_state())
+
+
+if __name__ == '__main__':
+    main()
@@ -36,3 +36,38 @@ class StatusError(Exception):
     def __init__(self, text):
         """Custom error text."""
         self.txt = text
+
+
+class ApiServerError(ApiAnswerError):
+    """Класс-ошибка сервера API (5xx)."""
+
+    def __init__(self, text):
+        """Custom error text."""
+        self.txt = text
+
+
+class ApiRateLimitError(ApiAnswerError):
+    """Класс-ошибка превышения лимита запросов к API."""
+
+    def __init__(self, text, retry_after=None):
+        """Custom error text and pause before the next request."""
+        self.txt = text
+        self.retry_after = retry_after
+
+
+class SendRateLimitError(SendMessageError):
+    """Класс-ошибка превышения лимита отправки в Telegram."""
+
+    def __init__(self, text, retry_after=None):
+        """Custom error text and pause before the next message."""
+        self.txt = text
+        self.retry_after = retry_after
+
+
+class UpdatesError(Exception):
+    """Класс-ошибка получения обновлений из Telegram."""
+
+    def __init__(self, text, retry_after=None):
+        """Custom error text and pause before the next request."""
+        self.txt = text
+        self.retry_after = retry_after
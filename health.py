@@ -0,0 +1,116 @@
+import os
+import time
+
+import metrics
+
+POLL_TIMEOUT = float(os.getenv('POLL_TIMEOUT', 120))
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', 10))
+LIVENESS_GRACE = float(os.getenv('LIVENESS_GRACE', 60))
+
+STUCK_POLLS = metrics.Counter(
+    'bot_stuck_polls_total', 'Опросы, прерванные сторожем по таймауту')
+POLL_AGE = metrics.Gauge(
+    'bot_poll_age_max_seconds',
+    'Наибольшее время с последнего успешного опроса подписки')
+
+
+class Health:
+    """Живость, готовность и возраст последних успешных опросов.
+
+    Главный цикл отмечается через beat(interval) и обещает отметиться
+    снова не позже чем через interval секунд; если отметки нет дольше
+    interval плюс grace, процесс считается зависшим. Зависшим он
+    считается и тогда, когда опрос идет дольше stuck_after секунд.
+    Подписки различаются по uid, токены в отчет не попадают.
+    """
+
+    def __init__(self, grace=LIVENESS_GRACE, stuck_after=2 * POLL_TIMEOUT,
+                 clock=time.monotonic):
+        """Запас к интервалу отметок, порог зависшего опроса и часы."""
+        self.grace = grace
+        self.stuck_after = stuck_after
+        self.clock = clock
+        self.ready = False
+        self.deadline = None
+        self.beaten = None
+        self.last_success = {}
+        self.running = {}
+
+    def beat(self, interval):
+        """Главный цикл жив и отметится снова через interval секунд."""
+        now = self.clock()
+        self.beaten = now
+        self.deadline = now + interval + self.grace
+
+    def set_ready(self, ready=True):
+        """Готов ли процесс опрашивать подписки."""
+        self.ready = ready
+
+    def poll_started(self, uid):
+        """Опрос подписки начался."""
+        self.running[uid] = self.clock()
+
+    def poll_finished(self, uid, success):
+        """Опрос подписки закончился."""
+        self.running.pop(uid, None)
+        if success:
+            self.last_success[uid] = self.clock()
+
+    def forget(self, uid):
+        """Подписка удалена."""
+        self.running.pop(uid, None)
+        self.last_success.pop(uid, None)
+
+    def stuck(self, timeout):
+        """Подписки (uid), чей опрос идет дольше timeout секунд."""
+        now = self.clock()
+        return [
+            uid for uid, started in list(self.running.items())
+            if now - started > timeout
+        ]
+
+    def alive(self):
+        """Главный цикл отмечается вовремя и опросы не зависли."""
+        if self.deadline is not None and self.clock() > self.deadline:
+            return False
+        return not self.stuck(self.stuck_after)
+
+    def max_age(self):
+        """Наибольшее время с последнего успешного опроса, секунды."""
+        if not self.last_success:
+            return 0
+        return self.clock() - min(self.last_success.values())
+
+    def status(self):
+        """Сводка для /health."""
+        now = self.clock()
+        return {
+            'alive': self.alive(),
+            'ready': self.ready,
+            'beat_age': None if self.beaten is None else now - self.beaten,
+            'polling': len(self.running),
+            'stuck': len(self.stuck(self.stuck_after)),
+            'max_poll_age': self.max_age(),
+        }
+
+    def polls(self, limit=100):
+        """Подписки с самыми давними успешными опросами для /polls."""
+        now = self.clock()
+        uids = set(self.last_success) | set(self.running)
+        rows = []
+        for uid in uids:
+            success = self.last_success.get(uid)
+            started = self.running.get(uid)
+            rows.append({
+                'uid': uid,
+                'last_success_age': None if success is None else now - success,
+                'running': None if started is None else now - started,
+            })
+        rows.sort(key=lambda row: (
+            row['last_success_age'] is not None,
+            -(row['last_success_age'] or 0)))
+        return {'count': len(rows), 'subscriptions': rows[:limit]}
+
+
+HEALTH = Health()
+POLL_AGE.set_function(HEALTH.max_age)
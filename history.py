@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+
+HISTORY_DB = os.getenv('HISTORY_DB', '')
+HISTORY_BATCH = int(os.getenv('HISTORY_BATCH', 1000))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transitions (
+    uid TEXT NOT NULL,
+    homework TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL,
+    api_time INTEGER,
+    observed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_homework
+    ON transitions (uid, homework, observed);
+'''
+
+DURATIONS = '''
+SELECT ended - observed FROM (
+    SELECT status, observed, LEAD(observed) OVER (
+        PARTITION BY uid, homework ORDER BY observed, rowid) AS ended
+    FROM transitions)
+WHERE status = ? AND ended IS NOT NULL
+ORDER BY 1
+'''
+
+TIME_TO = '''
+SELECT reached - started FROM (
+    SELECT MIN(observed) AS started,
+           MIN(CASE WHEN status = ? THEN observed END) AS reached
+    FROM transitions GROUP BY uid, homework)
+WHERE reached > started
+ORDER BY 1
+'''
+
+COUNTS = '''
+SELECT name, COUNT(*) FROM transitions WHERE status = ?
+GROUP BY name ORDER BY 2 DESC, name LIMIT ?
+'''
+
+
+def summary(values):
+    """Количество, среднее и квантили отсортированных длительностей."""
+    if not values:
+        return {'count': 0}
+    count = len(values)
+    return {
+        'count': count,
+        'mean': sum(values) / count,
+        'p50': values[(count - 1) // 2],
+        'p90': values[(count - 1) * 9 // 10],
+        'max': values[-1],
+    }
+
+
+class History:
+    """История смен статусов работ в базе SQLite.
+
+    Смены копятся в памяти и записываются пачкой в одной транзакции при
+    flush() или когда их набирается batch. Без пути к базе история не
+    ведется. Индекс один — по работе подписки и времени: он нужен и
+    выборкам по работе, и отчетам, а каждый лишний индекс замедляет
+    запись из цикла опроса. Отчеты считаются внутри SQLite одним
+    проходом по индексу с оконными функциями, без выгрузки событий
+    в Python.
+    """
+
+    def __init__(self, path=HISTORY_DB, batch=HISTORY_BATCH,
+                 clock=time.time):
+        """Путь к базе, размер пачки и часы."""
+        self.path = path
+        self.batch = batch
+        self.clock = clock
+        self.rows = []
+        self.connection = None
+
+    def __bool__(self):
+        """Ведется ли история."""
+        return bool(self.path)
+
+    def connect(self):
+        """Соединение с базой; схема создается при первом обращении."""
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def record(self, uid, records, api_time=None):
+        """Смены статусов подписки из одного ответа API."""
+        if not self.path or not records:
+            return
+        observed = self.clock()
+        self.rows.extend(
+            (uid, str(record.key), record.name, record.status, api_time,
+             observed)
+            for record in records)
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """Записываем накопленные смены статусов."""
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        try:
+            with self.connect() as connection:
+                connection.executemany(
+                    'INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?)', rows)
+        except sqlite3.Error as error:
+            logging.error(
+                'История статусов не записана (%s смен): %s',
+                len(rows), error)
+
+    def transitions(self, uid=None, homework=None, since=None, until=None):
+        """Смены статусов по подписке, работе и периоду наблюдения."""
+        conditions, params = [], []
+        for column, operator, value in (
+                ('uid', '=', uid), ('homework', '=', homework),
+                ('observed', '>=', since), ('observed', '<', until)):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+        rows = self.connect().execute(
+            'SELECT uid, homework, name, status, api_time, observed '
+            f'FROM transitions {where}ORDER BY observed, rowid', params)
+        return rows.fetchall()
+
+    def time_in(self, status='reviewing'):
+        """Длительности пребывания работ в статусе, по возрастанию."""
+        rows = self.connect().execute(DURATIONS, (status,))
+        return [row[0] for row in rows]
+
+    def time_to(self, status='approved'):
+        """Время от первого наблюдения работы до статуса, по возрастанию."""
+        rows = self.connect().execute(TIME_TO, (status,))
+        return [row[0] for row in rows]
+
+    def counts(self, status='rejected', limit=10):
+        """Работы с наибольшим числом переходов в статус."""
+        return self.connect().execute(COUNTS, (status, limit)).fetchall()
+
+    def report(self, limit=10):
+        """Сводный отчет по всей истории."""
+        self.flush()
+        total, homeworks = self.connect().execute(
+            'SELECT COALESCE(SUM(events), 0), COUNT(*) FROM ('
+            'SELECT COUNT(*) AS events FROM transitions '
+            'GROUP BY uid, homework)').fetchone()
+        return {
+            'transitions': total,
+            'homeworks': homeworks,
+            'reviewing_seconds': summary(self.time_in('reviewing')),
+            'approved_after_seconds': summary(self.time_to('approved')),
+            'rejections': self.counts('rejected', limit),
+        }
+
+    def close(self):
+        """Записываем остаток и закрываем базу."""
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+HISTORY = History()
+
+
+def main(argv=None):
+    """Отчет по истории статусов в JSON."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--db', default=HISTORY_DB or 'state/history.sqlite')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        raise SystemExit(f'Нет базы истории {args.db}')
+    history = History(args.db)
+    try:
+        print(json.dumps(
+            history.report(args.limit), ensure_ascii=False, indent=2))
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,118 +1,391 @@
+import json
 import logging
 import os
 import time
+from collections import namedtuple
 
-import requests
-from dotenv import load_dotenv
-from telegram import Bot
 from http import HTTPStatus
 
 import exceptions
+import logs
+import metrics
+import streaming
+import transport
+from alerts import Alerts
+from cache import ResponseCache
+from clock import SYSTEM_CLOCK
+from health import HEALTH
+from history import HISTORY
+from ratelimit import Backoff
+from scheduler import IntervalPolicy
+from state import load_state
+from subscriptions import Subscription, load_registry
 
-load_dotenv()
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
 
-logging.basicConfig(
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG)
-
-console_handler = logging.StreamHandler()
+    load_dotenv(ENV_FILE)
 
 PRACTICUM_TOKEN = os.getenv('YA_TOKEN')
 TELEGRAM_TOKEN = os.getenv('T_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('CHAT_ID')
 
 RETRY_TIME = 600
+STREAM_THRESHOLD = int(os.getenv('STREAM_THRESHOLD', 256 * 1024))
+STREAM_CHUNK = int(os.getenv('STREAM_CHUNK', 64 * 1024))
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 
 
+RESPONSE_CACHE = ResponseCache()
+MAIN_CACHE_KEY = 'main'
+
 HOMEWORK_STATUSES = {
     'approved': 'Работа проверена: ревьюеру всё понравилось. Ура!',
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
 
+STATUS_MESSAGES = {
+    status: 'Изменился статус проверки работы "{}". ' + verdict
+    for status, verdict in HOMEWORK_STATUSES.items()
+}
 
-def send_message(bot, message):
-    """Отправка сообщения в телеграм."""
-    logging.info('Попытка отправить сообщение в Telegram')
+Homework = namedtuple('Homework', ('key', 'name', 'status'))
+
+POLL_ERRORS = (
+    exceptions.ApiAnswerError, exceptions.ApiNoAnswerError,
+    exceptions.MyResponseError, TypeError, KeyError, exceptions.StatusError,
+    exceptions.SendMessageError
+)
+
+
+def send_to_chat(bot, chat_id, message):
+    """Отправка сообщения в чат chat_id."""
+    logging.debug('Попытка отправить сообщение в Telegram')
     try:
-        bot.send_message(TELEGRAM_CHAT_ID, message)
+        bot.send_message(chat_id, message)
     except Exception as error:
-        raise exceptions.SendMessageError(
-            f'Ошибка отправки сообщения в Telegram. {error}')
+        text = f'Ошибка отправки сообщения в Telegram. {error}'
+        if getattr(error, 'retry_after', None):
+            raise exceptions.SendRateLimitError(text, error.retry_after)
+        raise exceptions.SendMessageError(text)
     else:
         logging.info('Сообщение в Telegram отправлено')
 
 
-def get_api_answer(current_timestamp):
-    """Получаем ответ от API."""
-    logging.info('Попытка получить ответ от API')
+@metrics.timed('send_message')
+def send_message(bot, message):
+    """Отправка сообщения в телеграм."""
+    send_to_chat(bot, TELEGRAM_CHAT_ID, message)
+
+
+def build_api_request(current_timestamp, headers=None, cache_key=None):
+    """Собираем параметры запроса к API.
+
+    Если прошлый ответ подписки есть в кеше, запрос делается условным.
+    """
     timestamp = current_timestamp or int(time.time())
-    params = {'from_date': timestamp}
-    requests_params = {
+    return {
         'url': ENDPOINT,
-        'headers': HEADERS,
-        'params': params
+        'headers': {
+            **(headers or HEADERS), **RESPONSE_CACHE.headers(cache_key)
+        },
+        'params': {'from_date': timestamp}
     }
+
+
+def retry_after(response):
+    """Пауза из заголовка Retry-After в секундах или None."""
+    value = getattr(response, 'headers', {}).get('Retry-After')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def check_api_status(status_code, response):
+    """Проверяем код ответа API."""
+    if status_code == HTTPStatus.OK:
+        return
+    text = f'Неудачный ответ API. Запрос к {ENDPOINT}, ответ - {response}'
+    if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        raise exceptions.ApiRateLimitError(text, retry_after(response))
+    if status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        raise exceptions.ApiServerError(text)
+    raise exceptions.ApiAnswerError(text)
+
+
+class ResponseStream:
+    """Ответ API, который разбирается по частям прямо при чтении тела.
+
+    Работы из массива homeworks сразу превращаются в записи Homework,
+    поэтому исходные словари не накапливаются в памяти.
+    """
+
+    def __init__(self):
+        """Пустой разбор."""
+        self.parser = streaming.JsonStreamParser('homeworks')
+        self.records = []
+
+    def feed(self, chunk):
+        """Очередная часть тела ответа."""
+        try:
+            homeworks = self.parser.feed(chunk)
+        except ValueError as error:
+            raise exceptions.MyResponseError(
+                f'Некорректный JSON в ответе API: {error}')
+        self.records.extend(parse_homeworks(homeworks))
+
+    def result(self):
+        """Ответ целиком: поля верхнего уровня и записи работ."""
+        try:
+            response = self.parser.close()
+        except ValueError as error:
+            raise exceptions.MyResponseError(
+                f'Некорректный JSON в ответе API: {error}')
+        if self.parser.streamed:
+            response['homeworks'] = self.records
+        return response
+
+
+def should_stream(content_length):
+    """Разбирать ли тело по частям: оно большое или размер неизвестен."""
+    if not STREAM_THRESHOLD:
+        return False
+    return content_length is None or int(content_length) > STREAM_THRESHOLD
+
+
+def not_modified(status_code, cache_key):
+    """Ответ из кеша на 304 Not Modified или None."""
+    if status_code != HTTPStatus.NOT_MODIFIED:
+        return None
+    return RESPONSE_CACHE.not_modified(cache_key)
+
+
+def decode_body(cache_key, headers, body):
+    """Разбираем тело ответа, если оно отличается от прошлого."""
+    cached = RESPONSE_CACHE.check(cache_key, headers, body)
+    if cached is not None:
+        logging.debug('Ответ API не изменился')
+        return cached
+    try:
+        return json.loads(body)
+    except ValueError as error:
+        raise exceptions.MyResponseError(
+            f'Некорректный JSON в ответе API: {error}')
+
+
+def read_response(response, cache_key=None):
+    """Тело ответа: небольшое целиком, большое — по частям.
+
+    Таймаут чтения requests ограничивает только паузы между частями,
+    поэтому чтение по частям прерывается и по общему сроку.
+    """
+    iter_content = getattr(response, 'iter_content', None)
+    if iter_content is None:
+        return response.json()
+    deadline = time.monotonic() + transport.TOTAL_TIMEOUT
+    try:
+        if not should_stream(response.headers.get('Content-Length')):
+            return decode_body(cache_key, response.headers, response.content)
+        RESPONSE_CACHE.remember(cache_key, response.headers)
+        stream = ResponseStream()
+        for chunk in iter_content(STREAM_CHUNK):
+            stream.feed(chunk)
+            if time.monotonic() > deadline:
+                raise exceptions.ApiNoAnswerError(
+                    f'Ответ API читается дольше {transport.TOTAL_TIMEOUT} с')
+    except OSError:
+        raise exceptions.ApiNoAnswerError(
+            f'Ответ API оборван. Возможно проблема с {ENDPOINT}'
+        )
+    return stream.result()
+
+
+def release_response(response):
+    """Возвращаем соединение ответа в пул.
+
+    Тело ответа без работ (304, ошибка) дочитывается, чтобы соединение
+    можно было переиспользовать; недочитанный ответ 200 закрывается
+    вместе с соединением.
+    """
+    close = getattr(response, 'close', None)
+    if close is None:
+        return
+    if response.status_code != HTTPStatus.OK:
+        try:
+            response.content
+        except OSError:
+            pass
+    close()
+
+
+def request_api_answer(current_timestamp, headers=None,
+                       cache_key=MAIN_CACHE_KEY):
+    """Запрос к API с заголовками и ключом кеша подписки."""
+    logging.debug('Попытка получить ответ от API')
+    requests_params = build_api_request(current_timestamp, headers, cache_key)
     try:
-        response = requests.get(**requests_params)
+        response = transport.get(stream=True, **requests_params)
     except Exception:
         raise exceptions.ApiNoAnswerError(
             f'Ошибка ответа API. Возможно проблема с {ENDPOINT}'
         )
-    else:
-        if response.status_code != HTTPStatus.OK:
-            raise exceptions.ApiAnswerError(
-                f'Неудачный ответ API. Запрос к {ENDPOINT}, ответ - {response}'
-            )
-        return response.json()
+    try:
+        cached = not_modified(response.status_code, cache_key)
+        if cached is not None:
+            return cached
+        check_api_status(response.status_code, response)
+        return read_response(response, cache_key)
+    finally:
+        release_response(response)
+
+
+@metrics.timed('get_api_answer')
+def get_api_answer(current_timestamp):
+    """Получаем ответ от API."""
+    return request_api_answer(current_timestamp)
+
+
+def next_cursor(response, current_timestamp):
+    """Следующая отметка from_date по полю current_date ответа API."""
+    current_date = response.get('current_date')
+    if isinstance(current_date, int) and current_date > 0:
+        return current_date
+    return current_timestamp
 
 
+@metrics.timed('check_response')
 def check_response(response):
     """Проверяем ответ API."""
-    logging.info('Проверяем ответ от API')
+    logging.debug('Проверяем ответ от API')
     if not isinstance(response, dict):
         raise TypeError(
             f'Ответ пришел не в виде словаря. Type: {type(response)}'
         )
+    homeworks = response.get('homeworks')
+    if type(homeworks) is list:
+        return homeworks
     if 'homeworks' not in response:
         raise exceptions.MyResponseError(
             f'Нет ключа homeworks: {response.keys()}'
         )
-    response_list = response['homeworks']
-    if not isinstance(response_list, list):
-        raise exceptions.MyResponseError(
-            f'По ключу homeworks возвращается не список. '
-            f'Type: {type(response_list)}'
-        )
-    return response_list
+    raise exceptions.MyResponseError(
+        f'По ключу homeworks возвращается не список. '
+        f'Type: {type(homeworks)}'
+    )
 
 
-def parse_status(homework):
-    """Получаем статус работы для передачи сообщения."""
-    logging.info('Пробуем получить ответ по ключу для отправки сообщения')
-    if not isinstance(homework, dict):
+def parse_homework(homework):
+    """Проверяем работу и собираем из нее компактную запись.
+
+    Ключи читаются по одному разу; текст ошибки собирается только при
+    ошибке.
+    """
+    try:
+        name = homework['homework_name']
+        status = homework['status']
+    except KeyError as error:
+        raise KeyError(
+            f'Ключ {error.args[0]} не найден: {homework}'
+        ) from None
+    except TypeError:
         raise TypeError(
             f'Ответ пришел не в виде словаря. Type: {type(homework)}'
-        )
-    if 'homework_name' not in homework:
-        raise KeyError(
-            f'Ключ homework_name не найден: {homework}'
-        )
-    if 'status' not in homework:
-        raise KeyError(
-            f'Ключ status не найден: {homework}'
-        )
-    homework_name = homework.get('homework_name')
-    homework_status = homework.get('status')
-    if homework_status not in HOMEWORK_STATUSES:
+        ) from None
+    if status not in STATUS_MESSAGES:
         raise exceptions.StatusError(
-            f'Нет документированного статуса: {homework_status}. '
+            f'Нет документированного статуса: {status}. '
             f'{HOMEWORK_STATUSES.keys()}'
         )
-    verdict = HOMEWORK_STATUSES[homework_status]
-    return f'Изменился статус проверки работы "{homework_name}". {verdict}'
+    return Homework(homework.get('id', name), name, status)
+
+
+@metrics.timed('parse_homeworks')
+def parse_homeworks(homeworks):
+    """Проверяем все работы ответа за один проход.
+
+    Корректные работы разбираются прямо в цикле; parse_homework
+    вызывается только для записи с ошибкой, чтобы собрать ее текст.
+    Записи, уже разобранные при потоковом чтении, проходят как есть.
+    """
+    records = []
+    append = records.append
+    messages = STATUS_MESSAGES
+    for homework in homeworks:
+        if type(homework) is Homework:
+            append(homework)
+            continue
+        try:
+            name = homework['homework_name']
+            status = homework['status']
+            if status in messages:
+                append(Homework(homework.get('id', name), name, status))
+                continue
+        except (KeyError, TypeError):
+            pass
+        append(parse_homework(homework))
+    return records
+
+
+def status_message(record):
+    """Текст уведомления по заготовке для статуса записи."""
+    return STATUS_MESSAGES[record.status].format(record.name)
+
+
+@metrics.timed('parse_status')
+def parse_status(homework):
+    """Получаем статус работы для передачи сообщения."""
+    logging.debug('Пробуем получить ответ по ключу для отправки сообщения')
+    return status_message(parse_homework(homework))
+
+
+def commit_changes(state, uid, chat_id, homeworks, api_time=None):
+    """Фиксируем все смены статуса из ответа API и ставим уведомления в очередь.
+
+    Статус попадает в состояние вместе с уведомлением, поэтому после
+    перезапуска работа не считается измененной повторно, а недоставленное
+    сообщение дождется отправки в исходящих. Все работы ответа проверяются
+    до фиксации, поэтому некорректная запись не оставляет ответ
+    зафиксированным наполовину. Смены статусов с current_date ответа
+    (api_time) попадают в историю статусов.
+    """
+    changed = state.index.changed_records(uid, parse_homeworks(homeworks))
+    if not changed:
+        logging.debug('Новых статусов нет')
+    for record in changed:
+        state.commit_homework(uid, record, chat_id, status_message(record))
+    HISTORY.record(uid, changed, api_time)
+    return len(changed)
+
+
+def send_pending(bot, state):
+    """Отправляем недоставленные сообщения из исходящих."""
+    for entry_id, chat_id, message in state.pending():
+        send_to_chat(bot, chat_id, message)
+        state.ack(entry_id)
+
+
+def report(bot, state, message):
+    """Сообщение о сбое или восстановлении опроса через исходящие.
+
+    Неотправленное сообщение останется в исходящих до следующего цикла.
+    """
+    if not message:
+        return
+    state.enqueue(TELEGRAM_CHAT_ID, message)
+    try:
+        send_pending(bot, state)
+    except exceptions.SendMessageError as send_error:
+        logging.error(send_error)
+
+
+def report_error(bot, state, alerts, subscription, error):
+    """Сообщаем об ошибке опроса, если о ней еще не сообщали."""
+    logging.error(error)
+    report(bot, state, alerts.failure(subscription, error))
 
 
 def check_tokens():
@@ -121,39 +394,82 @@ def check_tokens():
     return all((PRACTICUM_TOKEN, TELEGRAM_TOKEN, TELEGRAM_CHAT_ID))
 
 
-def main():
-    """Основная логика работы бота."""
+def check_subscription_tokens(subscriptions):
+    """Проверяем токен бота и токены каждой подписки."""
+    logging.info('Проверяем токены подписок')
+    if not TELEGRAM_TOKEN:
+        return False
+    valid = True
+    for subscription in subscriptions:
+        if not subscription.is_valid():
+            logging.error('Некорректная подписка: %r', subscription)
+            valid = False
+    return valid
+
+
+def load_subscriptions():
+    """Подписки из файла или окружения; без подписок выходим."""
+    registry = load_registry(token=PRACTICUM_TOKEN, chat_id=TELEGRAM_CHAT_ID)
+    if not len(registry) or not check_subscription_tokens(registry):
+        raise SystemExit(
+            'Нет подписок или некорректны токены: TELEGRAM_TOKEN, '
+            f'PRACTICUM_TOKEN/TELEGRAM_CHAT_ID или {registry.path}'
+        )
+    return registry
+
+
+def main(clock=SYSTEM_CLOCK):
+    """Основная логика работы бота; часы можно подменить виртуальными."""
+    logs.setup_logging()
     if check_tokens() is False:
         raise SystemExit(
             'Ошибка в одной или нескольких переменных окружения: '
             'PRACTICUM_TOKEN, TELEGRAM_TOKEN, TELEGRAM_CHAT_ID'
         )
-    message = ''
+    if metrics.METRICS_PORT:
+        metrics.serve()
+    transport.open_session()
+    bot = transport.LazyBot(TELEGRAM_TOKEN)
+    transport.export_pool_stats(bot)
+    state = load_state()
+    HEALTH.set_ready()
+    policy = IntervalPolicy(default=RETRY_TIME)
+    backoff = Backoff()
+    alerts = Alerts(state, clock=clock.monotonic)
+    failures = 0
+    subscription = Subscription(PRACTICUM_TOKEN, TELEGRAM_CHAT_ID)
+    uid = subscription.uid
+    current_timestamp = state.cursors.get(uid) or int(clock.time())
     while True:
-        bot = Bot(token=TELEGRAM_TOKEN)
-        current_timestamp = int(time.time())
+        HEALTH.poll_started(uid)
         try:
+            send_pending(bot, state)
             response = get_api_answer(current_timestamp)
-            homework = check_response(response)
-            if len(homework) != 0:
-                status = parse_status(homework[0])
-            else:
-                status = 'Нет взятых в проверку работ.'
-            if status != message:
-                send_message(bot, status)
-                message = status
-        except (exceptions.ApiAnswerError, exceptions.ApiNoAnswerError,
-                exceptions.MyResponseError, TypeError, exceptions.StatusError,
-                exceptions.SendMessageError) as error:
-            logging.error(error)
-            status = error.txt
+            homeworks = check_response(response)
+            commit_changes(
+                state, uid, TELEGRAM_CHAT_ID, homeworks,
+                response.get('current_date'))
+            current_timestamp = next_cursor(response, current_timestamp)
+            state.set_cursor(uid, current_timestamp)
+            send_pending(bot, state)
+            report(bot, state, alerts.recovered(subscription))
+            RESPONSE_CACHE.confirm(MAIN_CACHE_KEY)
+        except POLL_ERRORS as error:
+            HEALTH.poll_finished(uid, False)
+            report_error(bot, state, alerts, subscription, error)
+            failures += 1
+            delay = backoff.delay(
+                failures, getattr(error, 'retry_after', None))
         else:
+            HEALTH.poll_finished(uid, True)
             logging.info('Все ок!')
-        finally:
-            if status != message:
-                send_message(bot, status)
-                message = status
-            time.sleep(RETRY_TIME)
+            failures = 0
+            delay = policy.interval(state.index.active_statuses(uid))
+        state.flush()
+        HISTORY.flush()
+        metrics.dump()
+        HEALTH.beat(delay)
+        clock.sleep(delay)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,110 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_SAMPLE = int(os.getenv('LOG_SAMPLE', 1))
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Компактная JSON-строка на запись."""
+
+    def format(self, record):
+        """Запись в виде JSON без пробелов."""
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SampleFilter(logging.Filter):
+    """Пропускаем каждую rate-ю повторяющуюся запись уровня INFO и ниже.
+
+    Повтором считается запись с тем же шаблоном сообщения, поэтому
+    одинаковые строки каждого опроса прореживаются, а предупреждения и
+    ошибки проходят всегда. Первая запись шаблона не отбрасывается.
+    """
+
+    def __init__(self, rate=LOG_SAMPLE):
+        """Доля пропускаемых повторов: одна из rate."""
+        super().__init__()
+        self.rate = rate
+        self.seen = {}
+
+    def filter(self, record):
+        """Решаем, пропустить ли запись."""
+        if self.rate <= 1 or record.levelno > logging.INFO:
+            return True
+        key = record.msg if isinstance(record.msg, str) else id(record.msg)
+        count = self.seen.get(key, 0)
+        self.seen[key] = count + 1
+        return count % self.rate == 0
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение сразу; здесь запись кладется
+    в очередь как есть, и строка форматируется в потоке слушателя.
+    Аргументы записи не должны меняться после вызова логгера.
+    """
+
+    def prepare(self, record):
+        """Запись передается слушателю без изменений."""
+        return record
+
+
+class Listener(QueueListener):
+    """QueueListener, который можно останавливать повторно."""
+
+    def stop(self):
+        """Дописываем очередь и останавливаем поток, если он запущен."""
+        if self._thread is not None:
+            super().stop()
+
+
+def build_handler(log_format=LOG_FORMAT, path=LOG_FILE):
+    """Обработчик вывода: stderr или файл, текст или JSON."""
+    if path:
+        handler = logging.FileHandler(path, encoding='utf-8')
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, path=LOG_FILE,
+                  sample=LOG_SAMPLE):
+    """Неблокирующее логирование через очередь и фоновый поток.
+
+    Вызывающий код только кладет запись в очередь; форматирование и
+    запись в поток вывода выполняет QueueListener. Возвращает слушателя,
+    он останавливается при выходе из процесса.
+    """
+    records = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SampleFilter(sample))
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener = Listener(records, build_handler(log_format, path))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
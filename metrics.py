@@ -0,0 +1,248 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60
+)
+
+
+def label_key(labels):
+    """Ключ набора меток."""
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels, extra=()):
+    """Метки в формате Prometheus."""
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    inner = ','.join(
+        '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return f'{{{inner}}}'
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        """Пустой реестр."""
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """Добавляем метрику в реестр."""
+        self.metrics.append(metric)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.append(f'# HELP {metric.name} {metric.documentation}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                for suffix, labels, value in metric.samples():
+                    lines.append(
+                        f'{metric.name}{suffix}{labels} {value:g}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """Базовая метрика с метками."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        """Имя, описание и реестр метрики."""
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def get(self, **labels):
+        """Значение метрики с заданными метками."""
+        return self.values.get(label_key(labels), 0)
+
+
+class Counter(Metric):
+    """Монотонный счетчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Увеличиваем счетчик."""
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """Значения для выгрузки."""
+        for key, value in list(self.values.items()):
+            yield '', format_labels(key), value
+
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией при выгрузке."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        """Имя, описание и реестр метрики."""
+        super().__init__(name, documentation, registry)
+        self.functions = {}
+        self.collector = None
+
+    def set(self, value, **labels):
+        """Задаем значение."""
+        self.values[label_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Значение будет вычисляться функцией при каждой выгрузке."""
+        self.functions[label_key(labels)] = function
+
+    def set_collector(self, collector):
+        """Пары (метки, значение) вычисляются функцией при выгрузке.
+
+        Для значений, набор меток которых заранее неизвестен.
+        """
+        self.collector = collector
+
+    def get(self, **labels):
+        """Значение метрики с заданными метками."""
+        function = self.functions.get(label_key(labels))
+        if function is not None:
+            return function()
+        return super().get(**labels)
+
+    def samples(self):
+        """Значения для выгрузки."""
+        for key, value in list(self.values.items()):
+            yield '', format_labels(key), value
+        for key, function in list(self.functions.items()):
+            yield '', format_labels(key), function()
+        if self.collector is not None:
+            for labels, value in self.collector():
+                yield '', format_labels(label_key(labels)), value
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS,
+                 registry=REGISTRY):
+        """Имя, описание, границы корзин и реестр метрики."""
+        super().__init__(name, documentation, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Учитываем наблюдение."""
+        key = label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [
+                    [0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        """Количество наблюдений."""
+        series = self.values.get(label_key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        """Накопленные корзины, сумма и количество."""
+        for key, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', format_labels(key, (('le', bound),)), (
+                    cumulative)
+            yield '_bucket', format_labels(key, (('le', '+Inf'),)), count
+            yield '_sum', format_labels(key), total
+            yield '_count', format_labels(key), count
+
+
+STAGE_SECONDS = Histogram(
+    'bot_stage_seconds', 'Время выполнения стадий конвейера, секунды')
+STAGE_ERRORS = Counter(
+    'bot_stage_errors_total', 'Ошибки стадий конвейера по типам исключений')
+POLL_LAG = Histogram(
+    'bot_poll_lag_seconds', 'Опоздание опроса относительно расписания')
+QUEUE_DEPTH = Gauge('bot_queue_depth', 'Размер очередей движка')
+
+
+def observe_stage(stage, started, error=None):
+    """Учитываем время стадии и ее ошибку."""
+    STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+    if error is not None:
+        STAGE_ERRORS.inc(stage=stage, error=type(error).__name__)
+
+
+def timed(stage):
+    """Декоратор: время и ошибки стадии, для обычных и async-функций."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as error:
+                    observe_stage(stage, started, error)
+                    raise
+                observe_stage(stage, started)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                observe_stage(stage, started, error)
+                raise
+            observe_stage(stage, started)
+            return result
+        return wrapper
+    return decorator
+
+
+def serve(port=METRICS_PORT, host='0.0.0.0'):
+    """Запускаем HTTP-сервер метрик в фоновом потоке.
+
+    http.server импортируется только здесь, чтобы не замедлять запуск
+    без METRICS_PORT.
+    """
+    import metrics_server
+
+    return metrics_server.serve(port, host)
+
+
+def dump(path=METRICS_FILE, registry=REGISTRY):
+    """Атомарно записываем метрики в файл."""
+    if not path:
+        return
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(registry.render())
+    os.replace(temp_path, path)
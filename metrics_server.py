@@ -0,0 +1,91 @@
+import json
+import logging
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from health import HEALTH
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Метрики, живость, готовность и возраст опросов по HTTP.
+
+    GET /metrics — метрики Prometheus; /health — 200, если главный цикл
+    отмечается вовремя и опросы не зависли, иначе 503; /ready — 200,
+    когда процесс опрашивает подписки; /polls — подписки с самыми
+    давними успешными опросами (?limit=N).
+    """
+
+    registry = metrics.REGISTRY
+    health = HEALTH
+
+    def do_GET(self):
+        """Ответ на GET-запрос."""
+        url = urlsplit(self.path)
+        routes = {
+            '/metrics': self.metrics,
+            '/health': self.liveness,
+            '/ready': self.readiness,
+            '/polls': self.polls,
+        }
+        route = routes.get(url.path)
+        if route is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        route(parse_qs(url.query))
+
+    def reply(self, status, body, content_type):
+        """Отправляем ответ с телом."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_json(self, status, data):
+        """Ответ в JSON."""
+        self.reply(status, json.dumps(data).encode(), 'application/json')
+
+    def metrics(self, query):
+        """Метрики в текстовом формате Prometheus."""
+        self.reply(
+            HTTPStatus.OK, self.registry.render().encode(),
+            'text/plain; version=0.0.4')
+
+    def liveness(self, query):
+        """Живость процесса."""
+        status = self.health.status()
+        self.reply_json(
+            HTTPStatus.OK if status['alive']
+            else HTTPStatus.SERVICE_UNAVAILABLE, status)
+
+    def readiness(self, query):
+        """Готовность процесса."""
+        ready = self.health.ready
+        self.reply_json(
+            HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+            {'ready': ready})
+
+    def polls(self, query):
+        """Возраст последних успешных опросов подписок."""
+        try:
+            limit = int(query.get('limit', ['100'])[0])
+        except ValueError:
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return
+        self.reply_json(HTTPStatus.OK, self.health.polls(limit))
+
+    def log_message(self, format, *args):
+        """Не пишем в лог каждый запрос метрик."""
+
+
+def serve(port=metrics.METRICS_PORT, host='0.0.0.0'):
+    """Запускаем HTTP-сервер метрик в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logging.info('Метрики доступны на порту %s', server.server_address[1])
+    return server
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import time
+
+import exceptions
+from ratelimit import (
+    TELEGRAM_CHAT_RATE, TELEGRAM_RATE, Backoff, KeyedLimiter, TokenBucket
+)
+
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 8))
+OUTBOX_SIZE = int(os.getenv('OUTBOX_SIZE', 10000))
+OUTBOX_WINDOW = float(os.getenv('OUTBOX_WINDOW', 2))
+OUTBOX_SWEEP = float(os.getenv('OUTBOX_SWEEP', 30))
+MESSAGE_LIMIT = 4096
+
+
+def coalesce(entries, limit=MESSAGE_LIMIT):
+    """Склеиваем сообщения чата в как можно меньшее число отправок.
+
+    Принимает пары (номер, текст), возвращает пары (номера, текст части).
+    Одинаковые тексты отправляются один раз, порядок сохраняется, каждая
+    часть не длиннее лимита Telegram.
+    """
+    batches = []
+    entry_ids = []
+    current = ''
+    seen = set()
+    for entry_id, message in entries:
+        if message in seen:
+            entry_ids.append(entry_id)
+            continue
+        seen.add(message)
+        message = message[:limit]
+        if current and len(current) + 2 + len(message) <= limit:
+            current = f'{current}\n\n{message}'
+            entry_ids.append(entry_id)
+            continue
+        if current:
+            batches.append((entry_ids, current))
+        entry_ids = [entry_id]
+        current = message
+    if current:
+        batches.append((entry_ids, current))
+    return batches
+
+
+class Outbox:
+    """Очередь исходящих уведомлений, независимая от опроса.
+
+    Сами сообщения хранятся в состоянии, в очереди — только чаты, у
+    которых есть что отправить. Чат попадает в очередь один раз и через
+    окно склейки; воркер забирает все сообщения чата, отправляет их
+    одним сообщением и подтверждает. При ошибке чат возвращается в
+    очередь с экспоненциальной паузой. Если очередь переполнена, чат
+    подберет периодический обход состояния.
+    """
+
+    def __init__(self, state, send, bot_token, workers=OUTBOX_WORKERS,
+                 maxsize=OUTBOX_SIZE, window=OUTBOX_WINDOW,
+                 sweep=OUTBOX_SWEEP):
+        """Состояние, функция отправки и параметры очереди."""
+        self.state = state
+        self.send = send
+        self.bot_token = bot_token
+        self.workers = workers
+        self.window = window
+        self.sweep = sweep
+        self.maxsize = maxsize
+        self.queue = asyncio.Queue(maxsize)
+        self.queued = set()
+        self.active = set()
+        self.attempts = {}
+        self.backoff = Backoff(base=1, maximum=300)
+        self.limiter = TokenBucket(TELEGRAM_RATE)
+        self.chat_limiter = KeyedLimiter(TELEGRAM_CHAT_RATE, capacity=3)
+        self.paused_until = 0
+
+    def submit(self, chat_id, delay=None):
+        """Ставим чат в очередь через окно склейки, если его там нет."""
+        chat = str(chat_id)
+        if chat in self.queued:
+            return True
+        if len(self.queued) >= self.maxsize:
+            logging.warning('Очередь исходящих заполнена, чат %s ждет', chat)
+            return False
+        self.queued.add(chat)
+        asyncio.get_running_loop().call_later(
+            self.window if delay is None else delay, self.put, chat)
+        return True
+
+    def put(self, chat):
+        """Передаем чат воркерам."""
+        try:
+            self.queue.put_nowait(chat)
+        except asyncio.QueueFull:
+            self.queued.discard(chat)
+
+    def retry(self, chat):
+        """Возвращаем чат в очередь после паузы."""
+        attempt = self.attempts.get(chat, 0) + 1
+        self.attempts[chat] = attempt
+        delay = max(
+            self.backoff.delay(attempt),
+            self.paused_until - time.monotonic())
+        self.submit(chat, delay)
+
+    async def send_limited(self, session, chat, message):
+        """Отправка в пределах общего лимита Telegram и лимита чата."""
+        await self.limiter.acquire(asyncio.sleep)
+        await self.chat_limiter.acquire(chat, asyncio.sleep)
+        try:
+            await self.send(session, self.bot_token, chat, message)
+        except exceptions.SendRateLimitError as error:
+            self.paused_until = time.monotonic() + (error.retry_after or 1)
+            raise
+
+    async def deliver(self, session, chat):
+        """Отправляем все накопленные сообщения чата.
+
+        Каждая часть подтверждается сразу после отправки, поэтому при
+        ошибке повторно уйдут только неотправленные части.
+        """
+        pending = self.state.pending(chat)
+        if not pending:
+            return
+        chat_id = pending[0][1]
+        batches = coalesce(
+            (entry_id, message) for entry_id, _, message in pending)
+        for entry_ids, message in batches:
+            await self.send_limited(session, chat_id, message)
+            for entry_id in entry_ids:
+                self.state.ack(entry_id)
+
+    async def worker(self, session):
+        """Воркер: берет чат из очереди и отправляет его сообщения."""
+        while True:
+            chat = await self.queue.get()
+            self.queued.discard(chat)
+            if chat in self.active:
+                self.submit(chat)
+                self.queue.task_done()
+                continue
+            self.active.add(chat)
+            try:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self.deliver(session, chat)
+            except exceptions.SendMessageError as error:
+                logging.error(error.txt)
+                self.retry(chat)
+            except Exception:
+                logging.exception('Сбой отправки в чат %s', chat)
+                self.retry(chat)
+            else:
+                self.attempts.pop(chat, None)
+            finally:
+                self.active.discard(chat)
+                self.queue.task_done()
+
+    def submit_pending(self):
+        """Ставим в очередь все чаты с недоставленными сообщениями."""
+        for chat in self.state.pending_chats():
+            if not self.submit(chat):
+                break
+
+    async def run(self, session):
+        """Запускаем воркеров и периодический обход состояния."""
+        workers = [
+            asyncio.ensure_future(self.worker(session))
+            for _ in range(self.workers)
+        ]
+        try:
+            while True:
+                self.submit_pending()
+                await asyncio.sleep(self.sweep)
+        finally:
+            for worker in workers:
+                worker.cancel()
@@ -0,0 +1,184 @@
+import os
+import random
+import time
+from collections import OrderedDict
+
+import exceptions
+
+API_RATE = float(os.getenv('API_RATE', 20))
+TELEGRAM_RATE = float(os.getenv('TELEGRAM_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+BACKOFF_BASE = float(os.getenv('BACKOFF_BASE', 30))
+BACKOFF_MAX = float(os.getenv('BACKOFF_MAX', 3600))
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 5))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 120))
+
+UPSTREAM_ERRORS = (
+    exceptions.ApiNoAnswerError, exceptions.ApiServerError,
+    exceptions.ApiRateLimitError
+)
+
+
+class TokenBucket:
+    """Корзина токенов: rate запросов в секунду, всплеск до capacity."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """Скорость пополнения, емкость и часы."""
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        """Пополняем корзину за прошедшее время."""
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Берем токен, если он есть."""
+        if not self.rate:
+            return True
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Сколько ждать до появления токена."""
+        if not self.rate:
+            return 0
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def reserve(self):
+        """Занимаем ближайший токен и возвращаем, сколько до него ждать.
+
+        Токены выдаются в порядке обращений, поэтому ожидающие
+        просыпаются по одному, каждый к своему токену.
+        """
+        if not self.rate:
+            return 0
+        self.refill()
+        self.tokens -= 1
+        return max(0, -self.tokens / self.rate)
+
+    async def acquire(self, sleep):
+        """Ждем токен на корутине sleep вызывающего event loop."""
+        delay = self.reserve()
+        if delay:
+            await sleep(delay)
+
+    def wait(self):
+        """Ждем токен, блокируя поток."""
+        while not self.try_acquire():
+            time.sleep(self.delay())
+
+
+class KeyedLimiter:
+    """Отдельная корзина на каждый ключ (чат, хост) с LRU-вытеснением."""
+
+    def __init__(self, rate, capacity=None, max_keys=100000,
+                 clock=time.monotonic):
+        """Параметры корзин и лимит числа ключей."""
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets = OrderedDict()
+
+    def bucket(self, key):
+        """Корзина ключа."""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity, self.clock)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key, sleep):
+        """Ждем токен корзины ключа."""
+        await self.bucket(key).acquire(sleep)
+
+
+class Backoff:
+    """Экспоненциальная пауза со случайным разбросом в верхней половине."""
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX, rng=random):
+        """Начальная и максимальная паузы и генератор случайных чисел."""
+        self.base = base
+        self.maximum = maximum
+        self.rng = rng
+
+    def delay(self, attempt, retry_after=None):
+        """Пауза перед попыткой номер attempt (с единицы)."""
+        ceiling = min(self.maximum, self.base * 2 ** max(attempt - 1, 0))
+        delay = self.rng.uniform(ceiling / 2, ceiling)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitBreaker:
+    """Размыкатель: после threshold сбоев подряд запросы не выполняются.
+
+    Сбоями считаются только ошибки вышестоящего сервиса из trip_on, а не
+    ошибки отдельной подписки. Через reset_timeout пропускается один
+    пробный запрос: успех замыкает цепь, сбой размыкает ее снова.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 reset_timeout=BREAKER_RESET, trip_on=UPSTREAM_ERRORS,
+                 clock=time.monotonic):
+        """Порог сбоев, время до пробного запроса и учитываемые ошибки."""
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.trip_on = trip_on
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def is_open(self):
+        """Цепь разомкнута."""
+        return self.opened_at is not None
+
+    def allow(self):
+        """Можно ли выполнить запрос."""
+        if self.opened_at is None:
+            return True
+        if self.probing or self.remaining() > 0:
+            return False
+        self.probing = True
+        return True
+
+    def remaining(self):
+        """Сколько осталось до пробного запроса."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.reset_timeout - self.clock())
+
+    def success(self):
+        """Запрос прошел успешно."""
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self, error):
+        """Запрос завершился ошибкой; возвращаем True, если она учтена."""
+        if not isinstance(error, self.trip_on):
+            if self.probing:
+                self.success()
+            return False
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = self.clock()
+            self.probing = False
+        return True
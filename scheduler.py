@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import os
+import random
+import time
+
+POLL_DEFAULT = int(os.getenv('POLL_DEFAULT', 600))
+POLL_REVIEWING = int(os.getenv('POLL_REVIEWING', 120))
+POLL_IDLE = int(os.getenv('POLL_IDLE', 1800))
+POLL_JITTER = float(os.getenv('POLL_JITTER', 0.1))
+POLL_BUDGET = float(os.getenv('POLL_BUDGET', 50))
+
+
+class IntervalPolicy:
+    """Интервал опроса по статусам незавершенных работ подписки.
+
+    Пока работа на проверке, опрашиваем чаще; когда работ нет или все
+    приняты — реже. Случайный разброс не дает подпискам синхронизироваться.
+    """
+
+    def __init__(self, default=POLL_DEFAULT, reviewing=POLL_REVIEWING,
+                 idle=POLL_IDLE, jitter=POLL_JITTER, rng=random):
+        """Интервалы в секундах, доля разброса и источник случайности."""
+        self.default = default
+        self.reviewing = reviewing
+        self.idle = idle
+        self.jitter = jitter
+        self.rng = rng
+
+    def base_interval(self, statuses):
+        """Интервал без разброса."""
+        statuses = set(statuses)
+        if 'reviewing' in statuses:
+            return self.reviewing
+        if statuses:
+            return self.default
+        return self.idle
+
+    def interval(self, statuses):
+        """Интервал с разбросом ±jitter."""
+        base = self.base_interval(statuses)
+        return base * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class PollScheduler:
+    """Очередь опросов на куче с общим бюджетом запросов в секунду.
+
+    Перепланирование стоит O(log n). Устаревшие записи кучи отбрасываются
+    лениво при извлечении.
+    """
+
+    def __init__(self, budget=POLL_BUDGET, clock=time.monotonic):
+        """Бюджет запросов в секунду (0 — без ограничения) и часы."""
+        self.heap = []
+        self.due = {}
+        self.counter = itertools.count()
+        self.budget = budget
+        self.clock = clock
+        self.tokens = max(budget, 1)
+        self.updated = clock()
+
+    def __len__(self):
+        """Количество запланированных подписок."""
+        return len(self.due)
+
+    def __contains__(self, key):
+        """Запланирована ли подписка."""
+        return key in self.due
+
+    def schedule(self, key, delay):
+        """Планируем опрос подписки через delay секунд."""
+        due = self.clock() + delay
+        self.due[key] = due
+        heapq.heappush(self.heap, (due, next(self.counter), key))
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [
+                entry for entry in self.heap
+                if self.due.get(entry[2]) == entry[0]
+            ]
+            heapq.heapify(self.heap)
+
+    def remove(self, key):
+        """Снимаем подписку с расписания."""
+        self.due.pop(key, None)
+
+    def next_time(self):
+        """Время ближайшего опроса или None."""
+        heap = self.heap
+        while heap and self.due.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def refill(self, now):
+        """Пополняем бюджет запросов."""
+        if self.budget:
+            self.tokens = min(
+                max(self.budget, 1),
+                self.tokens + (now - self.updated) * self.budget)
+        self.updated = now
+
+    def pop_due(self, lags=None, limit=None):
+        """Извлекаем подписки, чей опрос наступил, в пределах бюджета.
+
+        Если передан список lags, в него добавляется опоздание каждой
+        извлеченной подписки относительно расписания. limit ограничивает
+        число извлекаемых подписок; остальные ждут следующего вызова.
+        """
+        now = self.clock()
+        self.refill(now)
+        ready = []
+        while True:
+            due = self.next_time()
+            if due is None or due > now:
+                break
+            if self.budget and self.tokens < 1:
+                break
+            if limit is not None and len(ready) >= limit:
+                break
+            key = heapq.heappop(self.heap)[2]
+            del self.due[key]
+            if self.budget:
+                self.tokens -= 1
+            ready.append(key)
+            if lags is not None:
+                lags.append(now - due)
+        return ready
+
+    def wait_time(self):
+        """Сколько ждать до следующего опроса с учетом бюджета."""
+        due = self.next_time()
+        if due is None:
+            return None
+        now = self.clock()
+        wait = max(0, due - now)
+        if self.budget and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.budget)
+        return wait
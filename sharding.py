@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+from bisect import bisect
+
+SHARD_DB = os.getenv('SHARD_DB', '')
+SHARD_WORKER_ID = os.getenv('SHARD_WORKER_ID', '')
+SHARD_TTL = float(os.getenv('SHARD_TTL', 90))
+SHARD_REPLICAS = int(os.getenv('SHARD_REPLICAS', 64))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    uid TEXT PRIMARY KEY,
+    owner TEXT,
+    expires REAL NOT NULL,
+    cursor INTEGER
+);
+CREATE TABLE IF NOT EXISTS status_requests (
+    uid TEXT NOT NULL,
+    chat_id NOT NULL,
+    created REAL NOT NULL
+);
+'''
+
+
+def ring_hash(value):
+    """Целочисленный хеш строки для кольца."""
+    return int.from_bytes(
+        hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def default_worker_id():
+    """Идентификатор воркера: хост и номер процесса."""
+    return SHARD_WORKER_ID or f'{socket.gethostname()}-{os.getpid()}'
+
+
+class HashRing:
+    """Консистентное хеширование с виртуальными узлами.
+
+    При добавлении или уходе воркера переезжает только доля подписок,
+    примерно равная 1/N.
+    """
+
+    def __init__(self, nodes, replicas=SHARD_REPLICAS):
+        """Кольцо из узлов nodes по replicas точек на узел."""
+        points = sorted(
+            (ring_hash(f'{node}#{replica}'), node)
+            for node in nodes for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node(self, key):
+        """Узел, которому принадлежит ключ, или None для пустого кольца."""
+        if not self.nodes:
+            return None
+        index = bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.nodes[index]
+
+
+class LeaseTable:
+    """Таблица воркеров и аренд подписок в общей базе SQLite.
+
+    Воркер продлевает свою запись и все свои аренды раз в интервал
+    перезагрузки. Подписку опрашивает только владелец действующей
+    аренды; чужую аренду можно забрать, лишь когда она истекла или
+    освобождена, поэтому одну подписку не опрашивают два воркера.
+    Вместе с арендой хранится отметка from_date, и новый владелец
+    продолжает опрос с того же места.
+    """
+
+    def __init__(self, path, worker_id=None, ttl=SHARD_TTL,
+                 clock=time.time):
+        """Путь к базе, идентификатор воркера, срок аренды и часы."""
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def heartbeat(self):
+        """Продлеваем запись воркера; возвращаем живых воркеров."""
+        now = self.clock()
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO workers (worker_id, expires) VALUES (?, ?) '
+                'ON CONFLICT (worker_id) DO UPDATE SET expires = ?',
+                (self.worker_id, now + self.ttl, now + self.ttl))
+            self.connection.execute(
+                'DELETE FROM workers WHERE expires < ?', (now,))
+            rows = self.connection.execute(
+                'SELECT worker_id FROM workers ORDER BY worker_id')
+            return [row[0] for row in rows]
+
+    def renew(self, cursors):
+        """Продлеваем аренды; возвращаем uid, которые еще наши.
+
+        cursors — словарь uid -> отметка from_date.
+        """
+        expires = self.clock() + self.ttl
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE leases SET expires = ?, cursor = ? '
+                'WHERE uid = ? AND owner = ?',
+                [(expires, cursor, uid, self.worker_id)
+                 for uid, cursor in cursors.items()])
+            rows = self.connection.execute(
+                'SELECT uid FROM leases WHERE owner = ?', (self.worker_id,))
+            return {row[0] for row in rows} & set(cursors)
+
+    def acquire(self, uids):
+        """Берем свободные или истекшие аренды; возвращаем uid -> отметка."""
+        now = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO leases (uid, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (uid) DO UPDATE SET '
+                'owner = excluded.owner, expires = excluded.expires '
+                'WHERE leases.owner IS NULL OR leases.owner = excluded.owner '
+                'OR leases.expires < ?',
+                [(uid, self.worker_id, now + self.ttl, now) for uid in uids])
+            acquired = {}
+            for uid in uids:
+                row = self.connection.execute(
+                    'SELECT cursor FROM leases WHERE uid = ? AND owner = ?',
+                    (uid, self.worker_id)).fetchone()
+                if row is not None:
+                    acquired[uid] = row[0]
+            return acquired
+
+    def release(self, cursors):
+        """Освобождаем аренды, сохраняя отметки from_date."""
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE leases SET owner = NULL, expires = 0, cursor = ? '
+                'WHERE uid = ? AND owner = ?',
+                [(cursor, uid, self.worker_id)
+                 for uid, cursor in cursors.items()])
+
+    def drop(self, uids):
+        """Удаляем аренды отписанных подписок вместе с отметками."""
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM leases WHERE uid = ?', [(uid,) for uid in uids])
+
+    def request_status(self, requests):
+        """Запросы /status к владельцам подписок: пары (uid, чат)."""
+        now = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO status_requests (uid, chat_id, created) '
+                'VALUES (?, ?, ?)',
+                [(uid, chat_id, now) for uid, chat_id in requests])
+
+    def take_status_requests(self, uids):
+        """Забираем запросы /status к подпискам uids; возвращаем чаты.
+
+        Запросы, которые никто не забрал за срок аренды, удаляются.
+        """
+        uids = set(uids)
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM status_requests WHERE created < ?',
+                (self.clock() - self.ttl,))
+            rows = self.connection.execute(
+                'SELECT rowid, uid, chat_id FROM status_requests'
+            ).fetchall()
+            taken = [row for row in rows if row[1] in uids]
+            self.connection.executemany(
+                'DELETE FROM status_requests WHERE rowid = ?',
+                [(row[0],) for row in taken])
+        chats = []
+        for _, _, chat_id in taken:
+            if chat_id not in chats:
+                chats.append(chat_id)
+        return chats
+
+    def leave(self):
+        """Удаляем запись воркера."""
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM workers WHERE worker_id = ?', (self.worker_id,))
+
+    def close(self):
+        """Закрываем соединение с базой."""
+        self.connection.close()
+
+
+class ShardedRegistry:
+    """Часть подписок реестра, принадлежащая этому воркеру.
+
+    Движок работает с ним как с обычным реестром: при каждой
+    перезагрузке перечитывается файл, продлеваются аренды, кольцо
+    строится заново по живым воркерам, и движку возвращаются
+    подписки, которые стали нашими или перестали ими быть.
+    """
+
+    def __init__(self, registry, leases, replicas=SHARD_REPLICAS):
+        """Полный реестр подписок и таблица аренд."""
+        self.registry = registry
+        self.leases = leases
+        self.replicas = replicas
+        self.path = registry.path
+        self.owned = {}
+
+    def __len__(self):
+        """Количество подписок воркера."""
+        return len(self.owned)
+
+    def __iter__(self):
+        """Перебор подписок воркера."""
+        return iter(tuple(self.owned.values()))
+
+    def cursors(self, subscriptions):
+        """Отметки from_date подписок по uid."""
+        return {
+            subscription.uid: subscription.cursor
+            for subscription in subscriptions
+        }
+
+    def wanted(self):
+        """Подписки, которые кольцо отдает этому воркеру."""
+        ring = HashRing(self.leases.heartbeat(), self.replicas)
+        worker_id = self.leases.worker_id
+        return {
+            subscription.uid: subscription
+            for subscription in self.registry
+            if ring.node(subscription.uid) == worker_id
+        }
+
+    def reload(self):
+        """Перераспределяем подписки; возвращаем (добавленные, удаленные)."""
+        self.registry.reload()
+        wanted = self.wanted()
+        kept = self.leases.renew(self.cursors(self.owned.values()))
+        removed = [
+            subscription for uid, subscription in self.owned.items()
+            if uid not in kept or uid not in wanted
+            or wanted[uid] is not subscription
+        ]
+        self.leases.release(self.cursors(
+            subscription for subscription in removed
+            if subscription.uid in kept))
+        for subscription in removed:
+            del self.owned[subscription.uid]
+        acquired = self.leases.acquire(
+            [uid for uid in wanted if uid not in self.owned])
+        added = []
+        for uid, cursor in acquired.items():
+            subscription = wanted[uid]
+            if cursor is not None:
+                subscription.cursor = cursor
+            self.owned[uid] = subscription
+            added.append(subscription)
+        if added or removed:
+            logging.info(
+                'Шард %s: +%s, -%s, всего %s', self.leases.worker_id,
+                len(added), len(removed), len(self.owned))
+        return added, removed
+
+    def subscribe(self, subscription):
+        """Добавляем подписку в общий файл подписок."""
+        return self.registry.subscribe(subscription)
+
+    def claim(self, subscription):
+        """Берем новую подписку, если кольцо отдает ее этому воркеру.
+
+        Иначе ее подхватит владелец при своей следующей перезагрузке.
+        """
+        ring = HashRing(self.leases.heartbeat(), self.replicas)
+        uid = subscription.uid
+        if ring.node(uid) != self.leases.worker_id:
+            return False
+        if uid not in self.leases.acquire([uid]):
+            return False
+        self.owned[uid] = subscription
+        return True
+
+    def forward_status(self, chat_id):
+        """Передаем /status владельцам чужих подписок чата; возвращаем их."""
+        remote = [
+            subscription for subscription in self.registry
+            if str(subscription.chat_id) == str(chat_id)
+            and subscription.uid not in self.owned
+        ]
+        self.leases.request_status(
+            (subscription.uid, subscription.chat_id)
+            for subscription in remote)
+        return remote
+
+    def status_requests(self):
+        """Чаты, спросившие /status о подписках этого воркера."""
+        return self.leases.take_status_requests(self.owned)
+
+    def unsubscribe(self, chat_id):
+        """Удаляем подписки чата из файла и их аренды."""
+        removed = self.registry.unsubscribe(chat_id)
+        for subscription in removed:
+            self.owned.pop(subscription.uid, None)
+        self.leases.drop([subscription.uid for subscription in removed])
+        return removed
+
+    def close(self):
+        """Отдаем аренды с отметками и выходим из кольца."""
+        self.leases.release(self.cursors(self.owned.values()))
+        self.owned.clear()
+        self.leases.leave()
+        self.leases.close()
+
+
+def shard(registry, path=SHARD_DB, worker_id=None):
+    """Реестр шарда этого воркера с уже разобранными подписками."""
+    sharded = ShardedRegistry(registry, LeaseTable(path, worker_id))
+    sharded.reload()
+    return sharded
+
+
+def run_worker(number, path):
+    """Процесс пула: свой шард, свое состояние и свой порт метрик.
+
+    Идентификатор воркера не зависит от pid, поэтому перезапущенный
+    воркер сразу забирает свои прежние аренды. Команды Telegram
+    принимает только нулевой воркер: getUpdates одного бота нельзя
+    опрашивать из нескольких процессов.
+    """
+    import engine
+    import homework
+    import logs
+    import metrics
+    import traffic
+    from state import STATE_DIR, load_state
+
+    logs.setup_logging()
+    registry = shard(
+        homework.load_subscriptions(), path,
+        f'{SHARD_WORKER_ID or socket.gethostname()}-{number}')
+    if metrics.METRICS_PORT:
+        metrics.serve(metrics.METRICS_PORT + number)
+    state = load_state(path=os.path.join(STATE_DIR, f'worker-{number}'))
+    engine.serve(
+        registry, state, commands=engine.COMMANDS_ENABLED and number == 0,
+        capture=traffic.worker_trace(traffic.TRAFFIC_CAPTURE, number))
+
+
+def main(argv=None):
+    """Запускаем пул воркеров на одном хосте."""
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(
+        description='Опрос подписок пулом процессов с шардированием')
+    parser.add_argument('-w', '--workers', type=int,
+                        default=os.cpu_count())
+    parser.add_argument('--db', default=SHARD_DB or 'state/shards.sqlite')
+    args = parser.parse_args(argv)
+    os.makedirs(os.path.dirname(args.db) or '.', exist_ok=True)
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(number, args.db))
+        for number in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import json
+import random
+import time
+
+import engine
+import exceptions
+from bench import percentile
+from clock import VirtualClock
+from scheduler import (
+    POLL_DEFAULT, POLL_IDLE, POLL_JITTER, POLL_REVIEWING, IntervalPolicy,
+    PollScheduler
+)
+from state import MemoryState
+
+DAY = 86400
+MIN_STEP = 1e-6
+FINISHED = (None, 'approved')
+SIMULATED_ERROR = exceptions.ApiServerError('Сбой API в симуляции')
+
+
+class Students:
+    """Модель API: студенты сдают работы, ревьюеры их проверяют.
+
+    Подписка без незавершенной работы сдает новую в среднем submissions
+    раз в сутки. Проверка длится в среднем review секунд и отклоняет
+    работу с вероятностью reject; доработка занимает в среднем fix
+    секунд. Все промежутки экспоненциальные. События подписки
+    разыгрываются лениво, когда ее опрашивают, поэтому модель не
+    тратит время на подписки между опросами.
+    """
+
+    def __init__(self, count, rng, submissions=1.0, review=6 * 3600,
+                 fix=12 * 3600, reject=0.3, start=0.0):
+        """Число подписок, генератор случайных чисел и параметры модели."""
+        self.rng = rng
+        self.submit_rate = submissions / DAY
+        self.review_rate = 1 / review
+        self.fix_rate = 1 / fix
+        self.reject = reject
+        self.status = [None] * count
+        self.homework = [0] * count
+        self.next_at = [
+            start + rng.expovariate(self.submit_rate) for _ in range(count)]
+        self.changes = [None] * count
+        self.transitions = 0
+
+    def transition(self, key):
+        """Очередная смена статуса работы подписки."""
+        rng = self.rng
+        at = self.next_at[key]
+        status = self.status[key]
+        if status == 'reviewing':
+            if rng.random() < self.reject:
+                status, rate = 'rejected', self.fix_rate
+            else:
+                status, rate = 'approved', self.submit_rate
+        else:
+            if status in FINISHED:
+                self.homework[key] += 1
+            status, rate = 'reviewing', self.review_rate
+        self.status[key] = status
+        self.next_at[key] = at + rng.expovariate(rate)
+        if self.changes[key] is None:
+            self.changes[key] = {}
+        self.changes[key][self.homework[key]] = (status, at)
+        self.transitions += 1
+
+    def poll(self, key, now):
+        """Работы, сменившие статус с прошлого опроса: время смены."""
+        while self.next_at[key] <= now:
+            self.transition(key)
+        changes = self.changes[key]
+        if changes is None:
+            return ()
+        self.changes[key] = None
+        return [at for _, at in changes.values()]
+
+    def active(self, key):
+        """Статусы незавершенных работ, какими их видел последний опрос."""
+        status = self.status[key]
+        return () if status in FINISHED else (status,)
+
+
+class Simulation:
+    """Опрос подписок в виртуальном времени.
+
+    Расписание, бюджет, размыкатель и паузы — у настоящего PollEngine
+    на виртуальных часах: симуляция лишь подменяет запрос к API моделью
+    и спрашивает у движка паузу до следующего опроса, поэтому его
+    логика и симуляция не расходятся. Генератор случайных чисел один
+    с общим seed, поэтому прогон воспроизводим, а ожидание между
+    опросами занимает ноль времени.
+    outages — список пар (начало, конец) в секундах, когда API
+    отвечает ошибкой сервера.
+
+    При sample меньше единицы моделируется только эта доля подписок
+    с той же долей бюджета, а итоговые количества пересчитываются на
+    все подписки. Подписки независимы и делят только бюджет, поэтому
+    задержки и загрузка бюджета почти не меняются, а прогон недель
+    опроса 50 тыс. подписок укладывается в секунды.
+    """
+
+    def __init__(self, count, policy=None, budget=None, seed=0,
+                 outages=(), sample=1.0, **model):
+        """Число подписок, политика интервалов, бюджет и параметры модели."""
+        self.sample = sample
+        count = max(1, round(count * sample))
+        budget = engine.poll_budget() if budget is None else budget
+        budget *= sample
+        self.clock = VirtualClock()
+        self.rng = random.Random(seed)
+        policy = policy if policy is not None else IntervalPolicy()
+        policy.rng = self.rng
+        self.poller = engine.PollEngine(
+            None, state=MemoryState(), policy=policy,
+            scheduler=PollScheduler(budget, clock=self.clock.monotonic),
+            clock=self.clock)
+        self.poller.backoff.rng = self.rng
+        self.scheduler = self.poller.scheduler
+        self.students = Students(count, self.rng, **model)
+        self.outages = outages
+        self.requests = 0
+        self.errors = 0
+        self.latencies = []
+        self.minutes = []
+        self.late = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        for key in range(count):
+            self.scheduler.schedule(key, 0)
+
+    def failing(self, now):
+        """Отвечает ли API ошибкой в момент now."""
+        return any(start <= now < end for start, end in self.outages)
+
+    def request(self, key, now):
+        """Запрос к модели API; возвращает ошибку или None."""
+        self.requests += 1
+        minute = int(now // 60)
+        if minute >= len(self.minutes):
+            self.minutes.extend([0] * (minute + 1 - len(self.minutes)))
+        self.minutes[minute] += 1
+        if self.outages and self.failing(now):
+            self.errors += 1
+            return SIMULATED_ERROR
+        self.latencies.extend(
+            now - at for at in self.students.poll(key, now))
+        return None
+
+    def poll(self, key):
+        """Опрос подписки; паузу до следующего опроса выбирает движок."""
+        poller = self.poller
+        if not poller.breaker.allow():
+            delay = poller.blocked_delay()
+        else:
+            error = self.request(key, self.clock.now)
+            if error is None:
+                poller.breaker.success()
+                statuses = self.students.active(key)
+            else:
+                poller.breaker.failure(error)
+                statuses = ()
+            delay = poller.delay_after(key, statuses, error)
+        self.scheduler.schedule(key, delay)
+
+    def run(self, duration):
+        """Прогоняем duration секунд виртуального времени.
+
+        Если ожидание бюджета меньше погрешности float и часы не
+        сдвинулись, они сдвигаются на MIN_STEP, иначе цикл бы встал.
+        """
+        clock, scheduler = self.clock, self.scheduler
+        end = clock.now + duration
+        lags = []
+        while True:
+            wait = scheduler.wait_time()
+            if wait is None or clock.now + wait >= end:
+                break
+            moment = clock.now
+            clock.advance(wait)
+            if wait and clock.now == moment:
+                clock.advance(MIN_STEP)
+            for key in scheduler.pop_due(lags):
+                self.poll(key)
+            for lag in lags:
+                if lag > 1:
+                    self.late += 1
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+            lags.clear()
+        clock.advance_to(end)
+        return self.result(duration)
+
+    def result(self, duration):
+        """Счетчики прогона в пересчете на все подписки."""
+        count = len(self.students.status)
+        budget = self.scheduler.budget
+        busiest = max(self.minutes, default=0) / 60
+        notifications = len(self.latencies)
+        scale = 1 / self.sample
+        return {
+            'subscriptions': round(count * scale),
+            'simulated': count,
+            'requests': round(self.requests * scale),
+            'requests_per_subscription_day': (
+                self.requests / count / (duration / DAY)),
+            'errors': round(self.errors * scale),
+            'transitions': round(self.students.transitions * scale),
+            'notifications': round(notifications * scale),
+            'collapsed': round(
+                (self.students.transitions - notifications) * scale),
+            'latency_p50': percentile(self.latencies, 0.5),
+            'latency_p90': percentile(self.latencies, 0.9),
+            'latency_p99': percentile(self.latencies, 0.99),
+            'latency_max': max(self.latencies, default=None),
+            'requests_per_sec': self.requests * scale / duration,
+            'budget_mean': (
+                self.requests / duration / budget if budget else None),
+            'budget_peak': busiest / budget if budget else None,
+            'late_polls': round(self.late * scale),
+            'lag_mean': self.lag_total / max(self.requests, 1),
+            'lag_max': self.lag_max,
+        }
+
+
+def parse_policy(text, jitter=POLL_JITTER):
+    """Политика из строки «default,reviewing,idle» в секундах."""
+    default, reviewing, idle = (float(part) for part in text.split(','))
+    return IntervalPolicy(default, reviewing, idle, jitter)
+
+
+def parse_outage(text):
+    """Сбой API из строки «начало:длительность» в часах."""
+    start, length = (float(part) * 3600 for part in text.split(':'))
+    return start, start + length
+
+
+def simulate(args, text):
+    """Прогон одной политики с замером реального времени."""
+    simulation = Simulation(
+        args.subscriptions, parse_policy(text, args.jitter), args.budget,
+        args.seed, [parse_outage(item) for item in args.outage],
+        args.sample, submissions=args.submissions, review=args.review * 3600,
+        fix=args.fix * 3600, reject=args.reject)
+    started = time.perf_counter()
+    result = simulation.run(args.days * DAY)
+    result['policy'] = text
+    result['elapsed'] = time.perf_counter() - started
+    return result
+
+
+def parse_args(argv=None):
+    """Параметры симуляции."""
+    parser = argparse.ArgumentParser(
+        description='Опрос подписок в виртуальном времени')
+    parser.add_argument('-n', '--subscriptions', type=int, default=1000)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument(
+        '--policy', action='append',
+        help='интервалы default,reviewing,idle в секундах; можно несколько')
+    parser.add_argument('--jitter', type=float, default=POLL_JITTER)
+    parser.add_argument('--budget', type=float, default=engine.poll_budget(),
+                        help='запросов в секунду, 0 — без ограничения')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample', type=float, default=1.0,
+                        help='моделируемая доля подписок, бюджет делится '
+                             'в той же доле')
+    parser.add_argument('--submissions', type=float, default=1.0,
+                        help='сдач работ в сутки на подписку')
+    parser.add_argument('--review', type=float, default=6,
+                        help='средняя проверка, часы')
+    parser.add_argument('--fix', type=float, default=12,
+                        help='средняя доработка, часы')
+    parser.add_argument('--reject', type=float, default=0.3)
+    parser.add_argument('--outage', action='append', default=[],
+                        help='сбой API «начало:длительность» в часах')
+    args = parser.parse_args(argv)
+    if not args.policy:
+        args.policy = [f'{POLL_DEFAULT},{POLL_REVIEWING},{POLL_IDLE}']
+    return args
+
+
+def main(argv=None):
+    """Сравнение политик интервалов на одной модели нагрузки."""
+    args = parse_args(argv)
+    results = [simulate(args, text) for text in args.policy]
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
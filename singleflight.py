@@ -0,0 +1,110 @@
+import asyncio
+
+import metrics
+
+COALESCED = metrics.Counter(
+    'bot_coalesced_polls_total',
+    'Опросы, получившие ответ уже идущего запроса с тем же токеном')
+
+
+class TokenRequest:
+    """Запрос к API от имени токена, общий для нескольких подписок.
+
+    У общего запроса нет ключа кеша: кеш ответов помнит, что обработала
+    конкретная подписка, и его попадание скрыло бы работы от остальных.
+    """
+
+    __slots__ = ('token',)
+
+    key = None
+
+    def __init__(self, token):
+        """Токен Практикума."""
+        self.token = token
+
+    @property
+    def headers(self):
+        """Заголовки запроса к API для токена."""
+        return {'Authorization': f'OAuth {self.token}'}
+
+    def __repr__(self):
+        """Представление без токена, чтобы он не попал в логи."""
+        return 'TokenRequest()'
+
+
+class TokenGroups:
+    """Ключи подписок по токенам: какие токены общие для нескольких чатов."""
+
+    def __init__(self):
+        """Пустые группы."""
+        self.keys = {}
+
+    def add(self, subscription):
+        """Подписка начала опрашиваться."""
+        self.keys.setdefault(subscription.token, set()).add(subscription.key)
+
+    def discard(self, subscription):
+        """Подписка больше не опрашивается."""
+        keys = self.keys.get(subscription.token, set())
+        keys.discard(subscription.key)
+        if not keys:
+            self.keys.pop(subscription.token, None)
+
+    def shared(self, subscription):
+        """Токен подписки опрашивается и для других чатов."""
+        return len(self.keys.get(subscription.token, ())) > 1
+
+
+class Flight:
+    """Идущий общий запрос и число ожидающих его опросов."""
+
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future):
+        """Задача запроса."""
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Один запрос на ключ для одновременных опросов в event loop.
+
+    Первый опрос запускает запрос, остальные с тем же ключом ждут его
+    результат или ошибку. Отмена одного ожидающего не прерывает запрос
+    для других; запрос отменяется, когда его больше никто не ждет.
+    """
+
+    def __init__(self):
+        """Идущие запросы по ключам."""
+        self.flights = {}
+
+    def __len__(self):
+        """Количество идущих запросов."""
+        return len(self.flights)
+
+    def __contains__(self, key):
+        """Идет ли запрос с ключом key."""
+        return key in self.flights
+
+    def land(self, key, flight):
+        """Запрос завершился: следующий опрос запустит новый."""
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def do(self, key, function, *args):
+        """Результат function(*args), общий для опросов с ключом key."""
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(function(*args)))
+            self.flights[key] = flight
+            flight.future.add_done_callback(
+                lambda future: self.land(key, flight))
+        else:
+            COALESCED.inc()
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters:
+                flight.future.cancel()
@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import random
+import re
+import time
+import zlib
+from bisect import bisect
+from collections import Counter
+from http import HTTPStatus
+
+from aiohttp import web
+
+import homework
+import traffic
+
+API_PATH = '/api/user_api/homework_statuses/'
+TELEGRAM_PATH = '/bot{token}/sendMessage'
+MESSAGE_RE = re.compile(r'работы "([^"]+)"\. (.+)$')
+VERDICTS = {
+    verdict: status for status, verdict in homework.HOMEWORK_STATUSES.items()
+}
+NEXT_STATUS = {'reviewing': 'rejected', 'rejected': 'reviewing'}
+REPLAY_ERRORS = {
+    'ApiRateLimitError': HTTPStatus.TOO_MANY_REQUESTS,
+    'ApiAnswerError': HTTPStatus.BAD_REQUEST,
+}
+
+
+class Stand:
+    """Локальная замена API Практикума и Bot API для нагрузочных замеров.
+
+    На каждый запрос подписки с вероятностью change_rate одна из ее работ
+    меняет статус; время изменения запоминается, и по приходу уведомления
+    в фейковый Telegram считается задержка от опроса до уведомления.
+    Задержки ответа, доля ошибок и 429 настраиваются отдельно для API
+    и для Telegram.
+    """
+
+    def __init__(self, homeworks=5, payload=0, change_rate=0.2,
+                 latency=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 telegram_latency=0.0, telegram_error_rate=0.0,
+                 telegram_rate_limit_rate=0.0, etag=False):
+        """Размер ответа, частота изменений, отказы и поддержка ETag."""
+        self.homeworks = homeworks
+        self.padding = 'x' * payload
+        self.change_rate = change_rate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.telegram_latency = telegram_latency
+        self.telegram_error_rate = telegram_error_rate
+        self.telegram_rate_limit_rate = telegram_rate_limit_rate
+        self.etag = etag
+        self.versions = Counter()
+        self.tokens = {}
+        self.changed = {}
+        self.latencies = []
+        self.counters = Counter()
+
+    def homeworks_of(self, token):
+        """Работы подписки; создаются при первом запросе."""
+        homeworks = self.tokens.get(token)
+        if homeworks is None:
+            homeworks = self.tokens[token] = [
+                {
+                    'id': number,
+                    'homework_name': f'{token}/hw{number}',
+                    'status': 'reviewing',
+                    'lesson_name': 'Стенд',
+                    'reviewer_comment': self.padding,
+                    'date_updated': '2022-01-01T00:00:00Z',
+                }
+                for number in range(self.homeworks)
+            ]
+        return homeworks
+
+    def change(self, token, homeworks):
+        """Меняем статус случайной работы и запоминаем время."""
+        if not homeworks or random.random() >= self.change_rate:
+            return
+        self.versions[token] += 1
+        item = random.choice(homeworks)
+        item['status'] = NEXT_STATUS[item['status']]
+        self.changed[item['homework_name'], item['status']] = time.time()
+        self.counters['changes'] += 1
+
+    @staticmethod
+    def fault(error_rate, rate_limit_rate):
+        """Случайный отказ: код ответа или None."""
+        roll = random.random()
+        if roll < rate_limit_rate:
+            return HTTPStatus.TOO_MANY_REQUESTS
+        if roll < rate_limit_rate + error_rate:
+            return HTTPStatus.INTERNAL_SERVER_ERROR
+        return None
+
+    async def homework_statuses(self, request):
+        """Фейковый homework_statuses."""
+        self.counters['polls'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        status = self.fault(self.error_rate, self.rate_limit_rate)
+        if status is not None:
+            self.counters[f'api_{status.value}'] += 1
+            return web.Response(status=status, headers={'Retry-After': '1'})
+        token = request.headers.get('Authorization', '').partition(' ')[2]
+        homeworks = self.homeworks_of(token)
+        self.change(token, homeworks)
+        headers = {}
+        if self.etag:
+            headers['ETag'] = f'"{token}-{self.versions[token]}"'
+            if request.headers.get('If-None-Match') == headers['ETag']:
+                self.counters['not_modified'] += 1
+                return web.Response(
+                    status=HTTPStatus.NOT_MODIFIED, headers=headers)
+        return web.json_response(
+            {'homeworks': homeworks, 'current_date': int(time.time())},
+            headers=headers)
+
+    def received(self, text):
+        """Сопоставляем части уведомления с изменениями статусов."""
+        now = time.time()
+        for part in text.split('\n\n'):
+            match = MESSAGE_RE.search(part)
+            if match is None:
+                self.counters['other_messages'] += 1
+                continue
+            key = match.group(1), VERDICTS.get(match.group(2))
+            changed_at = self.changed.pop(key, None)
+            if changed_at is not None:
+                self.latencies.append(now - changed_at)
+            self.counters['notifications'] += 1
+
+    async def send_message(self, request):
+        """Фейковый sendMessage."""
+        self.counters['sends'] += 1
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        status = self.fault(
+            self.telegram_error_rate, self.telegram_rate_limit_rate)
+        if status is not None:
+            self.counters[f'telegram_{status.value}'] += 1
+            return web.json_response(
+                {'ok': False, 'parameters': {'retry_after': 1}},
+                status=status)
+        data = await request.json()
+        self.received(data.get('text', ''))
+        return web.json_response({'ok': True, 'result': {}})
+
+    async def stats(self, request):
+        """Счетчики стенда и задержки уведомлений."""
+        return web.json_response(
+            {'counters': self.counters, 'latencies': self.latencies})
+
+    def app(self):
+        """Приложение aiohttp со всеми маршрутами стенда."""
+        app = web.Application()
+        app.router.add_get(API_PATH, self.homework_statuses)
+        app.router.add_post(TELEGRAM_PATH, self.send_message)
+        app.router.add_get('/_stats', self.stats)
+        return app
+
+
+class ReplayStand(Stand):
+    """Ответы API из записанной трассы в ускоренном времени.
+
+    Время трассы идет с первого запроса в speed раз быстрее настоящего.
+    Подписка bench-N получает события N-го аккаунта трассы, по кругу,
+    если подписок больше, чем аккаунтов. Как и настоящий API с
+    from_date, стенд отдает работы из событий, наступивших после
+    прошлого ответа подписке, а записанную ошибку — кодом ответа;
+    работы до ошибки дождутся следующего успешного ответа. Смена статуса
+    засекается в момент ее наступления по времени трассы, поэтому
+    задержки уведомлений считаются так же, как у Stand.
+    """
+
+    def __init__(self, trace, speed=1.0, **options):
+        """Трасса, ускорение и параметры Stand для Telegram."""
+        super().__init__(**options)
+        self.trace = trace
+        self.speed = speed
+        self.accounts = sorted(trace.answers)
+        self.started = None
+        self.positions = Counter()
+        self.pending = {}
+        self.seen = {}
+
+    def elapsed(self):
+        """Время трассы с первого запроса, секунды."""
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        return (now - self.started) * self.speed
+
+    def account_of(self, token):
+        """Аккаунт трассы для токена подписки стенда."""
+        number = token.rpartition('-')[2]
+        index = int(number) if number.isdigit() else zlib.crc32(
+            token.encode())
+        return self.accounts[index % len(self.accounts)]
+
+    def collect(self, token, offset, homeworks):
+        """Работы наступившего события ждут ответа подписке."""
+        pending = self.pending.setdefault(token, {})
+        seen = self.seen.setdefault(token, {})
+        changed_at = self.started + offset / self.speed
+        for item in homeworks or ():
+            name = item.get('homework_name')
+            pending[name] = item
+            if seen.get(name) != item.get('status'):
+                seen[name] = item.get('status')
+                self.changed[name, item.get('status')] = changed_at
+                self.counters['changes'] += 1
+
+    def advance(self, token):
+        """Проходим наступившие события; последняя ошибка или None."""
+        events = self.trace.answers[self.account_of(token)]
+        position = self.positions[token]
+        elapsed = self.elapsed()
+        error = None
+        while position < len(events) and events[position][0] <= elapsed:
+            offset, error, homeworks = events[position]
+            self.collect(token, offset, homeworks)
+            position += 1
+        self.positions[token] = position
+        return error
+
+    async def homework_statuses(self, request):
+        """Ответ из трассы вместо случайных изменений."""
+        self.counters['polls'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        token = request.headers.get('Authorization', '').partition(' ')[2]
+        if not self.accounts:
+            return web.json_response(
+                {'homeworks': [], 'current_date': int(time.time())})
+        error = self.advance(token)
+        if error is not None:
+            status = REPLAY_ERRORS.get(
+                error, HTTPStatus.INTERNAL_SERVER_ERROR)
+            self.counters[f'api_{status.value}'] += 1
+            return web.Response(status=status, headers={'Retry-After': '1'})
+        homeworks = list(self.pending.pop(token, {}).values())
+        return web.json_response(
+            {'homeworks': homeworks, 'current_date': int(time.time())})
+
+    async def stats(self, request):
+        """Счетчики стенда и число отправок в трассе к этому моменту."""
+        if self.started is not None:
+            elapsed = self.elapsed()
+            self.counters['trace_seconds'] = elapsed
+            self.counters['recorded_sends'] = bisect(
+                self.trace.sends, elapsed)
+        return await super().stats(request)
+
+
+def make_stand(options):
+    """Стенд по параметрам: со случайными изменениями или из трассы."""
+    options = dict(options)
+    replay = options.pop('replay', None)
+    speed = options.pop('speed', 1.0)
+    if replay:
+        return ReplayStand(traffic.Trace.load(*replay), speed, **options)
+    return Stand(**options)
+
+
+async def start(stand, host='127.0.0.1', port=0):
+    """Запускаем стенд, возвращаем runner и адрес."""
+    runner = web.AppRunner(stand.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+def run(options, host='127.0.0.1', port=0, ready=None):
+    """Запускаем стенд до остановки процесса.
+
+    Адрес стенда передается в ready (Connection), если он задан.
+    """
+    async def serve():
+        runner, url = await start(make_stand(options), host, port)
+        if ready is not None:
+            ready.send(url)
+        print(f'Стенд запущен: {url}', flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(serve())
+
+
+def add_arguments(parser):
+    """Параметры стенда в командной строке."""
+    parser.add_argument('--homeworks', type=int, default=5)
+    parser.add_argument('--payload', type=int, default=0,
+                        help='байт комментария ревьюера на работу')
+    parser.add_argument('--change-rate', type=float, default=0.2)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument(
+        '--telegram-rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--etag', action='store_true',
+                        help='отдавать ETag и 304 Not Modified')
+    parser.add_argument('--replay', nargs='+', metavar='TRACE',
+                        help='отвечать записанным трафиком из трасс')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='ускорение времени трассы, например 100')
+
+
+def stand_options(args):
+    """Параметры Stand из разобранной командной строки."""
+    return {
+        'homeworks': args.homeworks,
+        'payload': args.payload,
+        'change_rate': args.change_rate,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+        'telegram_latency': args.telegram_latency,
+        'telegram_error_rate': args.telegram_error_rate,
+        'telegram_rate_limit_rate': args.telegram_rate_limit_rate,
+        'etag': args.etag,
+        'replay': args.replay,
+        'speed': args.speed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Локальная замена API Практикума и Telegram')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    arguments = parser.parse_args()
+    run(stand_options(arguments), arguments.host, arguments.port)
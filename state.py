@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from status_index import FINAL_STATUSES, StatusIndex
+
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'file')
+STATE_DIR = os.getenv('STATE_DIR', 'state')
+COMPACT_EVERY = int(os.getenv('STATE_COMPACT_EVERY', 10000))
+
+
+class MemoryState:
+    """Состояние опроса: отметки, статусы работ, ошибки и исходящие.
+
+    Каждое изменение описывается записью-кортежем, которая применяется
+    к памяти и передается в write(); наследники журналируют ее на диск.
+    Повторное применение тех же записей дает то же состояние.
+    """
+
+    def __init__(self):
+        """Пустое состояние."""
+        self.cursors = {}
+        self.messages = {}
+        self.index = StatusIndex()
+        self.names = {}
+        self.outbox = OrderedDict()
+        self.chats = {}
+        self.last_id = 0
+
+    def apply(self, record):
+        """Применяем запись журнала к состоянию в памяти."""
+        kind, uid = record[0], record[1]
+        if kind == 'c':
+            self.cursors[uid] = record[2]
+        elif kind == 'm':
+            if record[2]:
+                self.messages[uid] = record[2]
+            else:
+                self.messages.pop(uid, None)
+        elif kind == 's':
+            self.set_status(uid, *record[2:])
+        elif kind == 'o':
+            self.add_entry(uid, record[2], record[3])
+        elif kind == 'a':
+            self.remove_entry(uid)
+        elif kind == 'f':
+            self.cursors.pop(uid, None)
+            self.messages.pop(uid, None)
+            self.index.forget(uid)
+            self.names.pop(uid, None)
+
+    def set_status(self, uid, key, status, name=None):
+        """Статус работы; название храним, пока работа не завершена."""
+        self.index.set((uid, key), status)
+        if status in FINAL_STATUSES:
+            names = self.names.get(uid)
+            if names is not None:
+                names.pop(key, None)
+                if not names:
+                    del self.names[uid]
+        elif name is not None:
+            self.names.setdefault(uid, {})[key] = name
+
+    def add_entry(self, entry_id, chat_id, message):
+        """Добавляем сообщение в исходящие и в группу его чата."""
+        self.outbox[entry_id] = (chat_id, message)
+        self.chats.setdefault(str(chat_id), []).append(entry_id)
+        self.last_id = max(self.last_id, entry_id)
+
+    def remove_entry(self, entry_id):
+        """Убираем доставленное сообщение."""
+        entry = self.outbox.pop(entry_id, None)
+        if entry is None:
+            return
+        chat = str(entry[0])
+        entry_ids = self.chats[chat]
+        entry_ids.remove(entry_id)
+        if not entry_ids:
+            del self.chats[chat]
+
+    def write(self, record):
+        """Сохраняем запись; в памяти ничего делать не нужно."""
+
+    def record(self, *record):
+        """Применяем и сохраняем изменение."""
+        self.apply(record)
+        self.write(record)
+
+    def set_cursor(self, uid, cursor):
+        """Новая отметка from_date подписки."""
+        if self.cursors.get(uid) != cursor:
+            self.record('c', uid, cursor)
+
+    def set_message(self, uid, message):
+        """Последняя отправленная ошибка подписки, '' — ошибок нет."""
+        if self.messages.get(uid, '') != message:
+            self.record('m', uid, message)
+
+    def commit_homework(self, uid, record, chat_id, message):
+        """Фиксируем новый статус работы и ставим уведомление в очередь."""
+        self.record('s', uid, record.key, record.status, record.name)
+        return self.enqueue(chat_id, message)
+
+    def enqueue(self, chat_id, message):
+        """Добавляем сообщение в исходящие, возвращаем его номер."""
+        entry_id = self.last_id + 1
+        self.record('o', entry_id, chat_id, message)
+        return entry_id
+
+    def ack(self, entry_id):
+        """Сообщение доставлено."""
+        if entry_id in self.outbox:
+            self.record('a', entry_id)
+
+    def pending(self, chat_id=None):
+        """Недоставленные сообщения: (номер, чат, текст)."""
+        if chat_id is None:
+            entry_ids = self.outbox
+        else:
+            entry_ids = self.chats.get(str(chat_id), ())
+        return [
+            (entry_id, *self.outbox[entry_id]) for entry_id in entry_ids
+        ]
+
+    def pending_chats(self):
+        """Чаты, у которых есть недоставленные сообщения."""
+        return list(self.chats)
+
+    def forget(self, uid):
+        """Удаляем состояние подписки."""
+        self.record('f', uid)
+
+    def flush(self):
+        """Сбрасываем накопленные записи на диск."""
+
+    def close(self):
+        """Закрываем хранилище."""
+        self.flush()
+
+
+class FileState(MemoryState):
+    """Журнал изменений с периодическим сжатием в снимок.
+
+    При старте читается снимок, затем дочитывается журнал. Когда в журнале
+    накапливается compact_every записей, состояние записывается в новый
+    снимок, а журнал обнуляется.
+    """
+
+    def __init__(self, path=STATE_DIR, compact_every=COMPACT_EVERY):
+        """Каталог хранилища и порог сжатия журнала."""
+        super().__init__()
+        self.path = path
+        self.snapshot_path = os.path.join(path, 'snapshot.json')
+        self.journal_path = os.path.join(path, 'journal.jsonl')
+        self.compact_every = compact_every
+        self.records = 0
+        self.journal = None
+
+    def load(self):
+        """Восстанавливаем состояние из снимка и журнала."""
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as file:
+                self.restore(json.load(file))
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.journal_path, encoding='utf-8') as file:
+                damaged = self.replay(file)
+        except FileNotFoundError:
+            damaged = False
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        if damaged:
+            self.compact()
+        logging.info(
+            'Состояние восстановлено: подписок %s, работ %s, исходящих %s',
+            len(self.cursors), len(self.index), len(self.outbox))
+        return self
+
+    def replay(self, file):
+        """Применяем записи журнала; True, если журнал поврежден.
+
+        Оборванная запись пропускается. Дописывать после нее нельзя:
+        новая запись склеится с обрывком и пропадет при следующем
+        чтении, поэтому поврежденный журнал сразу сжимается в снимок.
+        """
+        damaged = False
+        for line in file:
+            if not line.endswith('\n'):
+                damaged = True
+            try:
+                self.apply(json.loads(line))
+            except ValueError:
+                logging.error(
+                    'Оборванная запись журнала %s пропущена',
+                    self.journal_path)
+                damaged = True
+                continue
+            self.records += 1
+        return damaged
+
+    def restore(self, snapshot):
+        """Загружаем состояние из снимка."""
+        self.cursors = snapshot['cursors']
+        self.messages = snapshot['messages']
+        for uid, *status in snapshot['statuses']:
+            self.set_status(uid, *status)
+        for entry_id, chat_id, message in snapshot['outbox']:
+            self.add_entry(entry_id, chat_id, message)
+        self.last_id = snapshot['last_id']
+
+    def dump(self):
+        """Снимок текущего состояния."""
+        return {
+            'cursors': self.cursors,
+            'messages': self.messages,
+            'statuses': [
+                [uid, key, status, self.names.get(uid, {}).get(key)]
+                for (uid, key), status in self.index.items()
+            ],
+            'outbox': self.pending(),
+            'last_id': self.last_id,
+        }
+
+    def write(self, record):
+        """Дописываем запись в журнал."""
+        self.journal.write(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self.journal.write('\n')
+        self.records += 1
+
+    def compact(self):
+        """Пишем снимок атомарно и начинаем журнал заново."""
+        temp_path = f'{self.snapshot_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.dump(), file, ensure_ascii=False)
+        os.replace(temp_path, self.snapshot_path)
+        self.journal.close()
+        self.journal = open(self.journal_path, 'w', encoding='utf-8')
+        self.records = 0
+
+    def flush(self):
+        """Сбрасываем журнал и при необходимости сжимаем его."""
+        if self.journal is None:
+            return
+        self.journal.flush()
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def close(self):
+        """Сжимаем журнал и закрываем файл."""
+        if self.journal is None:
+            return
+        self.compact()
+        self.journal.close()
+        self.journal = None
+
+
+def load_state(backend=STATE_BACKEND, path=STATE_DIR):
+    """Хранилище состояния по настройке STATE_BACKEND."""
+    if backend == 'memory':
+        return MemoryState()
+    return FileState(path).load()
@@ -0,0 +1,79 @@
+import os
+from collections import OrderedDict
+
+FINAL_STATUSES = frozenset(('approved',))
+FINISHED_LIMIT = int(os.getenv('STATUS_INDEX_FINISHED', 10000))
+
+
+class StatusIndex:
+    """Последний известный статус каждой работы каждой подписки.
+
+    Незавершенные работы сгруппированы по подпискам. Принятые работы
+    больше не меняют статус, поэтому они переезжают в ограниченный
+    LRU-хвост и вытесняются из него первыми.
+    """
+
+    def __init__(self, finished_limit=FINISHED_LIMIT):
+        """Пустой индекс с лимитом завершенных работ."""
+        self.active = {}
+        self.finished = OrderedDict()
+        self.finished_limit = finished_limit
+
+    def __len__(self):
+        """Количество работ в индексе."""
+        return (
+            sum(len(statuses) for statuses in self.active.values())
+            + len(self.finished)
+        )
+
+    def status(self, key):
+        """Последний статус работы по ключу (подписка, работа) или None."""
+        uid, homework = key
+        status = self.active.get(uid, {}).get(homework)
+        if status is None:
+            status = self.finished.get(key)
+        return status
+
+    def active_statuses(self, uid):
+        """Статусы незавершенных работ подписки."""
+        return self.active.get(uid, {}).values()
+
+    def changed_records(self, uid, records):
+        """Проверенные записи работ, чей статус отличается от известного."""
+        active = self.active.get(uid, {})
+        finished = self.finished
+        return [
+            record for record in records
+            if (active.get(record.key) or finished.get((uid, record.key)))
+            != record.status
+        ]
+
+    def set(self, key, status):
+        """Запоминаем статус работы по ключу (подписка, работа)."""
+        uid, homework = key
+        if status in FINAL_STATUSES:
+            statuses = self.active.get(uid)
+            if statuses is not None:
+                statuses.pop(homework, None)
+                if not statuses:
+                    del self.active[uid]
+            self.finished[key] = status
+            self.finished.move_to_end(key)
+            while len(self.finished) > self.finished_limit:
+                self.finished.popitem(last=False)
+        else:
+            self.finished.pop(key, None)
+            self.active.setdefault(uid, {})[homework] = status
+
+    def items(self):
+        """Все пары (ключ, статус); завершенные — от старых к новым."""
+        for uid, statuses in self.active.items():
+            for homework, status in statuses.items():
+                yield (uid, homework), status
+        yield from self.finished.items()
+
+    def forget(self, uid):
+        """Удаляем работы подписки, которую больше не опрашиваем."""
+        self.active.pop(uid, None)
+        for key in [key for key in self.finished if key[0] == uid]:
+            del self.finished[key]
@@ -0,0 +1,161 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+NEED_MORE = object()
+
+
+class JsonStreamParser:
+    """Потоковый разбор JSON-объекта с большим массивом по ключу key.
+
+    Тело подается частями через feed(); элементы массива key
+    возвращаются по мере того, как они целиком приходят, и сразу
+    вырезаются из буфера, поэтому в памяти держится только текущая
+    часть и один элемент. Остальные поля верхнего уровня собираются в
+    fields. Значение считается законченным, только когда за ним виден
+    следующий символ: так число на границе частей не обрежется.
+    """
+
+    def __init__(self, key):
+        """Ключ массива, который нужно разбирать по элементам."""
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.state = 'start'
+        self.field = None
+        self.fields = {}
+        self.streamed = False
+        self.handlers = {
+            'start': self.on_start,
+            'first_key': self.on_first_key,
+            'key': self.on_key,
+            'colon': self.on_colon,
+            'value': self.on_value,
+            'next_field': self.on_next_field,
+            'first_item': self.on_first_item,
+            'item': self.on_item,
+            'next_item': self.on_next_item,
+            'done': self.on_done,
+        }
+
+    def feed(self, chunk):
+        """Добавляем часть тела, возвращаем полностью пришедшие элементы."""
+        self.buffer = self.buffer[self.pos:] + self.text.decode(chunk)
+        self.pos = 0
+        return self.parse()
+
+    def close(self):
+        """Тело закончилось: возвращаем поля верхнего уровня."""
+        self.eof = True
+        self.buffer = self.buffer[self.pos:] + self.text.decode(b'', True)
+        self.pos = 0
+        items = self.parse()
+        if self.state != 'done' or items:
+            raise ValueError('JSON оборван')
+        return self.fields
+
+    def parse(self):
+        """Разбираем буфер, пока хватает данных."""
+        items = []
+        buffer = self.buffer
+        while True:
+            while self.pos < len(buffer) and buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos == len(buffer):
+                return items
+            if not self.handlers[self.state](buffer[self.pos], items):
+                return items
+
+    def decode(self):
+        """Значение с текущей позиции или NEED_MORE."""
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+            return NEED_MORE
+        if end == len(self.buffer) and not self.eof:
+            return NEED_MORE
+        self.pos = end
+        return value
+
+    def expect(self, char, expected, state):
+        """Ждем символ-разделитель и переходим в состояние state."""
+        if char not in expected:
+            raise ValueError(
+                f'Ожидался {expected!r}, получен {char!r} в позиции '
+                f'{self.pos}')
+        self.pos += 1
+        self.state = state(char) if callable(state) else state
+        return True
+
+    def on_start(self, char, items):
+        """Начало объекта."""
+        return self.expect(char, '{', 'first_key')
+
+    def on_first_key(self, char, items):
+        """Первый ключ или пустой объект."""
+        if char == '}':
+            return self.expect(char, '}', 'done')
+        self.state = 'key'
+        return True
+
+    def on_key(self, char, items):
+        """Ключ поля."""
+        key = self.decode()
+        if key is NEED_MORE:
+            return False
+        if not isinstance(key, str):
+            raise ValueError(f'Ключ не строка в позиции {self.pos}')
+        self.field = key
+        self.state = 'colon'
+        return True
+
+    def on_colon(self, char, items):
+        """Двоеточие после ключа."""
+        return self.expect(char, ':', 'value')
+
+    def on_value(self, char, items):
+        """Значение поля; массив key разбирается по элементам."""
+        if self.field == self.key and char == '[':
+            self.streamed = True
+            return self.expect(char, '[', 'first_item')
+        value = self.decode()
+        if value is NEED_MORE:
+            return False
+        self.fields[self.field] = value
+        self.state = 'next_field'
+        return True
+
+    def on_next_field(self, char, items):
+        """Запятая перед следующим полем или конец объекта."""
+        return self.expect(
+            char, ',}', lambda found: 'key' if found == ',' else 'done')
+
+    def on_first_item(self, char, items):
+        """Первый элемент или пустой массив."""
+        if char == ']':
+            return self.expect(char, ']', 'next_field')
+        self.state = 'item'
+        return True
+
+    def on_item(self, char, items):
+        """Элемент массива."""
+        item = self.decode()
+        if item is NEED_MORE:
+            return False
+        items.append(item)
+        self.state = 'next_item'
+        return True
+
+    def on_next_item(self, char, items):
+        """Запятая перед следующим элементом или конец массива."""
+        return self.expect(
+            char, ',]', lambda found: 'item' if found == ',' else 'next_field')
+
+    def on_done(self, char, items):
+        """После конца объекта допустимы только пробелы."""
+        raise ValueError(f'Лишние данные после JSON в позиции {self.pos}')
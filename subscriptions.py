@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+
+SUBSCRIPTIONS_FILE = os.getenv('SUBSCRIPTIONS_FILE', 'subscriptions.jsonl')
+
+
+class Subscription:
+    """Компактная запись подписки: токен Практикума, чат и состояние опроса."""
+
+    __slots__ = ('token', 'chat_id', 'cursor')
+
+    def __init__(self, token, chat_id, cursor=None):
+        """Поля подписки."""
+        self.token = token
+        self.chat_id = chat_id
+        self.cursor = cursor
+
+    @property
+    def key(self):
+        """Уникальный ключ подписки."""
+        return self.token, str(self.chat_id)
+
+    @property
+    def uid(self):
+        """Идентификатор подписки для хранения без токена в открытом виде."""
+        raw = f'{self.token}:{self.chat_id}'.encode()
+        return hashlib.sha256(raw).hexdigest()[:16]
+
+    @property
+    def headers(self):
+        """Заголовки запроса к API для токена подписки."""
+        return {'Authorization': f'OAuth {self.token}'}
+
+    def is_valid(self):
+        """Проверяем, что у подписки заполнены токен и чат."""
+        return bool(self.token) and bool(self.chat_id)
+
+    def __repr__(self):
+        """Представление без токена, чтобы он не попал в логи."""
+        return f'Subscription(chat_id={self.chat_id!r})'
+
+
+class SubscriptionRegistry:
+    """Хранилище подписок в JSONL-файле с горячей перезагрузкой."""
+
+    def __init__(self, path=SUBSCRIPTIONS_FILE):
+        """Путь к файлу подписок."""
+        self.path = path
+        self.subscriptions = {}
+        self.stamp = None
+
+    def __len__(self):
+        """Количество подписок."""
+        return len(self.subscriptions)
+
+    def __iter__(self):
+        """Перебор снимка подписок."""
+        return iter(tuple(self.subscriptions.values()))
+
+    def read(self):
+        """Читаем файл и отбрасываем некорректные записи."""
+        entries = {}
+        with open(self.path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    data = json.loads(line)
+                    subscription = Subscription(
+                        data.get('token'), data.get('chat_id'))
+                except (ValueError, AttributeError):
+                    logging.error(
+                        'Строка %s файла %s не разобрана', number, self.path)
+                    continue
+                if not subscription.is_valid():
+                    logging.error(
+                        'Строка %s файла %s: нет token или chat_id',
+                        number, self.path)
+                    continue
+                entries[subscription.key] = subscription
+        return entries
+
+    def file_stamp(self):
+        """Отметка изменения файла подписок."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def add(self, subscription):
+        """Добавляем подписку вручную, без файла."""
+        self.subscriptions.setdefault(subscription.key, subscription)
+
+    def save(self):
+        """Атомарно перезаписываем файл текущими подписками."""
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for subscription in self.subscriptions.values():
+                file.write(json.dumps(
+                    {'token': subscription.token,
+                     'chat_id': subscription.chat_id},
+                    ensure_ascii=False))
+                file.write('\n')
+        os.replace(temp_path, self.path)
+        self.stamp = self.file_stamp()
+
+    def subscribe(self, subscription):
+        """Добавляем подписку в файл; False, если она уже есть."""
+        if subscription.key in self.subscriptions:
+            return False
+        self.subscriptions[subscription.key] = subscription
+        self.save()
+        return True
+
+    def claim(self, subscription):
+        """Подписка опрашивается этим процессом."""
+        return True
+
+    def forward_status(self, chat_id):
+        """Подписки чата, о которых ответит другой процесс: таких нет."""
+        return []
+
+    def status_requests(self):
+        """Чаты, спросившие /status у другого процесса: таких нет."""
+        return []
+
+    def unsubscribe(self, chat_id):
+        """Удаляем из файла все подписки чата и возвращаем их."""
+        removed = [
+            subscription for subscription in self.subscriptions.values()
+            if str(subscription.chat_id) == str(chat_id)
+        ]
+        for subscription in removed:
+            del self.subscriptions[subscription.key]
+        if removed:
+            self.save()
+        return removed
+
+    def reload(self):
+        """Перечитываем файл, если он изменился.
+
+        Возвращает кортеж (добавленные, удаленные). Состояние опроса
+        сохранившихся подписок не сбрасывается.
+        """
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return [], []
+        entries = self.read()
+        self.stamp = stamp
+        added = [
+            subscription for key, subscription in entries.items()
+            if key not in self.subscriptions
+        ]
+        removed = [
+            subscription for key, subscription in self.subscriptions.items()
+            if key not in entries
+        ]
+        for subscription in removed:
+            del self.subscriptions[subscription.key]
+        for subscription in added:
+            self.subscriptions[subscription.key] = subscription
+        if added or removed:
+            logging.info(
+                'Подписки обновлены: +%s, -%s, всего %s',
+                len(added), len(removed), len(self.subscriptions))
+        return added, removed
+
+    def close(self):
+        """Реестр в файле не держит ресурсов."""
+
+
+def load_registry(path=SUBSCRIPTIONS_FILE, token=None, chat_id=None):
+    """Загружаем подписки из файла или из переменных окружения."""
+    registry = SubscriptionRegistry(path)
+    registry.reload()
+    if not len(registry) and token and chat_id:
+        registry.add(Subscription(token, chat_id))
+    return registry
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+import exceptions
+from alerts import Alerts, describe
+from clock import VirtualClock
+from state import MemoryState
+from subscriptions import Subscription
+from tests import test_engine
+
+
+def make_alerts(state=None):
+    clock = VirtualClock(1000.0)
+    alerts = Alerts(
+        state if state is not None else MemoryState(), interval=600,
+        clock=clock.monotonic)
+    return alerts, clock
+
+
+class TestAlerts:
+
+    def test_repeats_are_folded_into_digest(self):
+        alerts, clock = make_alerts()
+        subscription = Subscription('t', 1)
+        down = exceptions.ApiNoAnswerError('Нет ответа API')
+        assert alerts.failure(subscription, down) == 'Нет ответа API'
+        clock.now += 60
+        assert alerts.failure(
+            subscription, exceptions.ApiNoAnswerError('Другой текст')) is None
+        server = exceptions.ApiServerError('Ошибка сервера API')
+        assert alerts.failure(subscription, server) == 'Ошибка сервера API', (
+            'О новом виде ошибки сообщаем сразу'
+        )
+        clock.now += 540
+        assert alerts.failure(subscription, server) is None
+        clock.now += 60
+        digest = alerts.failure(subscription, down)
+        assert digest == (
+            'Сбой опроса API продолжается 11 мин, неудачных опросов: 5 '
+            '(ApiNoAnswerError: 3, ApiServerError: 2). '
+            'Последняя ошибка: Нет ответа API'
+        )
+        clock.now += 30
+        assert alerts.failure(subscription, down) is None, (
+            'Сводка уходит не чаще раза в interval'
+        )
+        assert alerts.recovered(subscription) == (
+            'Опрос API восстановлен: сбой длился 12 мин, '
+            'неудачных опросов: 6'
+        )
+        assert alerts.recovered(subscription) is None
+        assert alerts.failure(subscription, down) == 'Нет ответа API', (
+            'После восстановления новый сбой объявляется заново'
+        )
+
+    def test_chat_recovers_when_all_subscriptions_recover(self):
+        alerts, _ = make_alerts()
+        first, second = Subscription('a', 1), Subscription('b', 1)
+        down = exceptions.ApiNoAnswerError('Нет ответа API')
+        assert alerts.failure(first, down) == 'Нет ответа API'
+        assert alerts.failure(second, down) is None, (
+            'Чат с несколькими подписками узнает о сбое один раз'
+        )
+        assert alerts.recovered(first) is None
+        assert alerts.recovered(second).startswith('Опрос API восстановлен')
+
+    def test_outage_survives_restart(self):
+        state = MemoryState()
+        subscription = Subscription('t', 1)
+        alerts, _ = make_alerts(state)
+        alerts.failure(subscription, exceptions.ApiNoAnswerError('Нет'))
+        restarted, _ = make_alerts(state)
+        assert restarted.failure(
+            subscription, exceptions.ApiNoAnswerError('Нет')) is None, (
+            'После перезапуска об идущем сбое не сообщаем повторно'
+        )
+        fresh, _ = make_alerts(state)
+        assert fresh.recovered(subscription) == 'Опрос API восстановлен'
+        assert state.messages == {}
+
+
+class TestEngineAlerts:
+
+    def test_outage_sends_one_alert_and_one_recovery(self, tmp_path):
+        api = test_engine.FakeApi({
+            't': exceptions.ApiServerError('Ошибка сервера API')})
+        telegram = test_engine.FakeTelegram()
+        poller = test_engine.make_engine(tmp_path, api, telegram)
+        subscription = Subscription('t', 1, cursor=100)
+
+        async def run():
+            poller.start(subscription)
+            for _ in range(5):
+                await poller.poll_once(None, subscription)
+            api.responses['t'] = {'homeworks': [], 'current_date': 200}
+            await poller.poll_once(None, subscription)
+            await poller.poll_once(None, subscription)
+            await test_engine.drain(poller)
+
+        asyncio.run(run())
+        parts = [
+            part for _, message in telegram.sent
+            for part in message.split('\n\n')]
+        assert parts == [
+            'Ошибка сервера API',
+            'Опрос API восстановлен: сбой длился 0 с, неудачных опросов: 5',
+        ]
+
+    @pytest.mark.parametrize('item, error_class', [
+        ('bad', TypeError),
+        ({'homework_name': 'hw'}, KeyError),
+    ])
+    def test_malformed_homework_is_reported(
+            self, tmp_path, item, error_class):
+        api = test_engine.FakeApi({
+            't': {'homeworks': [item], 'current_date': 200}})
+        telegram = test_engine.FakeTelegram()
+        poller = test_engine.make_engine(tmp_path, api, telegram)
+        subscription = Subscription('t', 1, cursor=100)
+
+        async def run():
+            poller.start(subscription)
+            error = await poller.poll_once(None, subscription)
+            await test_engine.drain(poller)
+            return error
+
+        error = asyncio.run(run())
+        assert isinstance(error, error_class), (
+            'Ошибка без txt тоже считается неудачным опросом'
+        )
+        assert [message for _, message in telegram.sent] == [describe(error)]
@@ -0,0 +1,67 @@
+import asyncio
+import multiprocessing
+
+import bench
+import engine
+import homework
+import stand
+
+
+class TestBench:
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert bench.percentile(values, 0.5) == 50
+        assert bench.percentile(values, 0.99) == 99
+        assert bench.percentile([], 0.5) is None
+
+    def test_compare(self):
+        lines = bench.compare(
+            {'polls_per_sec': 100, 'latency_p99': None},
+            {'polls_per_sec': 150, 'latency_p99': 0.1})
+        assert 'polls_per_sec: 100 -> 150 (+50.0%)' in lines
+        assert 'latency_p99: None -> 0.1' in lines
+
+    def test_drive_against_stand(self, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        monkeypatch.setattr(engine, 'TELEGRAM_API', engine.TELEGRAM_API)
+        args = bench.parse_args([
+            '-n', '5', '--duration', '0.5', '--interval', '0.05',
+            '--change-rate', '1', '--payload', '100'])
+
+        async def run():
+            runner, url = await stand.start(
+                stand.make_stand(stand.stand_options(args)))
+            try:
+                return await bench.drive(args, url)
+            finally:
+                await runner.cleanup()
+
+        result = asyncio.run(run())
+        assert result['counters']['polls'] >= 5, (
+            'Каждая подписка должна опросить стенд'
+        )
+        assert result['latency_count'] > 0, (
+            'Смены статусов должны доходить до фейкового Telegram'
+        )
+        assert result['stages']['get_api_answer']['count'] >= 5
+
+    def test_drive_threads_against_stand(self, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        args = bench.parse_args([
+            '-n', '5', '--duration', '0.5', '--interval', '0.05',
+            '--change-rate', '1', '--threads', '2'])
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=stand.run, args=(stand.stand_options(args),),
+            kwargs={'ready': sender}, daemon=True)
+        process.start()
+        try:
+            result = bench.drive_threads(args, receiver.recv())
+        finally:
+            process.terminate()
+            process.join()
+        assert result['counters']['polls'] >= 5
+        assert result['latency_count'] > 0, (
+            'Смены статусов должны доходить до фейкового Telegram'
+        )
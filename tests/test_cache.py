@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+import engine
+import homework
+import stand
+import transport
+from cache import ResponseCache, body_digest
+from state import MemoryState
+from subscriptions import Subscription
+
+BODY = b'{"homeworks": [{"id": 1, "status": "approved"}], "current_date": %d}'
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(homework, 'RESPONSE_CACHE', cache)
+    return cache
+
+
+class TestResponseCache:
+
+    def test_digest_ignores_current_date(self):
+        first, first_date = body_digest(BODY % 100)
+        second, second_date = body_digest(BODY % 200)
+        assert first == second
+        assert (first_date, second_date) == (100, 200)
+
+    def test_hit_only_after_confirm(self, cache):
+        headers = {'ETag': '"v1"'}
+        assert cache.check('a', headers, BODY % 100) is None
+        assert cache.check('a', headers, BODY % 200) is None, (
+            'Неподтвержденный ответ не должен давать попадание'
+        )
+        assert cache.headers('a') == {}
+        cache.confirm('a')
+        assert cache.headers('a') == {'If-None-Match': '"v1"'}
+        assert cache.check('a', headers, BODY % 300) == {
+            'homeworks': [], 'current_date': 300}
+        assert cache.check('b', headers, BODY % 300) is None, (
+            'Кеш у каждой подписки свой'
+        )
+
+    def test_hit_drops_failed_pending(self, cache):
+        cache.check('a', {}, BODY % 1)
+        cache.confirm('a')
+        cache.check('a', {}, b'{"homeworks": [], "current_date": 2}')
+        assert cache.check('a', {}, BODY % 3) is not None
+        cache.confirm('a')
+        assert cache.check(
+            'a', {}, b'{"homeworks": [], "current_date": 4}') is None, (
+            'Ответ, обработка которого упала, не должен считаться известным'
+        )
+
+    def test_lru_limit(self):
+        cache = ResponseCache(size=2)
+        for key in 'abc':
+            cache.check(key, {}, BODY % 1)
+            cache.confirm(key)
+        assert list(cache.entries) == ['b', 'c']
+
+
+class TestEngineCache:
+
+    def run_polls(self, options, monkeypatch, polls=2):
+        fake = stand.Stand(**options)
+
+        async def run():
+            runner, url = await stand.start(fake)
+            monkeypatch.setattr(homework, 'ENDPOINT', url + stand.API_PATH)
+            poller = engine.PollEngine('1:token', state=MemoryState())
+            subscription = Subscription('a', 1, cursor=1)
+            changes = []
+            try:
+                async with transport.async_session() as session:
+                    for _ in range(polls):
+                        await poller.poll_once(session, subscription)
+                        changes.append(len(poller.state.pending()))
+                return changes, fake, subscription
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(run())
+
+    def test_unchanged_body_is_not_parsed(self, cache, monkeypatch):
+        parsed = []
+        parse_homeworks = homework.parse_homeworks
+
+        def spy(homeworks):
+            parsed.append(len(homeworks))
+            return parse_homeworks(homeworks)
+
+        monkeypatch.setattr(homework, 'parse_homeworks', spy)
+        changes, _, subscription = self.run_polls(
+            {'homeworks': 5, 'change_rate': 0}, monkeypatch)
+        assert changes == [5, 5]
+        assert parsed == [5, 0], (
+            'Повторный ответ с теми же работами не должен разбираться'
+        )
+        assert subscription.cursor > 1
+
+    def test_not_modified(self, cache, monkeypatch):
+        changes, fake, subscription = self.run_polls(
+            {'homeworks': 3, 'change_rate': 0, 'etag': True}, monkeypatch,
+            polls=3)
+        assert changes == [3, 3, 3]
+        assert fake.counters['not_modified'] == 2
+        assert cache.headers(subscription.key) == {
+            'If-None-Match': '"a-0"'}
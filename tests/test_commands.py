@@ -0,0 +1,198 @@
+import asyncio
+import sqlite3
+
+from commands import UPDATES_CURSOR, Commands, parse_command
+from ratelimit import Backoff
+from sharding import LeaseTable, ShardedRegistry
+from subscriptions import Subscription, SubscriptionRegistry
+from tests.test_engine import FakeApi, FakeTelegram, drain, make_engine
+
+
+def message(update_id, chat_id, text):
+    return {'update_id': update_id,
+            'message': {'chat': {'id': chat_id}, 'text': text}}
+
+
+class FakeUpdates:
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.offsets = []
+
+    async def __call__(self, session, bot_token, offset, timeout):
+        self.offsets.append(offset)
+        if not self.batches:
+            await asyncio.sleep(3600)
+        batch = self.batches.pop(0)
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+
+class TestCommands:
+
+    def make(self, tmp_path, api=None):
+        telegram = FakeTelegram()
+        poller = make_engine(tmp_path, api or FakeApi({}), telegram)
+        registry = SubscriptionRegistry(str(tmp_path / 'subs.jsonl'))
+        return Commands(poller, registry, None), poller, telegram
+
+    def test_parse_command(self):
+        assert parse_command('/status@bot  ') == ('/status', '')
+        assert parse_command('/subscribe abc') == ('/subscribe', 'abc')
+        assert parse_command('привет') is None
+
+    def test_status_from_state_without_api(self, tmp_path):
+        api = FakeApi({'t': {'homeworks': [
+            {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+            {'id': 2, 'homework_name': 'hw2', 'status': 'approved'},
+        ], 'current_date': 1}})
+        commands, poller, telegram = self.make(tmp_path, api)
+        subscription = Subscription('t', 5, cursor=1)
+        poller.start(subscription)
+
+        async def run():
+            await poller.poll_once(None, subscription)
+            await drain(poller)
+            commands.process([message(10, 5, '/status'),
+                              message(11, 5, '/status'),
+                              message(12, 6, '/status')])
+            await drain(poller)
+
+        asyncio.run(run())
+        assert len(api.calls) == 1, 'Команды не должны обращаться к API'
+        assert telegram.sent[1:] == [
+            (5, 'Работы на проверке:\nhw1: '
+                'Работа взята на проверку ревьюером.'),
+            (6, 'Чат не подписан. ' + commands.handlers['/help'](6, '')),
+        ], 'Одинаковые ответы одному чату склеиваются'
+        assert poller.state.cursors[UPDATES_CURSOR] == 13
+
+    def test_subscribe_and_unsubscribe(self, tmp_path):
+        commands, poller, _ = self.make(tmp_path)
+
+        async def process(text):
+            commands.process([message(1, 7, text)])
+
+        asyncio.run(process('/subscribe token7'))
+        assert [s.key for s in poller.chat_subscriptions(7)] == [
+            ('token7', '7')]
+        assert poller.scheduler.next_time() is not None
+        restored = SubscriptionRegistry(commands.registry.path)
+        restored.reload()
+        assert len(restored) == 1, 'Подписка должна сохраняться в файл'
+
+        asyncio.run(process('/unsubscribe'))
+        assert poller.chat_subscriptions(7) == []
+        assert len(poller.scheduler) == 0
+        restored.reload()
+        assert len(restored) == 0
+
+    def test_run_reads_updates_with_offset(self, tmp_path):
+        commands, poller, telegram = self.make(tmp_path)
+        updates = FakeUpdates([[message(5, 1, '/help')], []])
+        commands.fetch_updates = updates
+
+        async def run():
+            task = asyncio.ensure_future(commands.run(None))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await drain(poller)
+
+        asyncio.run(run())
+        assert updates.offsets == [None, 6, 6]
+        assert telegram.sent[0][0] == 1
+
+    def test_bad_update_does_not_stop_others(self, tmp_path):
+        commands, poller, telegram = self.make(tmp_path)
+
+        def broken(chat_id, args):
+            raise sqlite3.OperationalError('database is locked')
+
+        commands.handlers['/subscribe'] = broken
+
+        async def run():
+            commands.process([
+                message(1, 1, '/help'),
+                {'update_id': 2, 'message': {'chat': None, 'text': '/help'}},
+                {'update_id': 3, 'message': {'chat': 5, 'text': '/help'}},
+                'не словарь',
+                message(4, 2, '/subscribe token'),
+                message(5, 3, '/help'),
+            ])
+            await drain(poller)
+
+        asyncio.run(run())
+        assert [chat for chat, _ in telegram.sent] == [1, 2, 3], (
+            'Сбой на одном обновлении не мешает ответить на остальные'
+        )
+        assert telegram.sent[1][1].startswith('Не удалось сохранить')
+        assert poller.state.cursors[UPDATES_CURSOR] == 6
+
+    def test_run_survives_unexpected_error(self, tmp_path):
+        commands, poller, telegram = self.make(tmp_path)
+        commands.backoff = Backoff(base=0.001, maximum=0.001)
+        updates = FakeUpdates([
+            AttributeError('сбой'), [message(5, 1, '/help')]])
+        commands.fetch_updates = updates
+
+        async def run():
+            task = asyncio.ensure_future(commands.run(None))
+            await asyncio.sleep(0.05)
+            assert not task.done(), 'Опрос команд продолжается после сбоя'
+            task.cancel()
+            await drain(poller)
+
+        asyncio.run(run())
+        assert updates.offsets == [None, None, 6]
+        assert telegram.sent[0][0] == 1
+
+    def test_status_of_other_shard(self, tmp_path):
+        path = str(tmp_path / 'subs.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            for number in range(1, 21):
+                file.write(f'{{"token": "t{number}", "chat_id": {number}}}\n')
+        shards = []
+        for worker_id in ('a', 'b'):
+            shard = ShardedRegistry(
+                SubscriptionRegistry(path),
+                LeaseTable(str(tmp_path / 'shards.sqlite'), worker_id))
+            shard.leases.heartbeat()
+            shards.append(shard)
+        for shard in shards:
+            shard.reload()
+        remote = next(iter(shards[1]))
+        chat = remote.chat_id
+        api = FakeApi({remote.token: {'homeworks': [
+            {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+        ], 'current_date': 1}})
+        first_telegram, second_telegram = FakeTelegram(), FakeTelegram()
+        first = make_engine(tmp_path / 'a', api, first_telegram)
+        second = make_engine(tmp_path / 'b', api, second_telegram)
+        for subscription in shards[1]:
+            second.start(subscription)
+        commands = Commands(first, shards[0], None)
+
+        async def run():
+            await second.poll_once(None, remote)
+            await drain(second)
+            commands.process([message(1, chat, '/status')])
+            await drain(first)
+            second.answer_status_requests(shards[1])
+            await drain(second)
+            assert shards[1].status_requests() == []
+
+        try:
+            asyncio.run(run())
+        finally:
+            for shard in shards:
+                shard.leases.close()
+        assert first_telegram.sent == [
+            (chat, 'Статусы работ придут отдельным сообщением.')], (
+            'Чат, подписку которого опрашивает другой воркер, подписан'
+        )
+        assert second_telegram.sent[-1] == (
+            chat, 'Работы на проверке:\nhw1: '
+                  'Работа взята на проверку ревьюером.'), (
+            '/status о чужой подписке отвечает ее владелец'
+        )
@@ -0,0 +1,258 @@
+import asyncio
+
+import pytest
+
+import engine
+import exceptions
+from ratelimit import TokenBucket
+from scheduler import PollScheduler
+from state import FileState
+from subscriptions import Subscription, SubscriptionRegistry
+
+
+class FakeApi:
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    async def __call__(self, session, subscription, current_timestamp):
+        self.calls.append((subscription.token, current_timestamp))
+        response = self.responses[subscription.token]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FakeTelegram:
+
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, session, bot_token, chat_id, message):
+        self.sent.append((chat_id, message))
+
+
+class FakeReply:
+
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def json(self, content_type='application/json'):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+
+    def __init__(self, reply):
+        self.reply = reply
+
+    def post(self, url, **kwargs):
+        return self.reply
+
+
+def make_engine(tmp_path, api, telegram, **kwargs):
+    state = FileState(str(tmp_path / 'state')).load()
+    return engine.PollEngine(
+        '1:token', fetch=api, send=telegram, state=state, **kwargs)
+
+
+async def drain(poller):
+    for chat in poller.state.pending_chats():
+        await poller.outbox.deliver(None, chat)
+
+
+class TestPollEngine:
+
+    def test_poll_once_sends_every_transition(self, tmp_path):
+        api = FakeApi({
+            'a': {'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+            ], 'current_date': 1},
+            'b': {'homeworks': [], 'current_date': 1},
+        })
+        telegram = FakeTelegram()
+        poller = make_engine(tmp_path, api, telegram)
+        subscriptions = [Subscription('a', 1), Subscription('b', 2)]
+
+        async def run():
+            for subscription in subscriptions:
+                await poller.poll_once(None, subscription)
+                await poller.poll_once(None, subscription)
+            await drain(poller)
+            api.responses['a'] = {'homeworks': [
+                {'id': 2, 'homework_name': 'hw2', 'status': 'rejected'},
+            ], 'current_date': 2}
+            await poller.poll_once(None, subscriptions[0])
+            await drain(poller)
+
+        asyncio.run(run())
+        assert len(api.calls) == 5
+        assert telegram.sent == [
+            (1, 'Изменился статус проверки работы "hw1". '
+                'Работа проверена: ревьюеру всё понравилось. Ура!\n\n'
+                'Изменился статус проверки работы "hw2". '
+                'Работа взята на проверку ревьюером.'),
+            (1, 'Изменился статус проверки работы "hw2". '
+                'Работа проверена: у ревьюера есть замечания.'),
+        ], 'Уведомления отправляются только о реальных сменах статуса'
+
+    def test_poll_once_reports_api_error(self, tmp_path):
+        api = FakeApi({'a': exceptions.ApiAnswerError('API недоступен')})
+        telegram = FakeTelegram()
+        poller = make_engine(tmp_path, api, telegram)
+        subscription = Subscription('a', 1, cursor=10)
+
+        async def run():
+            await poller.poll_once(None, subscription)
+            await drain(poller)
+
+        asyncio.run(run())
+        assert telegram.sent == [(1, 'API недоступен')]
+        assert subscription.cursor == 10, (
+            'Отметка не должна сдвигаться при ошибке опроса'
+        )
+
+    def test_cursor_follows_current_date(self, tmp_path):
+        api = FakeApi({'a': {'homeworks': [], 'current_date': 1500}})
+        telegram = FakeTelegram()
+        poller = make_engine(tmp_path, api, telegram)
+        subscription = Subscription('a', 1, cursor=1000)
+
+        async def run():
+            await poller.poll_once(None, subscription)
+            api.responses['a'] = {'homeworks': [], 'current_date': 2100}
+            await poller.poll_once(None, subscription)
+
+        asyncio.run(run())
+        assert api.calls == [('a', 1000), ('a', 1500)]
+        assert subscription.cursor == 2100
+        poller.state.close()
+        restored = FileState(poller.state.path).load()
+        assert restored.cursors[subscription.uid] == 2100, (
+            'Отметка должна сохраняться между перезапусками'
+        )
+
+    def test_run_polls_all_subscriptions_concurrently(self, tmp_path):
+        api = FakeApi({
+            str(i): {'homeworks': [{'homework_name': 'hw',
+                                    'status': 'reviewing'}],
+                     'current_date': 1}
+            for i in range(500)
+        })
+        telegram = FakeTelegram()
+        poller = make_engine(
+            tmp_path, api, telegram, scheduler=PollScheduler(budget=0),
+            commands=False)
+        poller.api_limiter = TokenBucket(0)
+        poller.outbox.limiter = TokenBucket(0)
+        poller.outbox.window = 0
+        registry = SubscriptionRegistry(str(tmp_path / 'missing.jsonl'))
+        for i in range(500):
+            registry.add(Subscription(str(i), i))
+
+        async def run():
+            task = asyncio.ensure_future(
+                poller.run(registry, session=object()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(run())
+        assert len(api.calls) == 500
+        assert len(telegram.sent) == 500
+
+    def test_failures_back_off_and_open_breaker(self, tmp_path):
+        api = FakeApi({'a': exceptions.ApiServerError('500')})
+        telegram = FakeTelegram()
+        poller = make_engine(tmp_path, api, telegram)
+        poller.breaker.threshold = 2
+        subscription = Subscription('a', 1, cursor=1)
+        poller.subscriptions[subscription.key] = subscription
+
+        async def run():
+            for _ in range(3):
+                await poller.poll_and_reschedule(None, subscription)
+            await drain(poller)
+
+        asyncio.run(run())
+        assert len(api.calls) == 2, (
+            'При разомкнутом размыкателе API не должен опрашиваться'
+        )
+        assert poller.failures[subscription.key] == 2
+        assert subscription.key in poller.scheduler
+        assert telegram.sent == [(1, '500')], (
+            'Одинаковая ошибка отправляется один раз'
+        )
+
+
+class TestSendTelegram:
+
+    def send(self, reply):
+        async def run():
+            await engine.send_telegram(FakeSession(reply), '1:token', 1, 'x')
+
+        try:
+            asyncio.run(run())
+        except exceptions.SendMessageError as error:
+            return error
+        raise AssertionError('Отправка должна завершиться ошибкой')
+
+    def test_rate_limit_with_malformed_body(self):
+        for body in (ValueError('<html>'), ['not', 'a', 'dict'],
+                     {'parameters': 'bad'},
+                     {'parameters': {'retry_after': 'soon'}}):
+            error = self.send(FakeReply(429, body, {'Retry-After': '7'}))
+            assert isinstance(error, exceptions.SendRateLimitError), (
+                'Ответ 429 с любым телом — ошибка лимита отправки'
+            )
+            assert error.retry_after == 7, (
+                'Без паузы в теле берется заголовок Retry-After'
+            )
+        error = self.send(FakeReply(429, {'parameters': {'retry_after': 3}}))
+        assert error.retry_after == 3
+        error = self.send(FakeReply(502, ValueError('<html>')))
+        assert type(error) is exceptions.SendMessageError
+
+
+class TestGetUpdates:
+
+    def fetch(self, reply):
+        return asyncio.run(
+            engine.get_updates(FakeSession(reply), '1:token', None, 1))
+
+    def test_malformed_body_is_updates_error(self):
+        for status, body in ((502, None), (200, ['not', 'a', 'dict']),
+                             (200, {'ok': False, 'parameters': None}),
+                             (200, {'ok': True, 'result': None})):
+            with pytest.raises(exceptions.UpdatesError):
+                self.fetch(FakeReply(status, body))
+        with pytest.raises(exceptions.UpdatesError) as error:
+            self.fetch(FakeReply(
+                429, {'ok': False, 'parameters': {'retry_after': 5}}))
+        assert error.value.retry_after == 5
+        assert self.fetch(FakeReply(200, {'ok': True, 'result': []})) == []
+
+
+class TestPollBudget:
+
+    def test_budget_capped_by_api_rate(self):
+        assert engine.poll_budget(50, 20) == 20
+        assert engine.poll_budget(10, 20) == 10
+        assert engine.poll_budget(0, 20) == 20, (
+            'Опросы без бюджета все равно не обгоняют лимит API'
+        )
+        assert engine.poll_budget(10, 0) == 10
+        assert engine.poll_budget(0, 0) == 0
+        poller = engine.PollEngine(None)
+        assert poller.scheduler.budget == engine.poll_budget()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics_server
+from clock import VirtualClock
+from health import STUCK_POLLS, Health
+from ratelimit import Backoff, TokenBucket
+from scheduler import PollScheduler
+from subscriptions import Subscription, SubscriptionRegistry
+from tests.test_engine import FakeApi, FakeTelegram, make_engine
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(100.0)
+
+
+@pytest.fixture
+def server(monkeypatch, clock):
+    checks = Health(grace=5, stuck_after=30, clock=clock.monotonic)
+    monkeypatch.setattr(metrics_server.MetricsHandler, 'health', checks)
+    server = metrics_server.serve(port=0, host='127.0.0.1')
+    yield checks, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+class TestHealth:
+
+    def test_beat_deadline_and_stuck_polls(self, clock):
+        checks = Health(grace=5, stuck_after=30, clock=clock.monotonic)
+        assert checks.alive(), 'До первой отметки процесс считается живым'
+        checks.beat(10)
+        clock.now += 14
+        assert checks.alive()
+        clock.now += 2
+        assert not checks.alive(), (
+            'Без отметки дольше интервала и запаса процесс завис'
+        )
+        checks.beat(10)
+        checks.poll_started('a')
+        clock.now += 31
+        checks.beat(10)
+        assert checks.stuck(30) == ['a'] and not checks.alive(), (
+            'Опрос дольше stuck_after делает процесс зависшим'
+        )
+        checks.poll_finished('a', True)
+        assert checks.alive()
+
+    def test_polls_report_oldest_first(self, clock):
+        checks = Health(clock=clock.monotonic)
+        checks.poll_finished('old', True)
+        clock.now += 50
+        checks.poll_finished('new', True)
+        checks.poll_started('never')
+        clock.now += 10
+        report = checks.polls()
+        assert [row['uid'] for row in report['subscriptions']] == [
+            'never', 'old', 'new']
+        assert report['subscriptions'][1]['last_success_age'] == 60
+        assert checks.max_age() == 60
+        checks.forget('old')
+        assert checks.polls(limit=1)['count'] == 2
+
+
+class TestHealthServer:
+
+    def test_endpoints(self, server, clock):
+        checks, url = server
+        assert get(f'{url}/ready') == (503, {'ready': False})
+        checks.set_ready()
+        assert get(f'{url}/ready') == (200, {'ready': True})
+        checks.beat(10)
+        status, body = get(f'{url}/health')
+        assert status == 200 and body['alive']
+        clock.now += 16
+        status, body = get(f'{url}/health')
+        assert status == 503, 'Зависший цикл должен давать 503'
+        checks.poll_finished('abc', True)
+        status, body = get(f'{url}/polls?limit=5')
+        assert status == 200
+        assert body['subscriptions'][0]['uid'] == 'abc'
+
+
+class HangingApi:
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, session, subscription, current_timestamp):
+        self.calls += 1
+        await asyncio.sleep(3600)
+
+
+class TestWatchdog:
+
+    def test_stuck_poll_is_restarted(self, tmp_path):
+        api = HangingApi()
+        checks = Health()
+        poller = make_engine(
+            tmp_path, api, FakeTelegram(), scheduler=PollScheduler(budget=0),
+            commands=False, health=checks, poll_timeout=0.05,
+            watchdog_interval=0.01)
+        poller.api_limiter = TokenBucket(0)
+        poller.backoff = Backoff(base=0.01, maximum=0.01)
+        registry = SubscriptionRegistry(str(tmp_path / 'missing.jsonl'))
+        registry.add(Subscription('token', 1))
+        stuck_before = STUCK_POLLS.get()
+
+        async def run():
+            task = asyncio.ensure_future(
+                poller.run(registry, session=object()))
+            await asyncio.sleep(0.3)
+            assert checks.ready
+            task.cancel()
+
+        asyncio.run(run())
+        assert api.calls >= 2, 'Зависший опрос должен быть перезапущен'
+        assert STUCK_POLLS.get() > stuck_before
+        assert not checks.ready, 'После остановки процесс не готов'
+
+    def test_throttled_polls_are_not_stuck(self, tmp_path):
+        api = FakeApi({
+            str(i): {'homeworks': [], 'current_date': 1} for i in range(30)})
+        poller = make_engine(
+            tmp_path, api, FakeTelegram(), scheduler=PollScheduler(budget=0),
+            commands=False, health=Health(), poll_timeout=0.05,
+            watchdog_interval=0.01)
+        poller.api_limiter = TokenBucket(100, capacity=1)
+        registry = SubscriptionRegistry(str(tmp_path / 'missing.jsonl'))
+        for i in range(30):
+            registry.add(Subscription(str(i), i))
+        stuck_before = STUCK_POLLS.get()
+
+        async def run():
+            task = asyncio.ensure_future(
+                poller.run(registry, session=object()))
+            await asyncio.sleep(0.5)
+            task.cancel()
+
+        asyncio.run(run())
+        assert len(api.calls) == 30
+        assert STUCK_POLLS.get() == stuck_before, (
+            'Опрос, ждущий токен лимита API, не считается зависшим'
+        )
@@ -0,0 +1,96 @@
+import time
+
+import homework
+from clock import VirtualClock
+from history import History, summary
+from homework import Homework
+from state import MemoryState
+
+
+def make_history(tmp_path, batch=1000):
+    clock = VirtualClock(1000.0)
+    return History(str(tmp_path / 'history.sqlite'), batch, clock.time), clock
+
+
+def fill(history, clock):
+    steps = (
+        ('u1', 1, 'hw1', 'reviewing', 0),
+        ('u1', 1, 'hw1', 'rejected', 600),
+        ('u1', 1, 'hw1', 'reviewing', 100),
+        ('u1', 1, 'hw1', 'approved', 300),
+        ('u2', 1, 'hw1', 'reviewing', 0),
+        ('u2', 1, 'hw1', 'rejected', 1000),
+        ('u2', 2, 'hw2', 'approved', 0),
+    )
+    for uid, key, name, status, elapsed in steps:
+        clock.now += elapsed
+        history.record(uid, [Homework(key, name, status)], api_time=7)
+
+
+class TestHistory:
+
+    def test_queries_and_report(self, tmp_path):
+        history, clock = make_history(tmp_path)
+        fill(history, clock)
+        history.flush()
+        assert len(history.transitions()) == 7
+        rows = history.transitions(uid='u1', homework='1')
+        assert [row[3] for row in rows] == [
+            'reviewing', 'rejected', 'reviewing', 'approved']
+        assert rows[0] == ('u1', '1', 'hw1', 'reviewing', 7, 1000.0)
+        assert len(history.transitions(since=2500)) == 2
+        assert history.time_in('reviewing') == [300, 600, 1000], (
+            'Каждый заход в статус до следующей смены считается отдельно'
+        )
+        assert history.time_to('approved') == [1000], (
+            'Работа, впервые замеченная принятой, не дает времени проверки'
+        )
+        assert history.counts('rejected') == [('hw1', 2)]
+        report = history.report()
+        assert report['transitions'] == 7 and report['homeworks'] == 3
+        assert report['reviewing_seconds'] == {
+            'count': 3, 'mean': 1900 / 3, 'p50': 600, 'p90': 600,
+            'max': 1000}
+        history.close()
+
+    def test_batch_and_disabled(self, tmp_path):
+        history, clock = make_history(tmp_path, batch=2)
+        history.record('u', [Homework(1, 'hw', 'reviewing')])
+        assert history.rows, 'До заполнения пачки смены копятся в памяти'
+        history.record('u', [Homework(1, 'hw', 'approved')])
+        assert not history.rows
+        history.close()
+        assert len(History(history.path).transitions()) == 2
+        disabled = History('')
+        disabled.record('u', [Homework(1, 'hw', 'reviewing')])
+        assert not disabled and not disabled.rows
+        assert summary([]) == {'count': 0}
+
+    def test_commit_changes_records_history(self, tmp_path, monkeypatch):
+        history, _ = make_history(tmp_path)
+        monkeypatch.setattr(homework, 'HISTORY', history)
+        state = MemoryState()
+        homeworks = [{'id': 5, 'homework_name': 'hw', 'status': 'approved'}]
+        homework.commit_changes(state, 'u', 1, homeworks, api_time=42)
+        homework.commit_changes(state, 'u', 1, homeworks, api_time=43)
+        history.flush()
+        assert [row[:5] for row in history.transitions()] == [
+            ('u', '5', 'hw', 'approved', 42)], (
+            'В историю попадают только смены статусов'
+        )
+
+    def test_report_speed(self, tmp_path):
+        history, clock = make_history(tmp_path, batch=10 ** 6)
+        statuses = ('reviewing', 'rejected', 'reviewing', 'approved')
+        for number in range(50000):
+            for status in statuses:
+                clock.now += 1
+                history.record(
+                    f'u{number % 500}', [Homework(number, 'hw', status)])
+        history.flush()
+        started = time.perf_counter()
+        report = history.report()
+        elapsed = time.perf_counter() - started
+        assert report['transitions'] == 200000
+        assert report['rejections'] == [('hw', 50000)]
+        assert elapsed < 5, f'Отчет по 200 тыс. смен занял {elapsed:.1f} с'
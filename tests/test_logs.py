@@ -0,0 +1,62 @@
+import json
+import logging
+
+import pytest
+
+import logs
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def make_record(message, level=logging.INFO, args=()):
+    return logging.LogRecord('test', level, __file__, 1, message, args, None)
+
+
+class TestLogs:
+
+    def test_sample_filter(self):
+        sample = logs.SampleFilter(rate=10)
+        passed = [
+            sample.filter(make_record('Опрос %s', args=(number,)))
+            for number in range(100)
+        ]
+        assert sum(passed) == 10, 'Проходит каждая десятая повторная запись'
+        assert passed[0], 'Первая запись шаблона не отбрасывается'
+        assert all(
+            sample.filter(make_record('Ошибка', logging.ERROR))
+            for _ in range(5)
+        ), 'Ошибки не прореживаются'
+
+    def test_queue_handler_does_not_format(self):
+        records = []
+        handler = logs.LazyQueueHandler(None)
+        handler.enqueue = records.append
+        handler.handle(make_record('Подписок %s', args=(5,)))
+        assert records[0].msg == 'Подписок %s'
+        assert records[0].args == (5,), (
+            'Сообщение должно форматироваться в потоке слушателя'
+        )
+
+    def test_json_lines_to_file(self, tmp_path, root_logger):
+        path = tmp_path / 'bot.log'
+        listener = logs.setup_logging(
+            level='DEBUG', log_format='json', path=str(path), sample=1)
+        logging.info('Подписок %s', 3)
+        logging.debug('Отладка')
+        listener.stop()
+        lines = [
+            json.loads(line)
+            for line in path.read_text(encoding='utf-8').splitlines()
+        ]
+        assert [line['msg'] for line in lines] == ['Подписок 3', 'Отладка']
+        assert lines[0]['level'] == 'INFO'
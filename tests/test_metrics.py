@@ -0,0 +1,72 @@
+import asyncio
+import urllib.request
+from inspect import signature
+
+import pytest
+
+import exceptions
+import homework
+import metrics
+
+
+class TestMetrics:
+
+    def test_histogram_render(self):
+        registry = metrics.Registry()
+        histogram = metrics.Histogram(
+            'test_seconds', 'Тест', buckets=(0.1, 1), registry=registry)
+        histogram.observe(0.05, stage='a')
+        histogram.observe(0.5, stage='a')
+        histogram.observe(5, stage='a')
+        text = registry.render()
+        assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{stage="a",le="1"} 2' in text
+        assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+        assert 'test_seconds_count{stage="a"} 3' in text
+        assert '# TYPE test_seconds histogram' in text
+
+    def test_gauge_function(self):
+        registry = metrics.Registry()
+        gauge = metrics.Gauge('test_depth', 'Тест', registry=registry)
+        items = [1, 2]
+        gauge.set_function(lambda: len(items), queue='q')
+        items.append(3)
+        assert 'test_depth{queue="q"} 3' in registry.render(), (
+            'Значение функции должно вычисляться при выгрузке'
+        )
+
+    def test_timed_keeps_signature_and_counts_errors(self):
+        before = metrics.STAGE_SECONDS.count(stage='check_response')
+        errors = metrics.STAGE_ERRORS.get(
+            stage='check_response', error='MyResponseError')
+        assert len(signature(homework.check_response).parameters) == 1
+        homework.check_response({'homeworks': []})
+        with pytest.raises(exceptions.MyResponseError):
+            homework.check_response({})
+        assert metrics.STAGE_SECONDS.count(
+            stage='check_response') == before + 2
+        assert metrics.STAGE_ERRORS.get(
+            stage='check_response', error='MyResponseError') == errors + 1
+
+    def test_timed_async(self):
+        @metrics.timed('test_async')
+        async def stage():
+            return 1
+
+        assert asyncio.run(stage()) == 1
+        assert metrics.STAGE_SECONDS.count(stage='test_async') == 1
+
+    def test_serve_and_dump(self, tmp_path):
+        server = metrics.serve(port=0, host='127.0.0.1')
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(
+                    f'http://127.0.0.1:{port}/metrics') as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert '# TYPE bot_stage_seconds histogram' in body
+        path = tmp_path / 'metrics.prom'
+        metrics.dump(str(path))
+        assert 'bot_stage_errors_total' in path.read_text(encoding='utf-8')
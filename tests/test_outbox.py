@@ -0,0 +1,116 @@
+import asyncio
+
+import exceptions
+from outbox import Outbox, coalesce
+from ratelimit import KeyedLimiter, TokenBucket
+from state import MemoryState
+
+
+class FlakyTelegram:
+
+    def __init__(self, failures=0, error=exceptions.SendMessageError):
+        self.failures = failures
+        self.error = error
+        self.sent = []
+
+    async def __call__(self, session, bot_token, chat_id, message):
+        if self.failures:
+            self.failures -= 1
+            raise self.error('Telegram недоступен')
+        self.sent.append((chat_id, message))
+
+
+def make_outbox(state, telegram, **kwargs):
+    outbox = Outbox(state, telegram, '1:token', **kwargs)
+    outbox.limiter = TokenBucket(0)
+    outbox.chat_limiter = KeyedLimiter(0)
+    return outbox
+
+
+class TestCoalesce:
+
+    def test_joins_and_deduplicates(self):
+        assert coalesce([(1, 'a'), (2, 'b'), (3, 'a')]) == [
+            ([1, 2, 3], 'a\n\nb')
+        ]
+
+    def test_respects_message_limit(self):
+        batches = coalesce([(1, 'x' * 6), (2, 'y' * 6), (3, 'z' * 20)],
+                           limit=15)
+        assert batches == [([1, 2], 'x' * 6 + '\n\n' + 'y' * 6),
+                           ([3], 'z' * 15)]
+
+
+class TestOutbox:
+
+    def test_changes_within_window_are_sent_once(self):
+        state = MemoryState()
+        telegram = FlakyTelegram()
+
+        async def run():
+            outbox = make_outbox(state, telegram, window=0.05)
+            sender = asyncio.ensure_future(outbox.run(None))
+            for text in ('первый', 'второй', 'третий'):
+                state.enqueue(1, text)
+                outbox.submit(1)
+            state.enqueue(2, 'другой чат')
+            outbox.submit(2)
+            await asyncio.sleep(0.2)
+            sender.cancel()
+
+        asyncio.run(run())
+        assert sorted(telegram.sent) == [
+            (1, 'первый\n\nвторой\n\nтретий'),
+            (2, 'другой чат'),
+        ]
+        assert state.pending() == []
+
+    def test_failed_send_is_retried(self):
+        state = MemoryState()
+        telegram = FlakyTelegram(failures=2)
+
+        async def run():
+            outbox = make_outbox(state, telegram, window=0)
+            outbox.backoff.base = 0.01
+            sender = asyncio.ensure_future(outbox.run(None))
+            state.enqueue(1, 'статус')
+            outbox.submit(1)
+            await asyncio.sleep(0.3)
+            sender.cancel()
+
+        asyncio.run(run())
+        assert telegram.sent == [(1, 'статус')]
+        assert state.pending() == []
+
+    def test_unexpected_error_keeps_worker(self):
+        state = MemoryState()
+        telegram = FlakyTelegram(failures=1, error=ValueError)
+
+        async def run():
+            outbox = make_outbox(state, telegram, workers=1, window=0)
+            outbox.backoff.base = 0.01
+            sender = asyncio.ensure_future(outbox.run(None))
+            state.enqueue(1, 'статус')
+            outbox.submit(1)
+            await asyncio.sleep(0.1)
+            state.enqueue(2, 'другой чат')
+            outbox.submit(2)
+            await asyncio.sleep(0.1)
+            sender.cancel()
+
+        asyncio.run(run())
+        assert sorted(telegram.sent) == [(1, 'статус'), (2, 'другой чат')], (
+            'Непредвиденная ошибка отправки не должна останавливать воркер'
+        )
+        assert state.pending() == []
+
+    def test_queue_is_bounded(self):
+        state = MemoryState()
+
+        async def run():
+            outbox = make_outbox(state, FlakyTelegram(), maxsize=2)
+            return [outbox.submit(chat) for chat in (1, 2, 1, 3)]
+
+        assert asyncio.run(run()) == [True, True, True, False], (
+            'Чат ставится в очередь один раз, лишние ждут обхода состояния'
+        )
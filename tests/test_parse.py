@@ -0,0 +1,57 @@
+import pytest
+
+import bench_parse
+import exceptions
+import homework
+from state import MemoryState
+
+
+class TestParseHomeworks:
+
+    def test_records(self):
+        records = homework.parse_homeworks([
+            {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+            {'homework_name': 'hw2', 'status': 'reviewing'},
+        ])
+        assert records == [
+            homework.Homework(1, 'hw1', 'approved'),
+            homework.Homework('hw2', 'hw2', 'reviewing'),
+        ]
+        assert homework.status_message(records[0]) == homework.parse_status(
+            {'homework_name': 'hw1', 'status': 'approved'})
+
+    @pytest.mark.parametrize('item, error', [
+        ({'status': 'approved'}, KeyError),
+        ({'homework_name': 'hw'}, KeyError),
+        ({'homework_name': 'hw', 'status': 'unknown'},
+         exceptions.StatusError),
+        ('не словарь', TypeError),
+        (None, TypeError),
+    ])
+    def test_errors(self, item, error):
+        with pytest.raises(error):
+            homework.parse_homeworks([{'id': 1, 'homework_name': 'hw',
+                                       'status': 'approved'}, item])
+
+    def test_invalid_item_commits_nothing(self):
+        state = MemoryState()
+        with pytest.raises(exceptions.StatusError):
+            homework.commit_changes(state, 'u', 1, [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'unknown'},
+            ])
+        assert state.pending() == [], (
+            'Ответ с некорректной работой не должен фиксироваться частично'
+        )
+
+    def test_paths_agree(self):
+        homeworks = bench_parse.make_homeworks(200)
+        index = bench_parse.make_index('u', homeworks, 0.5)
+        response = {'homeworks': homeworks}
+        assert bench_parse.per_item(response, index, 'u') == (
+            bench_parse.single_pass(response, index, 'u'))
+
+    def test_invalid_items_are_not_skipped(self):
+        index = bench_parse.make_index('u', [], 0)
+        assert bench_parse.changed_items(index, 'u', ['не словарь', {}]) == [
+            'не словарь', {}]
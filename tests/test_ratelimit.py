@@ -0,0 +1,121 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+import exceptions
+import homework
+from clock import VirtualClock
+from ratelimit import Backoff, CircuitBreaker, KeyedLimiter, TokenBucket
+
+
+class FakeResponse:
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class TestLimiters:
+
+    def test_token_bucket(self):
+        clock = VirtualClock()
+        bucket = TokenBucket(2, capacity=2, clock=clock.monotonic)
+        assert bucket.try_acquire() and bucket.try_acquire()
+        assert not bucket.try_acquire()
+        assert bucket.delay() == pytest.approx(0.5)
+        clock.now = 0.5
+        assert bucket.try_acquire()
+
+    def test_keyed_limiter_is_per_key(self):
+        clock = VirtualClock()
+        limiter = KeyedLimiter(
+            1, capacity=1, max_keys=2, clock=clock.monotonic)
+        assert limiter.bucket('a').try_acquire()
+        assert not limiter.bucket('a').try_acquire()
+        assert limiter.bucket('b').try_acquire()
+        limiter.bucket('c')
+        assert list(limiter.buckets) == ['b', 'c']
+
+    def test_acquire_sleeps_on_caller_coroutine(self):
+        clock = VirtualClock()
+        limiter = KeyedLimiter(2, capacity=1, clock=clock.monotonic)
+        delays = []
+
+        async def sleep(seconds):
+            delays.append(seconds)
+            clock.advance(seconds)
+
+        async def run():
+            for _ in range(3):
+                await limiter.acquire('chat', sleep)
+
+        asyncio.run(run())
+        assert delays == [pytest.approx(0.5)] * 2, (
+            'Корзина ждет на переданной корутине sleep'
+        )
+        assert clock.now == pytest.approx(1)
+
+    def test_waiters_get_tokens_in_order(self):
+        clock = VirtualClock()
+        bucket = TokenBucket(2, capacity=1, clock=clock.monotonic)
+        assert [bucket.reserve() for _ in range(4)] == [0, 0.5, 1.0, 1.5], (
+            'Каждый ожидающий ждет свой токен, а не общий'
+        )
+        clock.advance(1.5)
+        assert bucket.reserve() == 0.5
+
+    def test_backoff_grows_and_honors_retry_after(self):
+        backoff = Backoff(base=10, maximum=100)
+        assert 5 <= backoff.delay(1) <= 10
+        assert 20 <= backoff.delay(3) <= 40
+        assert 50 <= backoff.delay(10) <= 100
+        assert backoff.delay(1, retry_after=300) == 300
+
+
+class TestCircuitBreaker:
+
+    def test_opens_on_upstream_errors_only(self):
+        clock = VirtualClock()
+        breaker = CircuitBreaker(
+            threshold=2, reset_timeout=60, clock=clock.monotonic)
+        breaker.failure(exceptions.MyResponseError('плохой ответ'))
+        breaker.failure(exceptions.ApiAnswerError('401'))
+        assert breaker.allow(), (
+            'Ошибки отдельной подписки не должны размыкать цепь'
+        )
+        breaker.failure(exceptions.ApiServerError('500'))
+        breaker.failure(exceptions.ApiNoAnswerError('нет ответа'))
+        assert not breaker.allow()
+        assert breaker.remaining() == 60
+
+    def test_half_open_probe(self):
+        clock = VirtualClock()
+        breaker = CircuitBreaker(
+            threshold=1, reset_timeout=60, clock=clock.monotonic)
+        breaker.failure(exceptions.ApiServerError('500'))
+        clock.now = 61
+        assert breaker.allow()
+        assert not breaker.allow(), 'Пробный запрос должен быть один'
+        breaker.failure(exceptions.ApiServerError('500'))
+        assert not breaker.allow()
+        clock.now = 122
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.allow() and breaker.allow()
+
+
+class TestApiStatus:
+
+    def test_status_codes_map_to_exceptions(self):
+        with pytest.raises(exceptions.ApiRateLimitError) as error:
+            homework.check_api_status(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                FakeResponse({'Retry-After': '120'}))
+        assert error.value.retry_after == 120
+        with pytest.raises(exceptions.ApiServerError):
+            homework.check_api_status(
+                HTTPStatus.BAD_GATEWAY, FakeResponse({}))
+        with pytest.raises(exceptions.ApiAnswerError):
+            homework.check_api_status(
+                HTTPStatus.UNAUTHORIZED, FakeResponse({}))
+        homework.check_api_status(HTTPStatus.OK, FakeResponse({}))
@@ -0,0 +1,90 @@
+from clock import VirtualClock
+from scheduler import IntervalPolicy, PollScheduler
+
+
+class TestIntervalPolicy:
+
+    def test_interval_depends_on_statuses(self):
+        policy = IntervalPolicy(default=600, reviewing=120, idle=1800,
+                                jitter=0)
+        assert policy.interval(['rejected', 'reviewing']) == 120
+        assert policy.interval(['rejected']) == 600
+        assert policy.interval([]) == 1800
+
+    def test_jitter_bounds(self):
+        policy = IntervalPolicy(default=600, jitter=0.1)
+        intervals = {policy.interval(['rejected']) for _ in range(100)}
+        assert len(intervals) > 1, 'Интервалы должны различаться'
+        assert all(540 <= interval <= 660 for interval in intervals)
+
+
+class TestPollScheduler:
+
+    def test_pop_due_in_time_order(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=0, clock=clock.monotonic)
+        scheduler.schedule('b', 20)
+        scheduler.schedule('a', 10)
+        scheduler.schedule('c', 30)
+        assert scheduler.pop_due() == []
+        assert scheduler.wait_time() == 10
+
+        clock.now = 25
+        assert scheduler.pop_due() == ['a', 'b']
+        assert len(scheduler) == 1
+
+    def test_reschedule_and_remove(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=0, clock=clock.monotonic)
+        scheduler.schedule('a', 10)
+        scheduler.schedule('a', 50)
+        scheduler.schedule('b', 10)
+        scheduler.remove('b')
+        clock.now = 20
+        assert scheduler.pop_due() == [], (
+            'Перепланированные и удаленные записи не должны срабатывать'
+        )
+        clock.now = 60
+        assert scheduler.pop_due() == ['a']
+        assert scheduler.wait_time() is None
+
+    def test_budget_spreads_burst(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=10, clock=clock.monotonic)
+        for key in range(25):
+            scheduler.schedule(key, 0)
+        assert len(scheduler.pop_due()) == 10
+        assert scheduler.pop_due() == []
+        assert scheduler.wait_time() > 0
+        clock.now = 0.5
+        assert len(scheduler.pop_due()) == 5
+
+    def test_many_subscriptions(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=0, clock=clock.monotonic)
+        for key in range(50000):
+            scheduler.schedule(key, key % 600)
+        for key in range(0, 50000, 2):
+            scheduler.schedule(key, 1000)
+        assert len(scheduler.heap) <= 2 * len(scheduler) + 64
+        clock.now = 600
+        assert len(scheduler.pop_due()) == 25000
+
+    def test_scheduler_reports_lag(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=0, clock=clock.monotonic)
+        scheduler.schedule('a', 10)
+        clock.now = 13
+        lags = []
+        assert scheduler.pop_due(lags) == ['a']
+        assert lags == [3]
+
+    def test_pop_due_limit(self):
+        clock = VirtualClock()
+        scheduler = PollScheduler(budget=0, clock=clock.monotonic)
+        for key in 'abc':
+            scheduler.schedule(key, 0)
+        assert scheduler.pop_due(limit=2) == ['a', 'b']
+        assert scheduler.pop_due(limit=2) == ['c'], (
+            'Подписки сверх лимита должны остаться в расписании'
+        )
@@ -0,0 +1,147 @@
+from collections import Counter
+
+import pytest
+
+from clock import VirtualClock
+from sharding import HashRing, LeaseTable, ShardedRegistry
+from subscriptions import Subscription, SubscriptionRegistry
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(1000.0)
+
+
+@pytest.fixture
+def make_worker(tmp_path, clock):
+    path = str(tmp_path / 'subs.jsonl')
+    with open(path, 'w', encoding='utf-8') as file:
+        for number in range(1, 201):
+            file.write(f'{{"token": "t{number}", "chat_id": {number}}}\n')
+    workers = []
+
+    def make(worker_id):
+        registry = SubscriptionRegistry(path)
+        leases = LeaseTable(
+            str(tmp_path / 'shards.sqlite'), worker_id, ttl=90,
+            clock=clock.time)
+        worker = ShardedRegistry(registry, leases)
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.leases.connection.close()
+
+
+def owners(workers):
+    result = Counter()
+    for worker in workers:
+        result.update(subscription.uid for subscription in worker)
+    return result
+
+
+class TestHashRing:
+
+    def test_balance_and_minimal_movement(self):
+        keys = [f'key{number}' for number in range(3000)]
+        ring = HashRing(['a', 'b', 'c'])
+        shares = Counter(ring.node(key) for key in keys)
+        assert min(shares.values()) > 600, (
+            f'Подписки распределены неравномерно: {shares}'
+        )
+        grown = HashRing(['a', 'b', 'c', 'd'])
+        moved = [key for key in keys if ring.node(key) != grown.node(key)]
+        assert all(grown.node(key) == 'd' for key in moved), (
+            'При добавлении узла подписки должны переезжать только на него'
+        )
+        assert len(moved) < len(keys) / 3
+
+    def test_empty_ring(self):
+        assert HashRing([]).node('key') is None
+
+
+class TestShardedRegistry:
+
+    def test_join_and_leave_without_double_ownership(
+            self, make_worker, clock):
+        first = make_worker('a')
+        added, _ = first.reload()
+        assert len(added) == 200, 'Единственный воркер берет все подписки'
+        second = make_worker('b')
+        assert second.reload() == ([], []), (
+            'Чужие действующие аренды нельзя забрать'
+        )
+        clock.now += 10
+        _, removed = first.reload()
+        assert 0 < len(removed) < 200
+        added, _ = second.reload()
+        assert len(added) == len(removed)
+        counts = owners([first, second])
+        assert len(counts) == 200 and set(counts.values()) == {1}, (
+            'Каждую подписку должен опрашивать ровно один воркер'
+        )
+        first.close()
+        added, _ = second.reload()
+        assert len(added) == 200 - len(removed) and len(second) == 200, (
+            'Подписки ушедшего воркера должны перейти к оставшемуся'
+        )
+
+    def test_expired_lease_is_taken_over(self, make_worker, clock):
+        first = make_worker('a')
+        first.reload()
+        second = make_worker('b')
+        clock.now += 91
+        second.reload()
+        assert len(second) == 200, (
+            'Аренды упавшего воркера забираются после истечения срока'
+        )
+
+    def test_cursor_moves_with_lease(self, make_worker, clock):
+        first = make_worker('a')
+        first.reload()
+        for subscription in first:
+            subscription.cursor = 555
+        second = make_worker('b')
+        second.reload()
+        clock.now += 10
+        first.reload()
+        second.reload()
+        assert len(second) and {
+            subscription.cursor for subscription in second} == {555}, (
+            'Новый владелец должен продолжать опрос с отметки прежнего'
+        )
+
+    def test_claim_only_own_subscriptions(self, make_worker):
+        first = make_worker('a')
+        second = make_worker('b')
+        first.reload()
+        second.reload()
+        subscription = Subscription('new', 1000)
+        assert first.subscribe(subscription)
+        claims = [first.claim(subscription), second.claim(subscription)]
+        assert sorted(claims) == [False, True], (
+            'Новую подписку должен взять только ее владелец по кольцу'
+        )
+        owner = first if claims[0] else second
+        owner.reload()
+        assert [item.chat_id for item in owner.unsubscribe(1000)] == [1000]
+        assert subscription.uid not in owner.owned
+
+    def test_status_requests_reach_owner(self, make_worker, clock):
+        first = make_worker('a')
+        second = make_worker('b')
+        for worker in (first, second, first, second):
+            worker.reload()
+        remote = next(iter(second))
+        forwarded = first.forward_status(remote.chat_id)
+        assert [item.uid for item in forwarded] == [remote.uid]
+        assert first.forward_status(next(iter(first)).chat_id) == []
+        assert first.status_requests() == []
+        assert second.status_requests() == [remote.chat_id]
+        assert second.status_requests() == [], 'Запрос забирается один раз'
+        first.forward_status(remote.chat_id)
+        clock.advance(91)
+        assert second.status_requests() == [], (
+            'Незабранный за срок аренды запрос устаревает'
+        )
@@ -0,0 +1,174 @@
+import random
+import time
+
+import pytest
+
+import engine
+import exceptions
+import homework
+import simulate
+import transport
+from clock import SYSTEM_CLOCK, VirtualClock
+from ratelimit import Backoff
+from scheduler import IntervalPolicy
+from state import MemoryState
+from subscriptions import Subscription
+from threaded import ThreadedPoller
+
+
+class StopLoop(Exception):
+    pass
+
+
+class CountingClock(VirtualClock):
+
+    def __init__(self, start, sleeps):
+        super().__init__(start)
+        self.delays = []
+        self.sleeps = sleeps
+
+    def sleep(self, seconds):
+        self.delays.append(seconds)
+        super().sleep(seconds)
+        if len(self.delays) >= self.sleeps:
+            raise StopLoop
+
+
+def without_elapsed(result):
+    return {key: value for key, value in result.items() if key != 'elapsed'}
+
+
+class TestClock:
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(100)
+        clock.sleep(50)
+        assert clock.time() == clock.monotonic() == 150
+        clock.advance(-10)
+        clock.advance_to(120)
+        assert clock.now == 150, 'Виртуальные часы не идут назад'
+        clock.advance_to(200)
+        assert clock.now == 200
+        assert abs(SYSTEM_CLOCK.time() - time.time()) < 1
+
+    def test_seeded_intervals_repeat(self):
+        def delays(seed):
+            rng = random.Random(seed)
+            policy = IntervalPolicy(600, 120, 1800, 0.1, rng=rng)
+            backoff = Backoff(30, 3600, rng=rng)
+            return [policy.interval(('reviewing',)), backoff.delay(3)]
+
+        assert delays(1) == delays(1), (
+            'С одним seed интервалы и паузы повторяются'
+        )
+        assert 108 <= delays(1)[0] <= 132 and 60 <= delays(1)[1] <= 120
+
+    def test_pollers_run_on_injected_clock(self):
+        clock = VirtualClock(5000)
+        poller = engine.PollEngine(None, clock=clock)
+        subscription = Subscription('t', 1)
+        poller.start(subscription)
+        assert subscription.cursor == 5000, (
+            'Начальная отметка берется из переданных часов'
+        )
+        assert poller.scheduler.wait_time() == 0
+        poller.scheduler.pop_due()
+        poller.scheduler.schedule(subscription.key, 600)
+        clock.advance(600)
+        assert poller.scheduler.pop_due() == [subscription.key]
+        poller.breaker.threshold = 1
+        poller.breaker.failure(exceptions.ApiServerError('Сбой'))
+        clock.advance(poller.breaker.reset_timeout)
+        assert poller.breaker.allow(), (
+            'Размыкатель отсчитывает паузу по переданным часам'
+        )
+        threaded = ThreadedPoller(None, clock=clock)
+        other = Subscription('t2', 2)
+        threaded.start(other)
+        assert other.cursor == clock.now
+        assert threaded.timeout(clock.now + 30) == 0, (
+            'Подписка только что запланирована по тем же часам'
+        )
+
+    def test_main_sleeps_on_injected_clock(self, monkeypatch):
+        state = MemoryState()
+        monkeypatch.setattr(homework, 'check_tokens', lambda: True)
+        monkeypatch.setattr(homework, 'load_state', lambda: state)
+        monkeypatch.setattr(transport, 'open_session', lambda: None)
+        cursors = []
+
+        def get_api_answer(current_timestamp):
+            cursors.append(current_timestamp)
+            return {'homeworks': [], 'current_date': current_timestamp + 1}
+
+        monkeypatch.setattr(homework, 'get_api_answer', get_api_answer)
+        clock = CountingClock(start=5000, sleeps=3)
+        with pytest.raises(StopLoop):
+            homework.main(clock)
+        assert cursors == [5000, 5001, 5002], (
+            'Начальная отметка берется из переданных часов'
+        )
+        assert clock.now == pytest.approx(5000 + sum(clock.delays)), (
+            'Цикл опроса спит на переданных часах, а не в реальном времени'
+        )
+
+
+class TestSimulation:
+
+    def test_same_seed_same_result(self):
+        first = simulate.Simulation(200, seed=7).run(simulate.DAY)
+        second = simulate.Simulation(200, seed=7).run(simulate.DAY)
+        assert without_elapsed(first) == without_elapsed(second)
+        assert first['notifications'] + first['collapsed'] == (
+            first['transitions'])
+        assert 0 < first['latency_p50'] <= first['latency_max']
+
+    def test_faster_policy_costs_requests(self):
+        def run(text):
+            simulation = simulate.Simulation(
+                300, simulate.parse_policy(text), budget=0, seed=1)
+            return simulation.run(2 * simulate.DAY)
+
+        fast, slow = run('300,60,900'), run('1200,600,3600')
+        assert fast['requests'] > 2 * slow['requests']
+        assert fast['latency_p90'] < slow['latency_p90'], (
+            'Частый опрос быстрее замечает смены статусов'
+        )
+        assert fast['budget_mean'] is None and fast['lag_max'] == 0, (
+            'Без бюджета опросы не опаздывают'
+        )
+
+    def test_budget_saturation(self):
+        result = simulate.Simulation(
+            1000, budget=1, seed=2).run(simulate.DAY)
+        assert result['budget_mean'] > 0.95
+        assert result['budget_peak'] <= 1.0
+        assert result['lag_mean'] > 60, (
+            'Спрос выше бюджета откладывает опросы'
+        )
+
+    def test_outage_opens_breaker(self):
+        outage = (3600, 3 * 3600)
+        result = simulate.Simulation(
+            500, budget=0, seed=3, outages=[outage]).run(simulate.DAY)
+        assert 0 < result['errors'] < 100, (
+            'Во время сбоя размыкатель пропускает только пробные запросы'
+        )
+        assert simulate.parse_outage('1:2') == outage
+
+    def test_sample_scales_totals(self):
+        full = simulate.Simulation(2000, budget=0, seed=4).run(simulate.DAY)
+        sampled = simulate.Simulation(
+            2000, budget=0, seed=4, sample=0.25).run(simulate.DAY)
+        assert sampled['simulated'] == 500
+        assert sampled['subscriptions'] == 2000
+        assert sampled['requests'] == pytest.approx(full['requests'], 0.1)
+
+    def test_weeks_of_50k_subscriptions(self):
+        started = time.perf_counter()
+        result = simulate.Simulation(
+            50000, sample=0.01, seed=5).run(14 * simulate.DAY)
+        elapsed = time.perf_counter() - started
+        assert result['subscriptions'] == 50000
+        assert result['requests'] > 10 ** 7
+        assert elapsed < 30, f'Две недели опроса заняли {elapsed:.1f} с'
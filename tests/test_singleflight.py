@@ -0,0 +1,149 @@
+import asyncio
+
+from singleflight import COALESCED, SingleFlight, TokenGroups
+from subscriptions import Subscription, SubscriptionRegistry
+from tests import test_engine, test_threaded
+
+RESPONSE = {
+    'homeworks': [{'id': 1, 'homework_name': 'hw', 'status': 'approved'}],
+    'current_date': 200,
+}
+
+
+class SlowApi:
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, session, subscription, current_timestamp):
+        self.calls.append((subscription.key, current_timestamp))
+        await asyncio.sleep(0.05)
+        return RESPONSE
+
+
+def make_registry(tmp_path):
+    registry = SubscriptionRegistry(str(tmp_path / 'missing.jsonl'))
+    for chat in (1, 2, 3):
+        registry.add(Subscription('t', chat, cursor=100))
+    return registry
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_one_request(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def request(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            if value == 'bad':
+                raise ValueError(value)
+            return value
+
+        async def run():
+            results = await asyncio.gather(
+                flights.do('a', request, 'a'), flights.do('a', request, 'a'),
+                flights.do('b', request, 'b'),
+                *(flights.do('bad', request, 'bad') for _ in range(2)),
+                return_exceptions=True)
+            assert len(flights) == 0, 'Завершенный запрос не остается'
+            return results
+
+        coalesced = COALESCED.get()
+        results = asyncio.run(run())
+        assert calls == ['a', 'b', 'bad'], (
+            'Одновременные вызовы с одним ключом делают один запрос'
+        )
+        assert results[:3] == ['a', 'a', 'b']
+        assert all(isinstance(error, ValueError) for error in results[3:]), (
+            'Ошибка общего запроса достается всем ожидающим'
+        )
+        assert COALESCED.get() - coalesced == 2
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        flights = SingleFlight()
+
+        async def request():
+            await asyncio.sleep(0.02)
+            return 'done'
+
+        async def run():
+            first = asyncio.ensure_future(flights.do('a', request))
+            second = asyncio.ensure_future(flights.do('a', request))
+            await asyncio.sleep(0)
+            first.cancel()
+            assert await second == 'done', (
+                'Отмена одного ожидающего не прерывает запрос для других'
+            )
+            third = asyncio.ensure_future(flights.do('b', request))
+            await asyncio.sleep(0)
+            flight = flights.flights['b']
+            third.cancel()
+            await asyncio.sleep(0.001)
+            assert flight.future.cancelled() and not flights, (
+                'Запрос без ожидающих отменяется'
+            )
+
+        asyncio.run(run())
+
+    def test_token_groups(self):
+        groups = TokenGroups()
+        first, second = Subscription('t', 1), Subscription('t', 2)
+        groups.add(first)
+        assert not groups.shared(first)
+        groups.add(second)
+        groups.add(second)
+        assert groups.shared(first) and groups.shared(second)
+        groups.discard(second)
+        assert not groups.shared(first)
+        groups.discard(first)
+        assert groups.keys == {}
+
+
+class TestCoalescedPolls:
+
+    def test_engine_fans_out_shared_response(self, tmp_path):
+        api, telegram = SlowApi(), test_engine.FakeTelegram()
+        poller = test_engine.make_engine(
+            tmp_path, api, telegram, commands=False)
+        shared = [Subscription('t', chat, cursor=100) for chat in (1, 2, 3)]
+        alone = Subscription('u', 4, cursor=100)
+
+        async def run():
+            for subscription in shared + [alone]:
+                poller.start(subscription)
+            await asyncio.gather(*(
+                poller.poll_once(None, subscription)
+                for subscription in shared + [alone]))
+            await test_engine.drain(poller)
+
+        asyncio.run(run())
+        assert sorted(api.calls, key=repr) == [
+            (('u', '4'), 100), (None, 100)], (
+            'Подписки с общим токеном опрашиваются одним запросом, '
+            'без ключа кеша отдельной подписки'
+        )
+        assert sorted(chat for chat, _ in telegram.sent) == [1, 2, 3, 4], (
+            'Ответ общего запроса получает каждый чат'
+        )
+        assert all(
+            subscription.cursor == 200 for subscription in shared + [alone])
+
+    def test_threaded_fans_out_shared_response(self, tmp_path):
+        api = test_threaded.FakeApi(delay=0.02)
+        telegram = test_threaded.FakeTelegram()
+        poller = test_threaded.make_poller(api, telegram, workers=4)
+        registry = make_registry(tmp_path)
+        coalesced = COALESCED.get()
+        test_threaded.run_for(poller, registry, 0.3)
+        polls = len([
+            message for chat, message in telegram.sent if chat == 1])
+        assert api.calls['t'] < 2 * polls, (
+            'Подписки с общим токеном должны делить запросы'
+        )
+        assert COALESCED.get() > coalesced
+        assert api.overlaps == 0, 'Общий токен не опрашивается параллельно'
+        assert {chat for chat, _ in telegram.sent} == {1, 2, 3}
+        assert all(subscription.cursor > 100 for subscription in registry)
+
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET = 1.0
+FIRST_POLL_BUDGET = 3.0
+HEAVY_MODULES = ('telegram', 'requests', 'aiohttp', 'asyncio', 'http.server')
+
+SCRIPT = '''
+import sys
+import time
+
+started = time.perf_counter()
+import homework
+imported = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+homework.ENDPOINT = {url!r}
+homework.get_api_answer(0)
+polled = time.perf_counter() - started
+print(imported, polled, ','.join(heavy))
+'''
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = json.dumps({'homeworks': [], 'current_date': 1}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+class TestStartup:
+
+    def test_import_and_first_poll_time(self, api_url):
+        script = SCRIPT.format(heavy=HEAVY_MODULES, url=api_url)
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=ROOT, capture_output=True,
+            text=True, timeout=60, check=True)
+        imported, polled, heavy = result.stdout.split(' ')
+        heavy = heavy.strip()
+        assert not heavy, (
+            f'Импорт homework не должен загружать тяжелые модули: {heavy}'
+        )
+        assert float(imported) < IMPORT_BUDGET, (
+            f'Импорт homework занял {float(imported):.3f} с'
+        )
+        assert float(polled) < FIRST_POLL_BUDGET, (
+            f'Первый опрос после запуска занял {float(polled):.3f} с'
+        )
@@ -0,0 +1,155 @@
+import asyncio
+
+import engine
+import exceptions
+import homework
+from state import FileState, MemoryState
+from subscriptions import Subscription
+
+RESPONSE = {
+    'homeworks': [{'id': 7, 'homework_name': 'hw7', 'status': 'reviewing'}],
+    'current_date': 2000
+}
+
+
+class FlakyTelegram:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def __call__(self, session, bot_token, chat_id, message):
+        if self.fail:
+            raise exceptions.SendMessageError('Telegram недоступен')
+        self.sent.append((chat_id, message))
+
+
+async def fetch(session, subscription, current_timestamp):
+    return RESPONSE
+
+
+def poll(state, telegram):
+    poller = engine.PollEngine('1:token', fetch=fetch, send=telegram,
+                               state=state)
+    subscription = Subscription('a', 1)
+    poller.restore(subscription)
+
+    async def run():
+        await poller.poll_once(None, subscription)
+        for chat in state.pending_chats():
+            try:
+                await poller.outbox.deliver(None, chat)
+            except exceptions.SendMessageError:
+                pass
+
+    asyncio.run(run())
+    return subscription
+
+
+class TestFileState:
+
+    def test_replay_restores_state(self, tmp_path):
+        state = FileState(str(tmp_path)).load()
+        state.set_cursor('u', 100)
+        state.commit_homework(
+            'u', homework.Homework(1, 'hw1', 'reviewing'), 5, 'm1')
+        second = state.enqueue(5, 'm2')
+        state.ack(second)
+        state.set_message('u', 'ошибка')
+        state.flush()
+
+        restored = FileState(str(tmp_path)).load()
+        assert restored.cursors == {'u': 100}
+        assert restored.messages == {'u': 'ошибка'}
+        assert restored.index.status(('u', 1)) == 'reviewing'
+        assert restored.pending() == [(1, 5, 'm1')]
+        assert restored.enqueue(5, 'm3') == 3
+
+    def test_compaction_keeps_state(self, tmp_path):
+        state = FileState(str(tmp_path), compact_every=10).load()
+        for cursor in range(25):
+            state.set_cursor('u', cursor)
+            state.flush()
+        assert state.records < 10, 'Журнал должен сжиматься в снимок'
+        state.close()
+
+        restored = FileState(str(tmp_path)).load()
+        assert restored.cursors == {'u': 24}
+        assert restored.records == 0
+
+    def test_torn_journal_tail_is_skipped(self, tmp_path):
+        state = FileState(str(tmp_path)).load()
+        state.set_cursor('u', 1)
+        state.flush()
+        with open(state.journal_path, 'a', encoding='utf-8') as journal:
+            journal.write('["c","u",')
+        assert FileState(str(tmp_path)).load().cursors == {'u': 1}
+
+    def test_writes_after_torn_tail_survive(self, tmp_path):
+        for tail in ('["c","u2",2', '["c","u2",2]'):
+            path = str(tmp_path / str(len(tail)))
+            state = FileState(path).load()
+            state.set_cursor('u1', 1)
+            state.flush()
+            with open(state.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(tail)
+            state = FileState(path).load()
+            state.set_cursor('u3', 300)
+            state.flush()
+            restored = FileState(path).load()
+            assert restored.cursors.get('u3') == 300, (
+                'Запись после оборванной строки не должна склеиваться с ней'
+            )
+            assert restored.cursors['u1'] == 1
+
+
+class TestWarmRestart:
+
+    def test_restart_does_not_resend(self, tmp_path):
+        telegram = FlakyTelegram()
+        state = FileState(str(tmp_path)).load()
+        poll(state, telegram)
+        state.close()
+        assert len(telegram.sent) == 1
+
+        state = FileState(str(tmp_path)).load()
+        subscription = poll(state, telegram)
+        assert len(telegram.sent) == 1, (
+            'После перезапуска статус не должен отправляться повторно'
+        )
+        assert subscription.cursor == 2000
+
+    def test_undelivered_message_survives_restart(self, tmp_path):
+        state = FileState(str(tmp_path)).load()
+        poll(state, FlakyTelegram(fail=True))
+        state.close()
+
+        telegram = FlakyTelegram()
+        state = FileState(str(tmp_path)).load()
+        assert len(state.pending()) == 1
+        poll(state, telegram)
+        assert telegram.sent == [
+            (1, 'Изменился статус проверки работы "hw7". '
+                'Работа взята на проверку ревьюером.')
+        ]
+        assert state.pending() == []
+
+    def test_sync_outbox_sends_to_entry_chat(self):
+        class Bot:
+            sent = []
+
+            def send_message(self, chat_id, message):
+                self.sent.append((chat_id, message))
+
+        state = MemoryState()
+        state.enqueue(11, 'первому')
+        state.enqueue(22, 'второму')
+        homework.send_pending(Bot(), state)
+        assert Bot.sent == [(11, 'первому'), (22, 'второму')], (
+            'Сообщение из общих исходящих уходит в свой чат'
+        )
+        assert state.pending() == []
+
+    def test_memory_state_is_default(self):
+        poller = engine.PollEngine('1:token')
+        assert isinstance(poller.state, MemoryState)
@@ -0,0 +1,35 @@
+from homework import Homework
+from status_index import StatusIndex
+
+
+class TestStatusIndex:
+
+    def test_changed_returns_only_transitions(self):
+        index = StatusIndex()
+        records = [
+            Homework(1, 'hw1', 'reviewing'),
+            Homework(2, 'hw2', 'rejected'),
+        ]
+        assert index.changed_records('u', records) == records
+        for record in records:
+            index.set(('u', record.key), record.status)
+        assert index.changed_records('u', records) == []
+        assert index.changed_records('other', records) == records, (
+            'Индекс должен различать подписки'
+        )
+
+        moved = Homework(1, 'hw1', 'approved')
+        assert index.changed_records('u', [moved, records[1]]) == [moved]
+
+    def test_finished_homeworks_are_evicted(self):
+        index = StatusIndex(finished_limit=2)
+        for number in range(5):
+            index.set(('u', number), 'approved')
+        index.set(('u', 10), 'reviewing')
+        assert len(index) == 3
+        assert index.status(('u', 4)) == 'approved'
+        assert index.status(('u', 0)) is None
+        assert index.status(('u', 10)) == 'reviewing'
+
+        index.forget('u')
+        assert len(index) == 0
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import pytest
+
+import engine
+import exceptions
+import homework
+import stand
+import transport
+from streaming import JsonStreamParser
+from subscriptions import Subscription
+
+RESPONSE = {
+    'current_date': 1650000000,
+    'homeworks': [
+        {'id': number, 'homework_name': f'работа {number}',
+         'status': 'approved', 'reviewer_comment': 'ж' * number}
+        for number in range(50)
+    ],
+    'extra': [1, {'a': None}],
+}
+BODY = json.dumps(RESPONSE, ensure_ascii=False, indent=1).encode()
+
+
+class FakeStreamResponse:
+
+    def __init__(self, body, chunk_size=7):
+        self.body = body
+        self.content = body
+        self.chunk_size = chunk_size
+        self.headers = {'Content-Length': str(len(body))}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class TestJsonStreamParser:
+
+    @pytest.mark.parametrize('size', [1, 3, 64, len(BODY)])
+    def test_items_and_fields(self, size):
+        parser = JsonStreamParser('homeworks')
+        items = []
+        for start in range(0, len(BODY), size):
+            items.extend(parser.feed(BODY[start:start + size]))
+        assert items == RESPONSE['homeworks']
+        assert parser.close() == {
+            'current_date': 1650000000, 'extra': [1, {'a': None}]}, (
+            'Число на границе частей не должно обрезаться'
+        )
+
+    def test_buffer_is_bounded(self):
+        parser = JsonStreamParser('homeworks')
+        longest = 0
+        for start in range(0, len(BODY), 16):
+            parser.feed(BODY[start:start + 16])
+            longest = max(longest, len(parser.buffer))
+        assert longest < 200, 'Разобранные элементы не держатся в буфере'
+
+    @pytest.mark.parametrize('body', [
+        b'{"homeworks": [{"id": 1},', b'[]', b'{"a": 1} {}', b'{"a" 1}'])
+    def test_invalid(self, body):
+        parser = JsonStreamParser('homeworks')
+        with pytest.raises(ValueError):
+            parser.feed(body)
+            parser.close()
+
+
+class TestReadResponse:
+
+    def test_large_body_is_streamed(self, monkeypatch):
+        monkeypatch.setattr(homework, 'STREAM_THRESHOLD', 100)
+        response = homework.read_response(FakeStreamResponse(BODY))
+        assert response['current_date'] == 1650000000
+        assert response['homeworks'][3] == homework.Homework(
+            3, 'работа 3', 'approved')
+        assert homework.parse_homeworks(homework.check_response(response)) == (
+            response['homeworks'])
+
+    def test_small_body_is_parsed_whole(self, monkeypatch):
+        monkeypatch.setattr(homework, 'STREAM_THRESHOLD', len(BODY))
+        response = homework.read_response(FakeStreamResponse(BODY))
+        assert response == RESPONSE
+
+    def test_broken_body(self, monkeypatch):
+        monkeypatch.setattr(homework, 'STREAM_THRESHOLD', 1)
+        with pytest.raises(exceptions.MyResponseError):
+            homework.read_response(FakeStreamResponse(BODY[:-20]))
+
+    def test_engine_streams(self, monkeypatch):
+        monkeypatch.setattr(homework, 'STREAM_THRESHOLD', 1)
+
+        async def run():
+            runner, url = await stand.start(
+                stand.Stand(homeworks=20, payload=1000, change_rate=0))
+            monkeypatch.setattr(homework, 'ENDPOINT', url + stand.API_PATH)
+            try:
+                async with transport.async_session() as session:
+                    return await engine.fetch_api_answer(
+                        session, Subscription('a', 1), 1)
+            finally:
+                await runner.cleanup()
+
+        response = asyncio.run(run())
+        assert len(response['homeworks']) == 20
+        assert response['homeworks'][0] == homework.Homework(
+            0, 'a/hw0', 'reviewing')
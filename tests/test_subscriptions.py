@@ -0,0 +1,57 @@
+import json
+import sys
+
+import subscriptions
+
+
+def write_subscriptions(path, entries):
+    path.write_text(
+        '\n'.join(json.dumps(entry) for entry in entries), encoding='utf-8')
+
+
+class TestSubscriptionRegistry:
+
+    def test_reload_skips_invalid_entries(self, tmp_path):
+        path = tmp_path / 'subscriptions.jsonl'
+        path.write_text(
+            '{"token": "a", "chat_id": 1}\n'
+            '# комментарий\n'
+            '{"token": "", "chat_id": 2}\n'
+            'не json\n'
+            '{"token": "c", "chat_id": 3}\n',
+            encoding='utf-8'
+        )
+        registry = subscriptions.SubscriptionRegistry(str(path))
+        added, removed = registry.reload()
+        assert len(registry) == 2
+        assert {s.chat_id for s in added} == {1, 3}
+        assert removed == []
+
+    def test_hot_reload_keeps_poll_state(self, tmp_path):
+        path = tmp_path / 'subscriptions.jsonl'
+        write_subscriptions(path, [{'token': 'a', 'chat_id': 1},
+                                   {'token': 'b', 'chat_id': 2}])
+        registry = subscriptions.SubscriptionRegistry(str(path))
+        registry.reload()
+        kept = registry.subscriptions[('a', '1')]
+        kept.cursor = 1500
+
+        write_subscriptions(path, [{'token': 'a', 'chat_id': 1},
+                                   {'token': 'c', 'chat_id': 3},
+                                   {'token': 'd', 'chat_id': 4}])
+        added, removed = registry.reload()
+        assert [s.chat_id for s in removed] == [2]
+        assert sorted(s.chat_id for s in added) == [3, 4]
+        assert registry.subscriptions[('a', '1')] is kept
+        assert kept.cursor == 1500
+        assert registry.reload() == ([], [])
+
+    def test_env_fallback(self, tmp_path):
+        registry = subscriptions.load_registry(
+            str(tmp_path / 'missing.jsonl'), token='t', chat_id=1)
+        assert [s.key for s in registry] == [('t', '1')]
+
+    def test_subscription_is_compact(self):
+        subscription = subscriptions.Subscription('token', 1)
+        assert not hasattr(subscription, '__dict__')
+        assert sys.getsizeof(subscription) <= 64
@@ -0,0 +1,161 @@
+import threading
+import time
+
+import exceptions
+from ratelimit import KeyedLimiter, TokenBucket
+from scheduler import IntervalPolicy, PollScheduler
+from subscriptions import Subscription, SubscriptionRegistry
+from threaded import ThreadedPoller
+
+STATUSES = ('reviewing', 'rejected')
+
+
+class FakeApi:
+    """Ответ со сменой статуса на каждом опросе и учетом параллельности."""
+
+    def __init__(self, delay=0.01, errors=()):
+        self.delay = delay
+        self.errors = set(errors)
+        self.lock = threading.Lock()
+        self.active = set()
+        self.running = 0
+        self.max_running = 0
+        self.overlaps = 0
+        self.calls = {}
+
+    def __call__(self, subscription, current_timestamp):
+        token = subscription.token
+        with self.lock:
+            if token in self.active:
+                self.overlaps += 1
+            self.active.add(token)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            call = self.calls.get(token, 0)
+            self.calls[token] = call + 1
+        time.sleep(self.delay)
+        with self.lock:
+            self.active.discard(token)
+            self.running -= 1
+        if token in self.errors:
+            raise exceptions.ApiServerError('Неудачный ответ API')
+        return {
+            'homeworks': [{
+                'id': 1, 'homework_name': f'hw-{token}',
+                'status': STATUSES[call % 2]}],
+            'current_date': current_timestamp + 1,
+        }
+
+
+class FakeTelegram:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def __call__(self, bot, chat_id, message):
+        time.sleep(0.001)
+        with self.lock:
+            self.sent.append((chat_id, message))
+
+
+def make_poller(api, telegram, workers=4):
+    poller = ThreadedPoller(
+        None, workers=workers, fetch=api, send=telegram,
+        policy=IntervalPolicy(0.01, 0.01, 0.01, 0),
+        scheduler=PollScheduler(budget=0), reload_interval=60)
+    poller.limiter = TokenBucket(0)
+    poller.chat_limiter = KeyedLimiter(0)
+    return poller
+
+
+def run_for(poller, registry, seconds):
+    thread = threading.Thread(target=poller.run, args=(registry,))
+    thread.start()
+    time.sleep(seconds)
+    poller.stop_polling()
+    thread.join()
+
+
+def make_registry(tmp_path, count):
+    registry = SubscriptionRegistry(str(tmp_path / 'missing.jsonl'))
+    for number in range(count):
+        registry.add(Subscription(str(number), number, cursor=100))
+    return registry
+
+
+class TestThreadedPoller:
+
+    def test_bounded_concurrency_and_order(self, tmp_path):
+        api, telegram = FakeApi(), FakeTelegram()
+        poller = make_poller(api, telegram, workers=4)
+        registry = make_registry(tmp_path, 20)
+        run_for(poller, registry, 0.5)
+        assert api.max_running <= 4, (
+            'Одновременных опросов не должно быть больше размера пула'
+        )
+        assert api.max_running > 1, 'Опросы должны идти параллельно'
+        assert api.overlaps == 0, (
+            'Подписка не должна опрашиваться двумя потоками сразу'
+        )
+        assert all(api.calls[str(number)] > 1 for number in range(20))
+        chats = {}
+        for chat_id, message in telegram.sent:
+            chats.setdefault(chat_id, []).extend(message.split('\n\n'))
+        for parts in chats.values():
+            verdicts = ['замечания' in part for part in parts]
+            assert all(
+                first != second
+                for first, second in zip(verdicts, verdicts[1:])), (
+                'Уведомления чата должны приходить в порядке смен статуса'
+            )
+        assert all(
+            subscription.cursor > 100 for subscription in registry)
+
+    def test_error_reported_once(self, tmp_path):
+        api, telegram = FakeApi(errors={'0'}), FakeTelegram()
+        poller = make_poller(api, telegram, workers=2)
+        poller.backoff.base = 0.01
+        poller.backoff.maximum = 0.01
+        run_for(poller, make_registry(tmp_path, 1), 0.3)
+        assert api.calls['0'] > 1, 'Ошибка должна повторяться с отступом'
+        assert telegram.sent == [(0, 'Неудачный ответ API')], (
+            'Об одной и той же ошибке сообщаем один раз'
+        )
+
+    def test_failed_send_is_retried(self, tmp_path):
+        api = FakeApi()
+        failures = []
+
+        def flaky(bot, chat_id, message):
+            if not failures:
+                failures.append(message)
+                raise exceptions.SendMessageError('Ошибка отправки')
+            telegram(bot, chat_id, message)
+
+        telegram = FakeTelegram()
+        poller = make_poller(api, flaky, workers=2)
+        poller.send_backoff.base = 0.01
+        poller.send_backoff.maximum = 0.01
+        run_for(poller, make_registry(tmp_path, 1), 0.3)
+        assert failures and telegram.sent, (
+            'Сообщение должно уйти после ошибки отправки'
+        )
+        assert telegram.sent[0][1].startswith(failures[0]), (
+            'Повторная отправка должна начинаться с недоставленного'
+        )
+
+    def test_failed_alert_does_not_stop_polling(self, tmp_path):
+        api, telegram = FakeApi(errors={'0'}), FakeTelegram()
+        poller = make_poller(api, telegram, workers=2)
+        poller.backoff.base = 0.01
+        poller.backoff.maximum = 0.01
+
+        def broken(subscription, error):
+            raise AttributeError('txt')
+
+        poller.alerts.failure = broken
+        run_for(poller, make_registry(tmp_path, 1), 0.3)
+        assert api.calls['0'] > 1, (
+            'Сбой сообщения об ошибке не должен останавливать опрос'
+        )
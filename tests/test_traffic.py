@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+import bench
+import engine
+import exceptions
+import homework
+import stand
+import traffic
+from clock import VirtualClock
+from subscriptions import Subscription
+
+PRIVATE = {
+    'id': 7, 'homework_name': 'ivanov__hw05_final.zip',
+    'status': 'reviewing', 'reviewer_comment': 'Секретный отзыв',
+    'lesson_name': 'Урок', 'date_updated': '2022-01-01T00:00:00Z',
+    'student_email': 'ivanov@example.com',
+}
+
+
+def record_trace(path):
+    clock = VirtualClock(1000.0)
+    recorder = traffic.Recorder(str(path), clock.time)
+    subscription = Subscription('secret-token', 555)
+    steps = (
+        (0, [dict(PRIVATE)]),
+        (10, []),
+        (10, []),
+        (20, [dict(PRIVATE, status='approved')]),
+    )
+    for moment, homeworks in steps:
+        clock.now = 1000 + moment
+        recorder.answer(
+            subscription, 1, {'homeworks': homeworks, 'current_date': 2})
+    clock.now = 1030
+    recorder.failure(
+        subscription, 2, exceptions.ApiServerError('Ошибка сервера API'))
+    recorder.sent(555, 'Сообщение студенту')
+    recorder.close()
+
+
+class TestCapture:
+
+    @pytest.mark.parametrize('name', ['trace.jsonl', 'trace.jsonl.gz'])
+    def test_record_sanitizes_and_loads(self, tmp_path, name):
+        path = tmp_path / name
+        record_trace(path)
+        with traffic.open_trace(str(path), 'r') as file:
+            text = file.read()
+        for secret in ('secret-token', 'ivanov', 'Секретный', '555',
+                       'Сообщение', 'student_email'):
+            assert secret not in text, f'В трассу попало {secret!r}'
+        records = [json.loads(line) for line in text.splitlines()]
+        assert [record[0] for record in records] == [
+            'a', 'a', 'a', 'a', 'e', 's']
+        assert records[2][5] is None, 'Повтор ответа пишется без работ'
+        trace = traffic.Trace.load(str(path))
+        (events,) = trace.answers.values()
+        item = events[0][2][0]
+        assert item['homework_name'].startswith('hw-')
+        assert item['reviewer_comment'] == 'x' * len('Секретный отзыв')
+        assert [event[0] for event in events] == [0, 10, 10, 20, 30]
+        assert events[2][2] == [], 'Повтор восстанавливается при чтении'
+        assert events[4][1] == 'ApiServerError'
+        assert trace.sends == [30] and trace.duration == 30
+
+    def test_pseudonyms_need_the_key(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(traffic, 'PSEUDONYM_KEY', b'secret-key')
+        path = tmp_path / 'trace.jsonl'
+        record_trace(path)
+        text = path.read_text(encoding='utf-8')
+        assert 'secret-key' not in text, 'Ключ не пишется в трассу'
+        assert traffic.anonymize(555) in text
+        assert traffic.anonymize(555, b'other-key') not in text, (
+            'Без ключа псевдоним чата не подобрать перебором номеров'
+        )
+        assert traffic.anonymize(555) == traffic.anonymize('555'), (
+            'С одним ключом псевдоним стабилен'
+        )
+
+    def test_wrappers_record_stages(self, tmp_path):
+        path = str(tmp_path / 'trace.jsonl')
+        recorder = traffic.Recorder(path)
+
+        def fetch(subscription, current_timestamp):
+            raise exceptions.ApiNoAnswerError('Нет ответа')
+
+        async def send(session, bot_token, chat_id, message):
+            pass
+
+        with pytest.raises(exceptions.ApiNoAnswerError):
+            recorder.fetch(fetch)(Subscription('t', 1), 5)
+        asyncio.run(recorder.async_send(send)(None, 'bot', 1, 'текст'))
+        recorder.close()
+        records = traffic.Trace.read(path)
+        assert [record[0] for record in records] == ['e', 's']
+        assert records[0][4] == 'ApiNoAnswerError' and records[1][3] == 5
+        assert traffic.worker_trace('state/trace.gz', 2) == (
+            'state/worker-2-trace.gz')
+
+
+class TestReplay:
+
+    def test_replay_drives_engine(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        monkeypatch.setattr(engine, 'TELEGRAM_API', engine.TELEGRAM_API)
+        path = tmp_path / 'trace.jsonl'
+        record_trace(path)
+        args = bench.parse_args([
+            '-n', '2', '--duration', '0.6', '--interval', '0.02',
+            '--replay', str(path), '--speed', '100'])
+
+        async def run():
+            replay = stand.make_stand(stand.stand_options(args))
+            runner, url = await stand.start(replay)
+            try:
+                return await bench.drive(args, url)
+            finally:
+                await runner.cleanup()
+
+        result = asyncio.run(run())
+        counters = result['counters']
+        assert counters['changes'] == 4, (
+            'Обе подписки проходят обе смены статуса из трассы'
+        )
+        assert counters['notifications'] == 4
+        assert result['latency_count'] > 0
+        assert counters['api_500'] >= 1, 'Ошибка трассы отдается кодом'
+        assert counters['recorded_sends'] == 1
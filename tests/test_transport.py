@@ -0,0 +1,115 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import exceptions
+import homework
+import metrics
+import transport
+from cache import ResponseCache
+
+BODY = b'{"homeworks": [], "current_date": 1}'
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = []
+    clients = set()
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        status = self.statuses.pop(0)
+        body = b'' if status == 304 else BODY
+        self.send_response(status)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        homework, 'ENDPOINT', f'http://127.0.0.1:{server.server_port}/')
+    monkeypatch.setattr(homework, 'RESPONSE_CACHE', ResponseCache())
+    ApiHandler.clients.clear()
+    transport.open_session()
+    yield ApiHandler
+    transport.close_session()
+    server.shutdown()
+    server.server_close()
+
+
+class TestTransport:
+
+    def test_get_sets_timeout_and_uses_session(self, monkeypatch):
+        calls = []
+
+        def fake_get(**kwargs):
+            calls.append(('requests', kwargs))
+
+        monkeypatch.setattr(requests, 'get', fake_get)
+        transport.get(url='http://example.test')
+        assert calls[0][1]['timeout'] == (
+            transport.CONNECT_TIMEOUT, transport.READ_TIMEOUT)
+
+        session = transport.open_session()
+        try:
+            assert transport.open_session() is session, (
+                'Сессия должна переиспользоваться между опросами'
+            )
+            monkeypatch.setattr(
+                session, 'get',
+                lambda **kwargs: calls.append(('session', kwargs)))
+            transport.get(url='http://example.test', timeout=1)
+            assert calls[1] == (
+                'session', {'url': 'http://example.test', 'timeout': 1})
+        finally:
+            transport.close_session()
+        assert transport.SESSION is None
+
+    def test_pool_stats(self):
+        transport.open_session()
+        try:
+            adapter = transport.SESSION.get_adapter('https://example.test')
+            adapter.poolmanager.connection_from_url('https://example.test')
+            bot = transport.telegram_bot('1234:abcdefg')
+            stats = transport.pool_stats(bot)
+            transport.export_pool_stats(bot)
+            rendered = metrics.REGISTRY.render()
+        finally:
+            transport.POOL_STATS.set_collector(None)
+            transport.close_session()
+        assert stats == {
+            'https://example.test': {
+                'connections': 0, 'requests': 0, 'idle': transport.POOL_SIZE}
+        }
+        assert (
+            'bot_http_pool{field="idle",pool="https://example.test"} '
+            f'{transport.POOL_SIZE}') in rendered, (
+            'Статистика пулов выгружается метрикой'
+        )
+
+    def test_connection_reused_after_304_and_errors(self, api):
+        api.statuses[:] = [200] + [304] * 3 + [500] * 3
+        assert homework.request_api_answer(1, cache_key='a')['homeworks'] == []
+        homework.RESPONSE_CACHE.confirm('a')
+        for _ in range(3):
+            assert homework.request_api_answer(1, cache_key='a') == {
+                'homeworks': []}
+        for _ in range(3):
+            with pytest.raises(exceptions.ApiServerError):
+                homework.request_api_answer(1, cache_key='a')
+        stats = list(transport.pool_stats().values())
+        assert len(api.clients) == 1 and stats[0]['connections'] == 1, (
+            'Ответы 304 и ошибки должны возвращать соединение в пул'
+        )
+        assert stats[0]['idle'] == transport.POOL_SIZE
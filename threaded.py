@@ -0,0 +1,408 @@
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import exceptions
+import homework
+import logs
+import metrics
+import sharding
+import traffic
+import transport
+from alerts import Alerts
+from clock import SYSTEM_CLOCK
+from health import HEALTH
+from history import HISTORY
+from outbox import coalesce
+from ratelimit import (
+    TELEGRAM_CHAT_RATE, TELEGRAM_RATE, Backoff, KeyedLimiter, TokenBucket
+)
+from scheduler import IntervalPolicy, PollScheduler
+from singleflight import COALESCED, TokenGroups, TokenRequest
+from state import MemoryState, load_state
+
+POLL_THREADS = int(os.getenv('POLL_THREADS', 8))
+RELOAD_INTERVAL = int(os.getenv('RELOAD_INTERVAL', 30))
+
+
+@metrics.timed('get_api_answer')
+def fetch_answer(subscription, current_timestamp):
+    """Запрос к API для одной подписки."""
+    return homework.request_api_answer(
+        current_timestamp, subscription.headers, subscription.key)
+
+
+@metrics.timed('send_message')
+def send_telegram(bot, chat_id, message):
+    """Отправка сообщения в чат через бота python-telegram-bot."""
+    homework.send_to_chat(bot, chat_id, message)
+
+
+class ThreadedPoller:
+    """Опрос множества подписок на синхронном стеке в пуле потоков.
+
+    В потоках пула идет только ввод-вывод: запрос к API с проверкой и
+    разбором ответа и отправка в Telegram. Состояние, расписание и
+    исходящие меняет только главный поток, когда задача завершилась,
+    поэтому хранилищу состояния не нужны блокировки. Одновременно идет
+    не больше workers задач, у подписки — не больше одного опроса, и
+    следующий опрос планируется только после фиксации предыдущего. У чата
+    не больше одной отправки, поэтому сообщения уходят в порядке
+    постановки в очередь. Подписки с общим токеном и одинаковой
+    отметкой, подошедшие к опросу, пока идет запрос, получают его ответ.
+    """
+
+    def __init__(self, bot, state=None, workers=POLL_THREADS,
+                 fetch=fetch_answer, send=send_telegram, policy=None,
+                 scheduler=None, reload_interval=RELOAD_INTERVAL,
+                 health=None, clock=SYSTEM_CLOCK):
+        """Бот, хранилище состояния, размер пула и стадии ввода-вывода."""
+        self.bot = bot
+        self.clock = clock
+        self.state = state if state is not None else MemoryState()
+        self.workers = workers
+        self.send_slots = max(1, workers // 2)
+        self.fetch = fetch
+        self.send = send
+        self.policy = (
+            policy if policy is not None
+            else IntervalPolicy(default=homework.RETRY_TIME))
+        self.scheduler = (
+            scheduler if scheduler is not None
+            else PollScheduler(clock=clock.monotonic))
+        self.reload_interval = reload_interval
+        self.backoff = Backoff()
+        self.send_backoff = Backoff(base=1, maximum=300)
+        self.limiter = TokenBucket(TELEGRAM_RATE)
+        self.chat_limiter = KeyedLimiter(TELEGRAM_CHAT_RATE, capacity=3)
+        self.limit_lock = threading.Lock()
+        self.subscriptions = {}
+        self.failures = {}
+        self.futures = {}
+        self.polling = {}
+        self.tokens = TokenGroups()
+        self.flights = {}
+        self.sending = set()
+        self.retry_at = {}
+        self.send_attempts = {}
+        self.stopped = threading.Event()
+        self.health = health if health is not None else HEALTH
+        self.alerts = Alerts(self.state, clock=clock.monotonic)
+        self.register_metrics()
+
+    def register_metrics(self):
+        """Размеры очередей вычисляются при выгрузке метрик."""
+        depth = metrics.QUEUE_DEPTH
+        depth.set_function(lambda: len(self.scheduler), queue='scheduled')
+        depth.set_function(lambda: len(self.polling), queue='polling')
+        depth.set_function(lambda: len(self.flights), queue='flights')
+        depth.set_function(lambda: len(self.sending), queue='outbox_chats')
+        depth.set_function(
+            lambda: len(self.state.outbox), queue='outbox_messages')
+
+    def start(self, subscription):
+        """Ставим подписку в расписание с сохраненной отметки."""
+        if subscription.cursor is None:
+            subscription.cursor = (
+                self.state.cursors.get(subscription.uid)
+                or int(self.clock.time()))
+        self.subscriptions[subscription.key] = subscription
+        self.tokens.add(subscription)
+        self.scheduler.schedule(subscription.key, 0)
+
+    def stop(self, subscription):
+        """Снимаем подписку; ответ ее текущего опроса будет отброшен."""
+        key = subscription.key
+        self.subscriptions.pop(key, None)
+        self.tokens.discard(subscription)
+        self.failures.pop(key, None)
+        self.scheduler.remove(key)
+        self.alerts.forget(subscription)
+        self.state.forget(subscription.uid)
+        self.health.forget(subscription.uid)
+        homework.RESPONSE_CACHE.forget(key)
+
+    def poll(self, subscription, cursor):
+        """Запрос, проверка и разбор ответа; выполняется в потоке пула."""
+        response = self.fetch(subscription, cursor)
+        homeworks = homework.check_response(response)
+        return response, homework.parse_homeworks(homeworks)
+
+    def notify(self, chat_id, message):
+        """Ставим в очередь сообщение о сбое или восстановлении опроса."""
+        if message:
+            self.state.enqueue(chat_id, message)
+
+    def notify_error(self, subscription, error):
+        """Сообщаем об ошибке, если о ней еще не сообщали."""
+        logging.error(error)
+        self.notify(
+            subscription.chat_id, self.alerts.failure(subscription, error))
+
+    def report_failure(self, subscription, error):
+        """Сообщение о неудачном опросе; его сбой не останавливает опрос.
+
+        Вызывается вне обработчика ошибки опроса, поэтому исключение
+        при постановке сообщения не вылетает из главного цикла.
+        """
+        try:
+            self.notify_error(subscription, error)
+        except Exception:
+            logging.exception(
+                'Не удалось сообщить о сбое опроса %r', subscription)
+
+    def commit(self, subscription, response, records):
+        """Фиксируем успешный ответ подписки."""
+        uid = subscription.uid
+        homework.commit_changes(
+            self.state, uid, subscription.chat_id, records,
+            response.get('current_date'))
+        subscription.cursor = homework.next_cursor(
+            response, subscription.cursor)
+        self.state.set_cursor(uid, subscription.cursor)
+        self.notify(subscription.chat_id, self.alerts.recovered(subscription))
+        homework.RESPONSE_CACHE.confirm(subscription.key)
+
+    def next_delay(self, key, uid, error):
+        """Пауза до следующего опроса: по статусам или с отступом."""
+        if error is None:
+            self.failures.pop(key, None)
+            return self.policy.interval(self.state.index.active_statuses(uid))
+        attempt = self.failures.get(key, 0) + 1
+        self.failures[key] = attempt
+        return self.backoff.delay(
+            attempt, getattr(error, 'retry_after', None))
+
+    def finish_poll(self, subscription, future):
+        """Результат опроса: фиксируем и планируем следующий опрос."""
+        key = subscription.key
+        self.polling.pop(key, None)
+        if self.subscriptions.get(key) is not subscription:
+            self.health.poll_finished(subscription.uid, False)
+            if key in self.subscriptions:
+                self.scheduler.schedule(key, 0)
+            return
+        error = None
+        try:
+            self.commit(subscription, *future.result())
+        except homework.POLL_ERRORS as poll_error:
+            error = poll_error
+        except Exception as unexpected:
+            error = unexpected
+            logging.exception('Сбой опроса подписки %r', subscription)
+        if isinstance(error, homework.POLL_ERRORS):
+            self.report_failure(subscription, error)
+        self.health.poll_finished(subscription.uid, error is None)
+        self.scheduler.schedule(
+            key, self.next_delay(key, subscription.uid, error))
+
+    def throttle(self, chat):
+        """Ждем лимитов Telegram: общего и чата."""
+        with self.limit_lock:
+            bucket = self.chat_limiter.bucket(chat)
+        bucket.wait()
+        with self.limit_lock:
+            self.limiter.wait()
+
+    def deliver(self, chat_id, batches):
+        """Отправляем части по порядку; выполняется в потоке пула.
+
+        Возвращает номера доставленных сообщений и ошибку, на которой
+        отправка остановилась, или None.
+        """
+        delivered = []
+        for entry_ids, message in batches:
+            self.throttle(str(chat_id))
+            try:
+                self.send(self.bot, chat_id, message)
+            except exceptions.SendMessageError as error:
+                return delivered, error
+            delivered.extend(entry_ids)
+        return delivered, None
+
+    def finish_send(self, chat, future):
+        """Подтверждаем доставленное; при ошибке откладываем чат."""
+        self.sending.discard(chat)
+        delivered, error = future.result()
+        for entry_id in delivered:
+            self.state.ack(entry_id)
+        if error is None:
+            self.send_attempts.pop(chat, None)
+            return
+        logging.error(error.txt)
+        attempt = self.send_attempts.get(chat, 0) + 1
+        self.send_attempts[chat] = attempt
+        self.retry_at[chat] = (
+            self.clock.monotonic() + self.send_backoff.delay(
+                attempt, getattr(error, 'retry_after', None)))
+
+    def submit(self, function, handler, *args):
+        """Отдаем задачу пулу; handler обработает ее в главном потоке."""
+        future = self.executor.submit(function, *args)
+        self.futures[future] = [handler]
+        return future
+
+    def land(self, flight, future):
+        """Общий запрос завершился: следующий опрос запустит новый."""
+        self.flights.pop(flight, None)
+
+    def submit_poll(self, subscription):
+        """Отдаем опрос пулу или присоединяем его к идущему запросу."""
+        handler = functools.partial(self.finish_poll, subscription)
+        cursor = subscription.cursor
+        if not self.tokens.shared(subscription):
+            return self.submit(self.poll, handler, subscription, cursor)
+        flight = subscription.token, cursor
+        future = self.flights.get(flight)
+        if future is None:
+            future = self.submit(
+                self.poll, functools.partial(self.land, flight),
+                TokenRequest(subscription.token), cursor)
+            self.flights[flight] = future
+        else:
+            COALESCED.inc()
+        self.futures[future].append(handler)
+        return future
+
+    def submit_sends(self):
+        """Отправка для чатов с недоставленными сообщениями."""
+        now = self.clock.monotonic()
+        for chat in self.state.pending_chats():
+            if len(self.sending) >= self.send_slots:
+                return
+            if chat in self.sending or self.retry_at.get(chat, 0) > now:
+                continue
+            self.retry_at.pop(chat, None)
+            pending = self.state.pending(chat)
+            batches = coalesce(
+                (entry_id, message) for entry_id, _, message in pending)
+            self.sending.add(chat)
+            self.submit(
+                self.deliver, functools.partial(self.finish_send, chat),
+                pending[0][1], batches)
+
+    def free_slots(self):
+        """Сколько потоков пула не заняты опросами и отправками."""
+        return self.workers - len(self.futures)
+
+    def dispatch(self):
+        """Опросы, время которых наступило, в пределах свободных потоков."""
+        free = self.free_slots()
+        if free <= 0:
+            return
+        lags = []
+        for key in self.scheduler.pop_due(lags, limit=free):
+            if key in self.polling:
+                continue
+            subscription = self.subscriptions[key]
+            self.health.poll_started(subscription.uid)
+            self.polling[key] = self.submit_poll(subscription)
+        for lag in lags:
+            metrics.POLL_LAG.observe(lag)
+
+    def timeout(self, reload_at):
+        """Сколько ждать до следующего дела главного потока."""
+        now = self.clock.monotonic()
+        timeout = reload_at - now
+        wait_time = self.scheduler.wait_time()
+        if wait_time is not None and self.free_slots() > 0:
+            timeout = min(timeout, wait_time)
+        retries = [when for when in self.retry_at.values() if when > now]
+        if retries:
+            timeout = min(timeout, min(retries) - now)
+        return max(timeout, 0)
+
+    def wait(self, timeout):
+        """Ждем завершения задач и обрабатываем их результаты."""
+        if not self.futures:
+            self.stopped.wait(timeout)
+            return
+        done, _ = wait(
+            list(self.futures), timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            for handler in self.futures.pop(future):
+                handler(future)
+
+    def reload(self, registry):
+        """Сбрасываем состояние на диск и применяем изменения реестра."""
+        self.state.flush()
+        HISTORY.flush()
+        metrics.dump()
+        added, removed = registry.reload()
+        for subscription in removed:
+            self.stop(subscription)
+        for subscription in added:
+            self.start(subscription)
+
+    def stop_polling(self):
+        """Просим главный цикл завершиться."""
+        self.stopped.set()
+
+    def run(self, registry):
+        """Опрашиваем подписки реестра до вызова stop_polling().
+
+        При остановке дожидаемся начатых задач и фиксируем их
+        результаты, чтобы отправленные сообщения не ушли повторно.
+        """
+        for subscription in registry:
+            self.start(subscription)
+        self.executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix='poll')
+        reload_at = self.clock.monotonic() + self.reload_interval
+        self.health.set_ready()
+        try:
+            while not self.stopped.is_set():
+                self.submit_sends()
+                self.dispatch()
+                timeout = self.timeout(reload_at)
+                self.health.beat(timeout)
+                self.wait(timeout)
+                now = self.clock.monotonic()
+                if now >= reload_at:
+                    reload_at = now + self.reload_interval
+                    self.reload(registry)
+        finally:
+            self.health.set_ready(False)
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            for future, handlers in list(self.futures.items()):
+                if future.cancelled():
+                    continue
+                for handler in handlers:
+                    handler(future)
+            self.futures.clear()
+            self.state.flush()
+
+
+def main():
+    """Многопоточный режим работы бота на синхронном стеке."""
+    logs.setup_logging()
+    registry = homework.load_subscriptions()
+    if sharding.SHARD_DB:
+        registry = sharding.shard(registry)
+    if metrics.METRICS_PORT:
+        metrics.serve()
+    transport.open_session(POLL_THREADS)
+    bot = transport.LazyBot(homework.TELEGRAM_TOKEN, POLL_THREADS)
+    transport.export_pool_stats(bot)
+    state = load_state()
+    stages = {}
+    recorder = None
+    if traffic.TRAFFIC_CAPTURE:
+        recorder = traffic.Recorder()
+        stages['fetch'] = recorder.fetch(fetch_answer)
+        stages['send'] = recorder.send(send_telegram)
+    try:
+        ThreadedPoller(bot, state, **stages).run(registry)
+    finally:
+        state.close()
+        HISTORY.close()
+        registry.close()
+        transport.close_session()
+        if recorder is not None:
+            recorder.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import functools
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+TRAFFIC_CAPTURE = os.getenv('TRAFFIC_CAPTURE', '')
+TRAFFIC_KEY = os.getenv('TRAFFIC_KEY', '')
+
+PSEUDONYM_KEY = TRAFFIC_KEY.encode() or secrets.token_bytes(32)
+
+KEPT_FIELDS = ('id', 'status', 'date_updated')
+PADDED_FIELDS = ('reviewer_comment', 'lesson_name')
+
+
+def anonymize(value, key=None):
+    """Короткий псевдоним токена, чата или названия работы.
+
+    Псевдоним — HMAC с секретным ключом, который в трассу не пишется:
+    без ключа короткие номера чатов и имена студентов в названиях работ
+    не восстановить перебором. Ключ берется из TRAFFIC_KEY, иначе
+    создается случайный на время работы процесса.
+    """
+    return hmac.new(
+        PSEUDONYM_KEY if key is None else key, str(value).encode(),
+        hashlib.blake2b).hexdigest()[:12]
+
+
+def sanitize(homework):
+    """Работа без личных данных, но того же размера.
+
+    Название заменяется псевдонимом, тексты — строками той же длины,
+    остальные поля кроме номера, статуса и даты отбрасываются.
+    """
+    if not isinstance(homework, dict):
+        return homework
+    clean = {key: homework[key] for key in KEPT_FIELDS if key in homework}
+    if 'homework_name' in homework:
+        clean['homework_name'] = f'hw-{anonymize(homework["homework_name"])}'
+    for key in PADDED_FIELDS:
+        if isinstance(homework.get(key), str):
+            clean[key] = 'x' * len(homework[key])
+    return clean
+
+
+def worker_trace(path, number):
+    """Своя трасса для воркера пула: процессы не пишут в один файл."""
+    if not path:
+        return path
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'worker-{number}-{name}')
+
+
+def open_trace(path, mode):
+    """Файл трассы; со сжатием gzip, если имя кончается на .gz."""
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Recorder:
+    """Запись трафика бота в компактный файл только для дописывания.
+
+    Каждая строка — JSON-список: ответ API ["a", время, аккаунт,
+    from_date, current_date, работы], ошибка запроса ["e", время,
+    аккаунт, from_date, класс ошибки] и отправка ["s", время, чат,
+    длина]. Работы пишутся только если отличаются от прошлого ответа
+    аккаунта, иначе null. Токены и чаты заменены псевдонимами, работы
+    очищены sanitize(), тексты сообщений не сохраняются. Писать можно
+    из нескольких потоков.
+    """
+
+    def __init__(self, path=TRAFFIC_CAPTURE, clock=time.time):
+        """Путь к трассе и часы."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.clock = clock
+        self.file = open_trace(path, 'a')
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def put(self, record):
+        """Строка трассы; вызывается под блокировкой."""
+        self.file.write(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self.file.write('\n')
+
+    def write(self, record):
+        """Дописываем запись в трассу."""
+        with self.lock:
+            self.put(record)
+
+    def write_answer(self, account, cursor, current_date, homeworks):
+        """Ответ аккаунта; работы опускаются, если не изменились.
+
+        Сравнение и запись идут под одной блокировкой, поэтому порядок
+        строк в файле совпадает с порядком сравнений.
+        """
+        with self.lock:
+            same = self.last.get(account) == homeworks
+            self.last[account] = homeworks
+            self.put([
+                'a', round(self.clock(), 3), account, cursor, current_date,
+                None if same else homeworks])
+
+    def answer(self, subscription, cursor, response):
+        """Ответ API для подписки."""
+        homeworks = response.get('homeworks')
+        if isinstance(homeworks, list):
+            homeworks = [sanitize(item) for item in homeworks]
+        self.write_answer(
+            anonymize(subscription.token), cursor,
+            response.get('current_date'), homeworks)
+
+    def failure(self, subscription, cursor, error):
+        """Ошибка запроса к API для подписки."""
+        self.write([
+            'e', round(self.clock(), 3), anonymize(subscription.token),
+            cursor, type(error).__name__])
+
+    def sent(self, chat_id, message):
+        """Отправка сообщения в чат."""
+        self.write([
+            's', round(self.clock(), 3), anonymize(chat_id), len(message)])
+
+    def fetch(self, fetch):
+        """Обертка синхронной стадии запроса к API с записью трафика."""
+        @functools.wraps(fetch)
+        def recorded(subscription, current_timestamp):
+            try:
+                response = fetch(subscription, current_timestamp)
+            except Exception as error:
+                self.failure(subscription, current_timestamp, error)
+                raise
+            self.answer(subscription, current_timestamp, response)
+            return response
+        return recorded
+
+    def async_fetch(self, fetch):
+        """Обертка асинхронной стадии запроса к API с записью трафика."""
+        @functools.wraps(fetch)
+        async def recorded(session, subscription, current_timestamp):
+            try:
+                response = await fetch(
+                    session, subscription, current_timestamp)
+            except Exception as error:
+                self.failure(subscription, current_timestamp, error)
+                raise
+            self.answer(subscription, current_timestamp, response)
+            return response
+        return recorded
+
+    def send(self, send):
+        """Обертка синхронной стадии отправки с записью трафика."""
+        @functools.wraps(send)
+        def recorded(bot, chat_id, message):
+            send(bot, chat_id, message)
+            self.sent(chat_id, message)
+        return recorded
+
+    def async_send(self, send):
+        """Обертка асинхронной стадии отправки с записью трафика."""
+        @functools.wraps(send)
+        async def recorded(session, bot_token, chat_id, message):
+            await send(session, bot_token, chat_id, message)
+            self.sent(chat_id, message)
+        return recorded
+
+    def close(self):
+        """Закрываем трассу."""
+        with self.lock:
+            self.file.close()
+        logging.info('Трафик записан в %s', self.path)
+
+
+class Trace:
+    """Трасса в памяти: события аккаунтов и отправки по времени от начала.
+
+    Ответ аккаунта — (время, None, работы), ошибка — (время, класс
+    ошибки, None); пропущенные повторы работ восстанавливаются.
+    """
+
+    def __init__(self, answers, sends, duration):
+        """События по аккаунтам, времена отправок и длительность."""
+        self.answers = answers
+        self.sends = sends
+        self.duration = duration
+
+    @staticmethod
+    def read(path):
+        """Записи файла трассы; оборванные строки пропускаются."""
+        records = []
+        with open_trace(path, 'r') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logging.error(
+                        'Оборванная запись трассы %s пропущена', path)
+        return records
+
+    @classmethod
+    def load(cls, *paths):
+        """Читаем трассы, например всех воркеров, в порядке записи."""
+        records = []
+        for path in paths:
+            records.extend(cls.read(path))
+        if not records:
+            return cls({}, [], 0)
+        started = min(record[1] for record in records)
+        answers, sends, last = {}, [], {}
+        for kind, moment, *fields in records:
+            offset = moment - started
+            if kind == 's':
+                sends.append(offset)
+                continue
+            account = fields[0]
+            events = answers.setdefault(account, [])
+            if kind == 'e':
+                events.append((offset, fields[2], None))
+                continue
+            homeworks = fields[3]
+            if homeworks is None:
+                homeworks = last.get(account, [])
+            last[account] = homeworks
+            events.append((offset, None, homeworks))
+        for events in answers.values():
+            events.sort(key=lambda event: event[0])
+        sends.sort()
+        finished = max(record[1] for record in records)
+        return cls(answers, sends, finished - started)
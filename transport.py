@@ -0,0 +1,170 @@
+import os
+import threading
+
+import metrics
+
+POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+ASYNC_POOL_SIZE = int(os.getenv('HTTP_ASYNC_POOL_SIZE', 100))
+POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 4))
+POOL_PER_HOST = int(os.getenv('HTTP_POOL_PER_HOST', 0))
+KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE', 60))
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 60))
+
+SESSION = None
+
+POOL_STATS = metrics.Gauge(
+    'bot_http_pool', 'Соединения и запросы пулов HTTP по хостам')
+
+
+def open_session(pool_size=POOL_SIZE):
+    """Создаем общую сессию requests с пулом соединений."""
+    global SESSION
+    if SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_HOSTS, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        SESSION = session
+    return SESSION
+
+
+def close_session():
+    """Закрываем общую сессию и ее соединения."""
+    global SESSION
+    if SESSION is not None:
+        SESSION.close()
+        SESSION = None
+
+
+def get(**kwargs):
+    """GET-запрос через общую сессию, если она открыта."""
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    if SESSION is None:
+        import requests
+
+        return requests.get(**kwargs)
+    return SESSION.get(**kwargs)
+
+
+def telegram_bot(token, pool_size=POOL_SIZE, base_url=None):
+    """Бот Telegram с собственным пулом соединений."""
+    from telegram import Bot
+    from telegram.utils.request import Request
+
+    request = Request(
+        con_pool_size=pool_size,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT
+    )
+    return Bot(token=token, base_url=base_url, request=request)
+
+
+class LazyBot:
+    """Бот Telegram, который создается при первой отправке.
+
+    python-telegram-bot импортируется только тогда, когда боту есть что
+    отправить, и не замедляет запуск и первый опрос.
+    """
+
+    def __init__(self, token, pool_size=POOL_SIZE, base_url=None):
+        """Параметры будущего бота."""
+        self.token = token
+        self.pool_size = pool_size
+        self.base_url = base_url
+        self.bot = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Бот, созданный при первом обращении."""
+        if self.bot is None:
+            with self.lock:
+                if self.bot is None:
+                    self.bot = telegram_bot(
+                        self.token, self.pool_size, self.base_url)
+        return self.bot
+
+    def send_message(self, chat_id, text):
+        """Отправка сообщения через настоящего бота."""
+        return self.get().send_message(chat_id, text)
+
+
+def async_session():
+    """Сессия aiohttp с ограничениями пула и keep-alive."""
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=ASYNC_POOL_SIZE,
+        limit_per_host=POOL_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=TOTAL_TIMEOUT, sock_connect=CONNECT_TIMEOUT,
+        sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def pool_manager_stats(manager):
+    """Статистика пулов urllib3: соединения и запросы по хостам."""
+    stats = {}
+    for key in list(manager.pools.keys()):
+        pool = manager.pools.get(key)
+        if pool is None:
+            continue
+        stats[f'{pool.scheme}://{pool.host}'] = {
+            'connections': pool.num_connections,
+            'requests': pool.num_requests,
+            'idle': pool.pool.qsize() if pool.pool else 0,
+        }
+    return stats
+
+
+def pool_stats(bot=None):
+    """Статистика общей сессии и пула бота Telegram."""
+    stats = {}
+    if SESSION is not None:
+        for adapter in SESSION.adapters.values():
+            stats.update(pool_manager_stats(adapter.poolmanager))
+    if isinstance(bot, LazyBot):
+        bot = bot.bot
+    if bot is not None:
+        stats.update(pool_manager_stats(bot.request._con_pool))
+    return stats
+
+
+def pool_samples(stats):
+    """Статистика пулов как пары (метки, значение) для метрик."""
+    return [
+        ({'pool': pool, 'field': field}, value)
+        for pool, fields in stats.items()
+        for field, value in fields.items()
+    ]
+
+
+def export_pool_stats(bot=None):
+    """Статистика пулов считается только при выгрузке метрик."""
+    POOL_STATS.set_collector(lambda: pool_samples(pool_stats(bot)))
+
+
+def export_async_pool_stats(session):
+    """Статистика пула aiohttp считается только при выгрузке метрик."""
+    POOL_STATS.set_collector(
+        lambda: pool_samples({'async': async_pool_stats(session)}))
+
+
+def async_pool_stats(session):
+    """Статистика пула aiohttp: занятые и простаивающие соединения."""
+    connector = session.connector
+    if connector is None or connector.closed:
+        return {}
+    return {
+        'limit': connector.limit,
+        'limit_per_host': connector.limit_per_host,
+        'acquired': len(connector._acquired),
+        'idle': sum(len(conns) for conns in connector._conns.values()),
+    }